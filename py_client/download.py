@@ -0,0 +1,20 @@
+import sys
+from getpass import getpass
+
+from imageocean_client import ImageOceanClient
+
+pks = sys.argv[1:]
+directory = 'downloads'
+username = input("What is your username?\n")
+
+with ImageOceanClient(username=username) as client:
+    if not client.has_cached_credentials(session=True):
+        client.password = getpass("What is your password?\n")
+    if not pks:
+        pks = [image['id'] for image in client.list_images()]
+    for image in client.map(client.image_details, pks):
+        paths = client.download_thumbnails(image, f"{directory}/{image['id']}")
+        print(f"Thumbnails of image {image['id']}: {paths}")
+    links = client.map(client.fetch_binary_link, pks)
+    paths = client.download_many((link, f'{directory}/{pk}/binary_{link.rsplit("/", 1)[-1]}') for pk, link in zip(pks, links))
+    print(f'Binary images: {paths}')
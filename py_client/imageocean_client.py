@@ -0,0 +1,358 @@
+"""
+Python client library for the ImageOcean API.
+
+A single ImageOceanClient keeps one pooled HTTP session for all calls, caches the API token on disk so
+scripts do not authenticate on every run, retries requests rejected with 429 or 503 with exponential
+backoff and transfers many images in parallel with a bounded number of workers.
+
+sample usage:
+    from imageocean_client import ImageOceanClient
+
+    with ImageOceanClient(username='admin', password='secret') as client:
+        images = client.upload_many(['a.jpg', 'b.png'])
+        client.download_thumbnails(images[0], 'thumbnails/')
+"""
+import ast
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_BASE_URL = 'http://127.0.0.1:8000'
+DEFAULT_TOKEN_CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'imageocean', 'tokens.json')
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+RETRY_STATUSES = (429, 503)
+UPLOAD_STATUS_MAX_WAIT = 5
+
+
+class ImageOceanError(Exception):
+    """Raised when the API answers with an error status"""
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        super().__init__(f'{response.request.method} {response.url} failed with HTTP {response.status_code}: {response.text[:200]}')
+
+
+class TokenCache:
+    """API tokens and session cookies stored in a JSON file readable by the owner only, keyed by server and username"""
+
+    def __init__(self, path=DEFAULT_TOKEN_CACHE):
+        self.path = path
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        descriptor, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(descriptor, 'w') as cache_file:
+            json.dump(entries, cache_file)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        return self._read().get(key, {})
+
+    def update(self, key, **values):
+        entries = self._read()
+        entries.setdefault(key, {}).update(values)
+        self._write(entries)
+
+    def delete(self, key):
+        entries = self._read()
+        if entries.pop(key, None) is not None:
+            self._write(entries)
+
+
+class ImageOceanClient:
+    """
+    Client of a single ImageOcean server and account.
+
+    Args:
+    - base_url: Scheme and host of the server.
+    - username, password: Account credentials, the password is only needed when the token cache has no entry.
+    - token_cache: Path of the token cache file, None disables caching.
+    - max_workers: Upper limit of parallel transfers and of the connections kept open to the server.
+    - retries: Number of retries of a request answered with 429 or 503 or failing to connect.
+    - backoff_factor: Retries wait backoff_factor * 2 ** (retry - 1) seconds unless the server sends Retry-After.
+    - timeout: Seconds to wait for the server to connect and to send data.
+    """
+
+    def __init__(self, base_url=DEFAULT_BASE_URL, username=None, password=None, token_cache=DEFAULT_TOKEN_CACHE,
+                 max_workers=8, retries=5, backoff_factor=0.5, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.token_cache = TokenCache(token_cache)
+        self.cache_key = f'{self.base_url} {username}'
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        # uploads are not idempotent, so only refused connections and rejected requests are retried
+        retry = Retry(
+            total=retries,
+            read=0,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,
+            backoff_factor=backoff_factor,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.token = None
+        self.logged_in = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def url(self, path):
+        return urljoin(f'{self.base_url}/', path.lstrip('/'))
+
+    def authenticate(self, force=False):
+        """Set the API token, taken from the token cache unless it is missing or force is set"""
+        cached = {} if force else self.token_cache.get(self.cache_key)
+        token = cached.get('token')
+        if token is None:
+            response = self.session.post(
+                self.url('/api/auth/'),
+                json={'username': self.username, 'password': self.password},
+                timeout=self.timeout,
+            )
+            if response.status_code != 200:
+                raise ImageOceanError(response)
+            token = response.json()['token']
+            self.token_cache.update(self.cache_key, token=token)
+        self.token = token
+        self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def has_cached_credentials(self, session=False):
+        """Whether the token cache holds the API token, and with session set the session cookie, of the account"""
+        cached = self.token_cache.get(self.cache_key)
+        return 'token' in cached and (not session or 'sessionid' in cached)
+
+    def login(self, force=False):
+        """
+        Log in a browser session, the thumbnail and binary image views accept sessions only.
+        The session cookie is kept in the token cache next to the API token.
+        """
+        cached = {} if force else self.token_cache.get(self.cache_key)
+        if cached.get('sessionid'):
+            self.session.cookies.set('sessionid', cached['sessionid'], domain=urlparse(self.base_url).hostname)
+            self.session.cookies.set('csrftoken', cached['csrftoken'], domain=urlparse(self.base_url).hostname)
+        else:
+            self.session.cookies.clear()
+            login_url = self.url('/accounts/login/')
+            self.session.get(login_url, timeout=self.timeout)
+            response = self.session.post(
+                login_url,
+                data={
+                    'username': self.username,
+                    'password': self.password,
+                    'csrfmiddlewaretoken': self.session.cookies.get('csrftoken'),
+                },
+                headers={'Referer': login_url},
+                allow_redirects=False,
+                timeout=self.timeout,
+            )
+            if 'sessionid' not in self.session.cookies:
+                raise ImageOceanError(response)
+            self.token_cache.update(
+                self.cache_key,
+                sessionid=self.session.cookies.get('sessionid'),
+                csrftoken=self.session.cookies.get('csrftoken'),
+            )
+        # with a session cookie present the API checks CSRF on unsafe requests as well
+        self.session.headers['X-CSRFToken'] = self.session.cookies.get('csrftoken')
+        self.logged_in = True
+
+    def request(self, method, path, **kwargs):
+        """Send an API request, authenticating again once when a cached token was revoked"""
+        if self.token is None:
+            self.authenticate()
+        kwargs.setdefault('timeout', self.timeout)
+        response = self.session.request(method, self.url(path), **kwargs)
+        if response.status_code == 401:
+            self.token_cache.delete(self.cache_key)
+            self.authenticate(force=True)
+            for file_value in kwargs.get('files', {}).values():
+                file_value.seek(0)
+            response = self.session.request(method, self.url(path), **kwargs)
+        if response.status_code >= 400:
+            raise ImageOceanError(response)
+        return response
+
+    def list_images(self):
+        return self.request('GET', '/api/images/').json()
+
+    def image_details(self, pk):
+        return self.request('GET', f'/api/images/{pk}/').json()
+
+    def upload(self, path):
+        """Upload an image file and return the created image"""
+        with open(path, 'rb') as image_file:
+            return self.request('POST', '/api/images/', files={'image_url': image_file}).json()
+
+    def upload_async(self, path):
+        """Upload an image file to be processed in the background, returns its id, status and status URL"""
+        with open(path, 'rb') as image_file:
+            return self.request('POST', '/api/images/', params={'async': 'true'}, files={'image_url': image_file}).json()
+
+    def wait_for_upload(self, pk, timeout=60):
+        """Long-poll the processing status of an image until it is ready or failed, or timeout seconds pass"""
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = max(0, min(UPLOAD_STATUS_MAX_WAIT, int(deadline - time.monotonic())))
+            upload_status = self.request(
+                'GET', f'/api/images/{pk}/status/', params={'wait': wait}, timeout=self.timeout + wait
+            ).json()
+            if upload_status['status'] != 'processing' or time.monotonic() >= deadline:
+                return upload_status
+
+    def delete(self, pk):
+        self.request('DELETE', f'/api/images/{pk}/')
+
+    def delete_many(self, pks):
+        """Delete images in a single request, returns the number of deleted images"""
+        return self.request('POST', '/api/images/bulk_delete/', json={'ids': list(pks)}).json()['deleted']
+
+    def warm_up(self, pk):
+        return self.request('POST', f'/api/images/{pk}/warm_up/').json()
+
+    def fetch_binary_link(self, pk, expiration_seconds=300, method=None):
+        params = {'expiration_seconds': expiration_seconds}
+        if method is not None:
+            params['method'] = method
+        return self.request('GET', f'/api/images/{pk}/binary/', params=params).json()['url']
+
+    def binary_renditions(self, method='grayscale', expiration_seconds=3600, poll_interval=5, timeout=3600):
+        """Render binary versions of all images of the account and return the manifest of links once the job is done"""
+        self.request('POST', '/api/images/binary_renditions/', json={'method': method})
+        deadline = time.monotonic() + timeout
+        while True:
+            manifest = self.request(
+                'GET', '/api/images/binary_renditions/',
+                params={'method': method, 'expiration_seconds': expiration_seconds},
+            ).json()
+            if manifest['status'] != 'pending' or time.monotonic() >= deadline:
+                return manifest
+            time.sleep(poll_interval)
+
+    def download(self, url, destination):
+        """
+        Stream a thumbnail or binary image into a file without holding it in memory.
+        The file appears under its final name only once the download is complete.
+
+        Args:
+        - url: Absolute URL or path of the thumbnail or binary image.
+        - destination: Path of the file, or of a directory to store the file under its URL name.
+
+        Returns:
+        - Path of the written file.
+        """
+        if not self.logged_in:
+            self.login()
+        if destination.endswith(os.sep) or os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(urlparse(url).path))
+        response = self._get_stream(url)
+        if response.is_redirect:
+            response.close()
+            self.login(force=True)
+            response = self._get_stream(url)
+        if response.is_redirect:
+            response.close()
+            raise ImageOceanError(response)
+        return self._save_stream(response, destination)
+
+    def export(self, destination):
+        """Stream the ZIP archive of all images of the account into a file, returns its path"""
+        return self._save_stream(self.request('GET', '/api/images/export/', stream=True), destination)
+
+    def _save_stream(self, response, destination):
+        with response:
+            if response.status_code >= 400:
+                raise ImageOceanError(response)
+            os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+            tmp_path = f'{destination}.part'
+            try:
+                with open(tmp_path, 'wb') as destination_file:
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        destination_file.write(chunk)
+                os.replace(tmp_path, destination)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        return destination
+
+    def _get_stream(self, url):
+        # an expired session is answered with a redirect to the login page
+        return self.session.get(self.url(url), stream=True, allow_redirects=False, timeout=self.timeout)
+
+    def download_thumbnails(self, image, directory):
+        """Download every thumbnail of an image into a directory, returns their paths keyed by size"""
+        os.makedirs(directory, exist_ok=True)
+        urls = thumbnail_urls(image)
+        # all thumbnails of an image share the file name, so it is prefixed with the size
+        paths = self.download_many(
+            (url, os.path.join(directory, f'{size}_{os.path.basename(urlparse(url).path)}')) for size, url in urls.items()
+        )
+        return dict(zip(urls, paths))
+
+    def upload_many(self, paths):
+        """Upload image files in parallel, returns the created images in the order of the paths"""
+        return self.map(self.upload, paths)
+
+    def download_many(self, downloads):
+        """Download (url, destination) pairs in parallel, returns the written paths"""
+        if not self.logged_in:
+            self.login()
+        return self.map(lambda download: self.download(*download), downloads)
+
+    def map(self, function, items, return_exceptions=False):
+        """
+        Call a function on items with at most max_workers calls running at once.
+
+        Returns:
+        - Results in the order of the items. The first failure is raised once all calls are done,
+          with return_exceptions set failures are returned in place of their results.
+        """
+        if self.token is None:
+            self.authenticate()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(function, item) for item in items]
+        results = [future.exception() or future.result() for future in futures]
+        if not return_exceptions:
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+        return results
+
+
+def thumbnail_urls(image):
+    """Thumbnail URLs of an image returned by the API keyed by size, e.g. {'200px': 'http://...'}"""
+    urls = {}
+    for thumbnail in image['thumbnails_urls']:
+        urls.update(ast.literal_eval(thumbnail) if isinstance(thumbnail, str) else thumbnail)
+    return urls
@@ -1,23 +1,10 @@
-import requests
 from getpass import getpass
 
-auth_endpoint = "http://127.0.0.1:8000/api/auth/" 
-username = input("What is your username?\n")
-password = getpass("What is your password?\n")
-
-auth_response = requests.post(auth_endpoint, json={'username': username, 'password': password})
+from imageocean_client import ImageOceanClient
 
+username = input("What is your username?\n")
 
-if auth_response.status_code == 200:
-    token = auth_response.json()['token']
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-    endpoint = "http://127.0.0.1:8000/api/images"
-
-    get_response = requests.get(endpoint, headers=headers)
-    print(f'Get status code: {get_response.status_code}')
-    print(f'Get response: {get_response.json()}')
-else:
-    print(f'Auth status code: {auth_response.status_code}')
-    print(f'Auth response: {auth_response.json()}')
\ No newline at end of file
+with ImageOceanClient(username=username) as client:
+    if not client.has_cached_credentials():
+        client.password = getpass("What is your password?\n")
+    print(f'Images: {client.list_images()}')
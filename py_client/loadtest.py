@@ -0,0 +1,260 @@
+"""
+Concurrent load generator for ImageOcean.
+
+Runs a weighted mix of upload, list, detail, thumbnail and binary link operations against a running
+stack with a pooled asyncio HTTP client, either with a fixed concurrency or at a target request rate,
+and reports a latency histogram and an error breakdown per operation.
+
+sample run against the local docker-compose stack:
+    python py_client/loadtest.py --username admin --concurrency 20 --duration 60 --warmup 10
+    python py_client/loadtest.py --username admin --rps 50 --mix list=2,detail=2,thumbnail=10,binary=1
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from collections import Counter, defaultdict
+from getpass import getpass
+
+import httpx
+
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+DEFAULT_MIX = 'upload=1,list=5,detail=5,thumbnail=20,binary=2'
+URL_PATTERN = re.compile(r"https?://[^'\"\s]+")
+DEFAULT_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'images', 'nft2.jpg')
+
+
+class OperationStats:
+    """Latencies and errors of a single operation"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+
+    def record(self, latency, error=None):
+        if error is None:
+            self.latencies.append(latency)
+        else:
+            self.errors[error] += 1
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+
+        def percentile(fraction):
+            if not latencies:
+                return None
+            return round(latencies[max(0, int(round(fraction * len(latencies))) - 1)] * 1000, 2)
+
+        histogram = Counter()
+        for latency in latencies:
+            bucket = next((f'<={bound}ms' for bound in BUCKETS_MS if latency * 1000 <= bound), f'>{BUCKETS_MS[-1]}ms')
+            histogram[bucket] += 1
+        return {
+            'ok': len(latencies),
+            'errors': dict(self.errors),
+            'throughput_per_s': round(len(latencies) / elapsed, 2) if elapsed else None,
+            'p50_ms': percentile(0.50),
+            'p95_ms': percentile(0.95),
+            'p99_ms': percentile(0.99),
+            'max_ms': round(latencies[-1] * 1000, 2) if latencies else None,
+            'histogram': {bucket: histogram[bucket] for bucket in [f'<={bound}ms' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}ms'] if histogram[bucket]},
+        }
+
+
+class RateLimiter:
+    """Spaces operation starts evenly to reach a target rate regardless of the response times"""
+
+    def __init__(self, rps):
+        self.interval = 1 / rps
+        self.next_start = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self.lock:
+            now = time.monotonic()
+            self.next_start = max(self.next_start + self.interval, now)
+            delay = self.next_start - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class LoadTest:
+    """A load test run against a single ImageOcean stack"""
+
+    def __init__(self, client, args):
+        self.client = client
+        self.args = args
+        self.image_ids = []
+        self.thumbnail_urls = []
+        self.stats = defaultdict(OperationStats)
+        self.recording = False
+        self.operations, self.weights = parse_mix(args.mix)
+
+    async def authenticate(self):
+        """Obtain a token for the API and a session cookie for the thumbnail and binary image views"""
+        response = await self.client.post('/api/auth/', json={'username': self.args.username, 'password': self.args.password})
+        response.raise_for_status()
+        self.client.headers['Authorization'] = f"Bearer {response.json()['token']}"
+        login_page = await self.client.get('/accounts/login/')
+        csrf_token = login_page.cookies.get('csrftoken') or self.client.cookies.get('csrftoken')
+        await self.client.post(
+            '/accounts/login/',
+            data={'username': self.args.username, 'password': self.args.password, 'csrfmiddlewaretoken': csrf_token},
+            headers={'Referer': f'{self.args.base_url}/accounts/login/'},
+        )
+        if 'sessionid' not in self.client.cookies:
+            raise SystemExit('Session login failed, thumbnail and binary image views need a session')
+        # with a session cookie present the API checks CSRF on uploads as well
+        self.client.headers['X-CSRFToken'] = self.client.cookies['csrftoken']
+
+    async def discover(self):
+        """Collect the images of the account, uploading one when the account has none"""
+        response = await self.client.get('/api/images/')
+        response.raise_for_status()
+        images = response.json()
+        for image in images:
+            self.remember(image)
+        if not images:
+            await self.upload()
+
+    def remember(self, image):
+        self.image_ids.append(image['id'])
+        for thumbnail_url in image['thumbnails_urls']:
+            self.thumbnail_urls.extend(URL_PATTERN.findall(str(thumbnail_url)))
+
+    async def upload(self):
+        with open(self.args.image, 'rb') as image_file:
+            files = {'image_url': (os.path.basename(self.args.image), image_file.read())}
+        response = await self.client.post('/api/images/', files=files)
+        response.raise_for_status()
+        self.remember(response.json())
+        return response
+
+    async def list_images(self):
+        return await self.client.get('/api/images/')
+
+    async def detail(self):
+        return await self.client.get(f'/api/images/{random.choice(self.image_ids)}/')
+
+    async def thumbnail(self):
+        return await self.client.get(random.choice(self.thumbnail_urls))
+
+    async def binary(self):
+        response = await self.client.get(
+            f'/api/images/{random.choice(self.image_ids)}/binary/',
+            params={'expiration_seconds': self.args.expiration_seconds},
+        )
+        if response.status_code != 200:
+            return response
+        return await self.client.get(response.json()['url'])
+
+    async def run_operation(self, operation):
+        started = time.monotonic()
+        error = None
+        try:
+            response = await getattr(self, OPERATIONS[operation])()
+            if response.status_code >= 400:
+                error = f'HTTP {response.status_code}'
+        except httpx.HTTPError as err:
+            error = type(err).__name__
+        if self.recording:
+            self.stats[operation].record(time.monotonic() - started, error)
+
+    async def worker(self, deadline, limiter):
+        while time.monotonic() < deadline:
+            if limiter is not None:
+                await limiter.wait()
+                if time.monotonic() >= deadline:
+                    break
+            await self.run_operation(random.choices(self.operations, self.weights)[0])
+
+    async def run(self):
+        await self.authenticate()
+        await self.discover()
+        limiter = RateLimiter(self.args.rps) if self.args.rps else None
+        started = time.monotonic()
+        deadline = started + self.args.warmup + self.args.duration
+        workers = [asyncio.create_task(self.worker(deadline, limiter)) for _ in range(self.args.concurrency)]
+        await asyncio.sleep(self.args.warmup)
+        self.recording = True
+        measured_from = time.monotonic()
+        await asyncio.gather(*workers)
+        elapsed = time.monotonic() - measured_from
+        return {
+            'config': {
+                'base_url': self.args.base_url,
+                'mix': dict(zip(self.operations, self.weights)),
+                'concurrency': self.args.concurrency,
+                'rps': self.args.rps,
+                'warmup_s': self.args.warmup,
+                'duration_s': round(elapsed, 2),
+            },
+            'operations': {operation: stats.summary(elapsed) for operation, stats in sorted(self.stats.items())},
+        }
+
+
+OPERATIONS = {
+    'upload': 'upload',
+    'list': 'list_images',
+    'detail': 'detail',
+    'thumbnail': 'thumbnail',
+    'binary': 'binary',
+}
+
+
+def parse_mix(mix):
+    """Parse 'list=5,thumbnail=20' into operations and their weights"""
+    operations, weights = [], []
+    for item in mix.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in OPERATIONS:
+            raise SystemExit(f'Unknown operation {operation}, choose from {", ".join(OPERATIONS)}')
+        operations.append(operation)
+        weights.append(float(weight or 1))
+    return operations, weights
+
+
+def print_report(report):
+    for operation, summary in report['operations'].items():
+        print(f"\n{operation}: {summary['ok']} ok, {summary['throughput_per_s']}/s, "
+              f"p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms")
+        peak = max(summary['histogram'].values(), default=1)
+        for bucket, count in summary['histogram'].items():
+            print(f'  {bucket:>9} {"#" * max(1, round(count / peak * 40))} {count}')
+        for error, count in summary['errors'].items():
+            print(f'  error {error}: {count}')
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        report = await LoadTest(client, args).run()
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent load test of an ImageOcean stack')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--username')
+    parser.add_argument('--password', default=os.environ.get('IMAGEOCEAN_PASSWORD'))
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Weighted operations, default {DEFAULT_MIX}')
+    parser.add_argument('--concurrency', type=int, default=10, help='Number of concurrent virtual users')
+    parser.add_argument('--rps', type=float, help='Target request rate, by default every user sends requests back to back')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of load before measuring starts')
+    parser.add_argument('--image', default=DEFAULT_IMAGE, help='Image used by upload operations')
+    parser.add_argument('--expiration-seconds', type=int, default=300)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    cli_args = parser.parse_args()
+    if cli_args.username is None:
+        cli_args.username = input("What is your username?\n")
+    if cli_args.password is None:
+        cli_args.password = getpass("What is your password?\n")
+    asyncio.run(main(cli_args))
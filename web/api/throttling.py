@@ -0,0 +1,21 @@
+from rest_framework.throttling import BaseThrottle
+
+from images.services.rate_limit import check_rate_limit
+
+class TierRateThrottle(BaseThrottle):
+    """
+    Token bucket throttle with the rate limit of the user's account tier.
+    Views doing the work of many requests define throttle_cost(request) returning the number of tokens taken.
+    """
+
+    def allow_request(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return True
+        cost = view.throttle_cost(request) if hasattr(view, 'throttle_cost') else 1
+        self.rate_limit = check_rate_limit(request.user, cost)
+        # the RateLimit headers are added to the response by the RateLimitHeadersMiddleware
+        request._request.rate_limit = self.rate_limit
+        return self.rate_limit is None or self.rate_limit.allowed
+
+    def wait(self):
+        return self.rate_limit.retry_after
@@ -34,6 +34,10 @@ ALLOWED_HOSTS.extend(
     )
 )
 
+# Scheme and host of absolute URLs built outside of a request cycle
+
+SITE_URL = os.environ.get('SITE_URL', 'http://127.0.0.1:8000')
+
 
 # Application definition
 
@@ -51,13 +55,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'images.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'images.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'images.middleware.RateLimitHeadersMiddleware',
+    'images.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'imageocean.urls'
@@ -94,6 +102,59 @@ DATABASES = {
     }
 }
 
+# Read replicas of the default database, one per host listed in DB_REPLICA_HOSTS.
+# Reads of safe requests go to a replica, writes and all other reads to the primary.
+
+DATABASE_REPLICAS = []
+for index, replica_host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(','))):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+DATABASE_ROUTERS = ['images.routers.ReplicaRouter']
+
+# Seconds requests of a client, and of the user it is authenticated as, stay on the primary after it writes,
+# should exceed the replication lag
+
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+REPLICA_STICKY_COOKIE = 'read_primary'
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Set REDIS_URL to share the cache, and with it the rate limit buckets, between processes and hosts
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+    }
+
+
+# Logging
+# https://docs.djangoproject.com/en/4.0/topics/logging/
+# Messages of the project and the images app are written to the console, i.e. the log of the container
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'imageocean': {'handlers': ['console'], 'level': 'INFO'},
+        'images': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -143,7 +204,143 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Allowed extensions for uploading photos
 
-ALLOWED_IMAGE_EXTENSIONS = ['jpg', 'png']
+ALLOWED_IMAGE_EXTENSIONS = ['jpg', 'png', 'apng', 'gif', 'webp']
+
+
+# Upper limits of uploaded images, account tiers may lower the pixel count and the frames
+# and duration of animations further
+
+MAX_IMAGE_PIXELS = 150_000_000
+MAX_IMAGE_DIMENSION = 30000
+MAX_ANIMATION_FRAMES = 1000
+
+
+# Originals are stored with the EXIF orientation applied and without metadata, and downscaled
+# to the largest dimension the account tier allows
+
+NORMALIZE_ORIGINALS = bool(int(os.environ.get('NORMALIZE_ORIGINALS', 1)))
+
+
+# Memory a single transform may use for decoded pixel data, in bytes
+
+TRANSFORM_MEMORY_BUDGET = 512 * 1024 * 1024
+
+
+# Originals with more pixels are binarized in strips of TILE_STRIP_HEIGHT rows. JPEG originals are decoded at the
+# largest 1/2, 1/4 or 1/8 scale within this many pixels, so their binary images are downscaled and their pyramid
+# starts at that level. PNG, GIF and WebP originals cannot be decoded partially and are only bounded by
+# TRANSFORM_MEMORY_BUDGET
+
+TILED_PROCESSING_THRESHOLD = 40_000_000
+TILE_STRIP_HEIGHT = 256
+
+
+# Token bucket rate limiting of requests with the limits of the account tier
+
+RATE_LIMIT_ENABLED = bool(int(os.environ.get('RATE_LIMIT_ENABLED', 1)))
+RATE_LIMIT_CACHE = 'default'
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': ['api.throttling.TierRateThrottle'],
+}
+
+
+# Batch thumbnail fetches: most thumbnails per request and parallel renders of cache misses
+
+THUMBNAIL_BATCH_MAX_ITEMS = 100
+THUMBNAIL_BATCH_WORKERS = 4
+
+
+# Longest wait of a long-polling upload status request and the interval the status is read in, in seconds.
+# A waiting request holds a uWSGI worker, clients poll again for longer waits
+
+UPLOAD_STATUS_MAX_WAIT = 5
+UPLOAD_STATUS_POLL_INTERVAL = 0.5
+
+
+# Most images deleted by a single bulk delete request
+
+BULK_DELETE_MAX_ITEMS = 1000
+
+
+# Near-duplicate detection: largest Hamming distance between the 64-bit perceptual hashes of near-duplicates,
+# and whether uploads that are near-duplicates of an image of the same user are rejected
+
+DUPLICATE_HASH_DISTANCE = 6
+REJECT_DUPLICATE_UPLOADS = bool(int(os.environ.get('REJECT_DUPLICATE_UPLOADS', 0)))
+
+
+# Popularity of thumbnails: share of requests counted, each with the weight of the skipped ones,
+# and how often a process writes its counters, in seconds or once it holds that many thumbnails
+
+ACCESS_SAMPLE_RATE = float(os.environ.get('ACCESS_SAMPLE_RATE', 0.1))
+ACCESS_FLUSH_INTERVAL = 30
+ACCESS_FLUSH_MAX_KEYS = 1000
+
+
+# Most requested thumbnails loaded into the cache by warm_cache, and the size evict_derivatives
+# trims the derivative store to, the least requested thumbnails are evicted first
+
+WARM_CACHE_TOP = 1000
+DERIVATIVE_STORE_MAX_BYTES = int(os.environ.get('DERIVATIVE_STORE_MAX_BYTES', 10 * 1024 ** 3))
+
+
+# Admin dashboard: how often a process writes its cache and render statistics,
+# in seconds or once it holds that many rendered images
+
+STATS_FLUSH_INTERVAL = 30
+STATS_FLUSH_MAX_KEYS = 1000
+
+
+# Background job queue, failed jobs are retried after IMAGE_JOB_RETRY_DELAY seconds doubled on every attempt.
+# A running job is leased for IMAGE_JOB_LEASE_SECONDS, long jobs extend the lease as they progress,
+# jobs whose worker died are claimed again once the lease expires
+
+IMAGE_JOB_MAX_ATTEMPTS = 3
+IMAGE_JOB_RETRY_DELAY = 10
+IMAGE_JOB_LEASE_SECONDS = 300
+IMAGE_WORKER_POLL_INTERVAL = 1
+
+
+# Opt-in request profiling: a share of requests is sampled and staff users can send the X-Profile header,
+# profiles of requests slower than PROFILING_MIN_DURATION_MS are kept in a ring of PROFILING_MAX_PROFILES files
+
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_MIN_DURATION_MS = 500
+PROFILING_MAX_PROFILES = 100
+PROFILES_ROOT = '/vol/web/profiles'
+
+
+# Addresses allowed to scrape the /metrics endpoint besides staff users, none by default.
+# Requests forwarded by a reverse proxy are never matched, their address is the one of the proxy
+
+METRICS_ALLOWED_IPS = list(
+    filter(
+        None,
+        os.environ.get('METRICS_ALLOWED_IPS', '').split(','),
+    )
+)
+
+
+# Smallest height of a level in the resolution pyramid generated for every upload
+
+PYRAMID_MIN_HEIGHT = 64
+
+
+# Default binarization of binary images: 'grayscale', 'threshold', 'otsu' or 'dither'
+
+BINARY_IMAGE_METHOD = 'grayscale'
+BINARY_IMAGE_THRESHOLD = 128
+
+
+# Bulk binary renditions: images streamed from the database and rendered in parallel at once
+
+BINARY_RENDITION_CHUNK_SIZE = 100
+
+# Memory an image_worker process may use for decoded pixel data. Bulk jobs render with at most
+# IMAGE_WORKER_MEMORY_LIMIT // TRANSFORM_MEMORY_BUDGET threads, however many cores the host has
+
+IMAGE_WORKER_MEMORY_LIMIT = int(os.environ.get('IMAGE_WORKER_MEMORY_LIMIT', 2 * 1024 * 1024 * 1024))
 
 
 AUTH_USER_MODEL = 'images.AppUser'
\ No newline at end of file
@@ -3,6 +3,7 @@ from django.urls import include, path
 from django.conf.urls.static import static
 from django.conf import settings
 from django.contrib.auth.views import LoginView
+from images.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -10,6 +11,7 @@ urlpatterns = [
     path('api/images/', include('images.urls')),
     path('accounts/login/', LoginView.as_view(), name='login'),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
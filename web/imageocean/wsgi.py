@@ -7,6 +7,7 @@ For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
@@ -14,3 +15,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'imageocean.settings')
 
 application = get_wsgi_application()
+
+# Set by uwsgi.ini: the application is loaded in the master process and warmed up before the workers are forked
+if os.environ.get('PRELOAD_APP') == '1':
+    from images.services.preload import preload_app
+
+    logger = logging.getLogger(__name__)
+    # the preload is best effort, the workers still start when it fails
+    try:
+        cached, loaded, failed = preload_app()
+    except Exception:
+        logger.exception('Application preload failed')
+    else:
+        logger.info('Application preloaded, thumbnail cache: %s loaded, %s already cached, %s failed', loaded, cached, failed)
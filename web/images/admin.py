@@ -1,6 +1,41 @@
+import os
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import UserTier, AppUser, UploadedImage
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from .models import (
+    UserTier, AppUser, UploadedImage, ImageJob, RequestProfile, DerivativeAccess, StorageUsage, BinaryRenditionBatch
+)
+from .services.profiling import delete_profile, profile_path
+from .services.statistics import cache_hit_ratios, slowest_renders, storage_by_tier, top_storage_users
+
+# Unfiltered change lists of tables with more rows than this show the row estimate of the planner
+# instead of counting every row
+ESTIMATED_COUNT_MIN_ROWS = 100000
+DASHBOARD_TOP = 20
+DASHBOARD_DAYS = 7
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using the row estimate of PostgreSQL for unfiltered querysets of large tables"""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        connection = connections[self.object_list.db] if query is not None else None
+        if connection is not None and connection.vendor == 'postgresql' and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [query.model._meta.db_table])
+                row = cursor.fetchone()
+            if row is not None and row[0] > ESTIMATED_COUNT_MIN_ROWS:
+                return int(row[0])
+        return super().count
 
 class AppUserAdmin(UserAdmin):
     fieldsets = (
@@ -12,10 +47,118 @@ class AppUserAdmin(UserAdmin):
     )
 
 admin.site.register(AppUser,AppUserAdmin)
-admin.site.register(UploadedImage)
+
+@admin.register(UploadedImage)
+class UploadedImageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'original_bytes', 'derivatives', 'derivative_bytes']
+    list_filter = ['status']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+@admin.register(StorageUsage)
+class StorageUsageAdmin(admin.ModelAdmin):
+    """Dashboard of the storage per tier and user, the cache hit ratios and the slowest renders"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise Http404
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Dashboard',
+            'opts': self.model._meta,
+            'tiers': storage_by_tier(),
+            'top_users': top_storage_users(DASHBOARD_TOP),
+            'caches': cache_hit_ratios(DASHBOARD_DAYS),
+            'days': DASHBOARD_DAYS,
+            'slowest_renders': slowest_renders(DASHBOARD_TOP),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/images/storageusage/dashboard.html', context)
 
 @admin.register(UserTier)
 class UserTierAdmin(admin.ModelAdmin):
     list_display = ['name']
 
+@admin.register(ImageJob)
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ['key', 'kind', 'status', 'priority', 'attempts', 'run_after', 'updated_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['key']
+
+@admin.register(DerivativeAccess)
+class DerivativeAccessAdmin(admin.ModelAdmin):
+    list_display = ['image', 'height', 'hits', 'last_accessed']
+    ordering = ['-hits']
+    readonly_fields = ['image', 'height', 'hits', 'last_accessed']
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(BinaryRenditionBatch)
+class BinaryRenditionBatchAdmin(admin.ModelAdmin):
+    list_display = ['user', 'method', 'processed', 'rendered', 'seconds', 'images_per_second_per_core', 'finished_at']
+    list_filter = ['method']
+    list_select_related = ['user']
+    readonly_fields = [
+        'user', 'method', 'processed', 'rendered', 'failed_ids', 'seconds', 'cores', 'last_image_id', 'finished_at',
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'method', 'path', 'status_code', 'duration_ms', 'user', 'download']
+    list_filter = ['method', 'status_code']
+    search_fields = ['path']
+    ordering = ['-created_at']
+    readonly_fields = ['path', 'method', 'user', 'status_code', 'duration_ms', 'file_name', 'created_at']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description='Profile')
+    def download(self, obj):
+        url = reverse('admin:images_requestprofile_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.file_name)
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/',
+                self.admin_site.admin_view(self.download_view),
+                name='images_requestprofile_download',
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        """Download the pstats file of a profile, open it with python -m pstats or snakeviz"""
+        if not self.has_view_permission(request):
+            raise Http404
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not os.path.exists(profile_path(profile)):
+            raise Http404
+        return FileResponse(open(profile_path(profile), 'rb'), as_attachment=True, filename=profile.file_name)
+
+    def delete_model(self, request, obj):
+        delete_profile(obj)
+
+    def delete_queryset(self, request, queryset):
+        for profile in queryset:
+            delete_profile(profile)
+
 # Register your models here.
\ No newline at end of file
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ImagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'images'
+
+    def ready(self):
+        from PIL import Image
+        # Align the Pillow decompression bomb guard with the largest image an account tier may upload
+        Image.MAX_IMAGE_PIXELS = settings.MAX_IMAGE_PIXELS
+        # Register the handlers of background jobs
+        from .services import derivatives, backfill, cleanup, uploads, renditions
@@ -0,0 +1,226 @@
+"""
+Django command to benchmark the image pipeline
+"""
+import json
+import os
+import platform
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy
+import PIL
+from PIL import Image, ImageFilter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from images.models import AppUser, UploadedImage, UserTier
+from images.services.derivatives import derivative_path, load_thumbnail_data, thumbnail_cache_key
+from images.services.tools import create_binary_image_data, create_thumbnail_data
+
+FORMATS = {'jpeg': ('JPEG', 'jpg'), 'png': ('PNG', 'png')}
+
+# Slowdowns below this many milliseconds are treated as timer noise when comparing with a baseline
+NOISE_FLOOR_MS = 1.0
+
+
+def create_synthetic_image(width, height):
+    """Create a photo-like image: smooth gradients with grain, so codecs do realistic work"""
+    gradient = Image.linear_gradient('L').resize((width, height))
+    grain = Image.effect_noise((width, height), 40)
+    channels = [
+        Image.blend(gradient, grain, 0.3),
+        Image.blend(gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), grain, 0.2),
+        Image.blend(gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM), grain, 0.1),
+    ]
+    return Image.merge('RGB', channels).filter(ImageFilter.GaussianBlur(1))
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of already sorted values"""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process in megabytes"""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure(name, func, iterations, warmup, setup=None, **params):
+    """Run a benchmark and summarize its latencies"""
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        func()
+    durations = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    total = sum(durations)
+    return {
+        'name': name,
+        **params,
+        'iterations': iterations,
+        'throughput_per_s': round(iterations / total, 2) if total else None,
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the image pipeline"""
+
+    help = 'Benchmarks thumbnail and binary image rendering on synthetic images and reports JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='640x480,1920x1080,4000x3000', help='Comma separated WIDTHxHEIGHT list')
+        parser.add_argument('--formats', default='jpeg,png', help='Comma separated list of jpeg, png')
+        parser.add_argument('--heights', default='200,400', help='Comma separated thumbnail heights')
+        parser.add_argument('--iterations', type=int, default=10)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='JSON report of a previous run to compare p50 latencies with')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p50 slowdown against the baseline')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        try:
+            sizes = [tuple(int(side) for side in size.split('x')) for size in options['sizes'].split(',')]
+            heights = [int(height) for height in options['heights'].split(',')]
+            formats = [FORMATS[image_format] for image_format in options['formats'].split(',')]
+        except (KeyError, ValueError):
+            raise CommandError('Invalid --sizes, --heights or --formats')
+        corpus_dir = tempfile.mkdtemp(prefix='bench_images_')
+        try:
+            results = self.run_benchmarks(corpus_dir, sizes, heights, formats, options)
+        finally:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+        report = {
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'environment': {
+                'python': platform.python_version(),
+                'pillow': PIL.__version__,
+                'numpy': numpy.__version__,
+                'cpu_count': os.cpu_count(),
+                'tiled_processing_threshold': settings.TILED_PROCESSING_THRESHOLD,
+            },
+            'results': results,
+        }
+        report_json = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(report_json)
+        else:
+            self.stdout.write(report_json)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def run_benchmarks(self, corpus_dir, sizes, heights, formats, options):
+        """Generate the corpus and run every benchmark on it"""
+        iterations, warmup = options['iterations'], options['warmup']
+        results = []
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            UserTier.objects.get_or_create(name='Basic') # new users start in the Basic tier
+            user = AppUser.objects.create(username=f'bench_{time.time_ns()}')
+            # the views are requested back to back, an unlimited tier keeps the rate limit out of the measurements
+            user.tier = UserTier.objects.create(name='Benchmark', thumbnail_sizes=heights, rate_limit_per_minute=0)
+            user.save()
+            client = Client()
+            client.force_login(user)
+            for width, height in sizes:
+                for save_format, extension in formats:
+                    params = {'format': extension, 'size': f'{width}x{height}'}
+                    path = os.path.join(corpus_dir, f'bench_{width}x{height}.{extension}')
+                    create_synthetic_image(width, height).save(path, save_format)
+                    params['file_kb'] = round(os.path.getsize(path) / 1024, 1)
+                    with open(path, 'rb') as image_file:
+                        stored_name = default_storage.save(f'bench/{os.path.basename(path)}', image_file)
+                    image = UploadedImage.objects.create(user=user, image_url=stored_name)
+                    try:
+                        results.extend(self.run_image_benchmarks(client, image, path, heights, iterations, warmup, params))
+                    finally:
+                        shutil.rmtree(os.path.dirname(derivative_path(image, 'thumbnail')), ignore_errors=True)
+                        default_storage.delete(stored_name)
+                    self.stderr.write(f'Benchmarked {extension} {width}x{height}')
+            transaction.set_rollback(True)
+        return results
+
+    def run_image_benchmarks(self, client, image, path, heights, iterations, warmup, params):
+        """Run the benchmarks of a single corpus image"""
+        results = []
+
+        def evict(thumbnail_height):
+            cache.delete(thumbnail_cache_key(image.pk, thumbnail_height))
+            try:
+                os.remove(derivative_path(image, f'thumbnail_{thumbnail_height}'))
+            except FileNotFoundError:
+                pass
+
+        for thumbnail_height in heights:
+            thumbnail_params = {**params, 'height': thumbnail_height}
+            results.append(measure(
+                'create_thumbnail_data', lambda: create_thumbnail_data(path, thumbnail_height),
+                iterations, warmup, **thumbnail_params,
+            ))
+            results.append(measure(
+                'thumbnail_cache_miss', lambda: load_thumbnail_data(image, thumbnail_height),
+                iterations, warmup, setup=lambda: evict(thumbnail_height), **thumbnail_params,
+            ))
+            results.append(measure(
+                'thumbnail_cache_hit', lambda: load_thumbnail_data(image, thumbnail_height),
+                iterations, warmup, **thumbnail_params,
+            ))
+            url = reverse('images:thumbnail_view', kwargs={
+                'pk': image.pk, 'height': thumbnail_height, 'name': os.path.basename(image.image_url.path),
+            })
+
+            def request_thumbnail():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f'thumbnail_view returned {response.status_code}')
+
+            results.append(measure(
+                'thumbnail_view_cold', request_thumbnail,
+                iterations, warmup, setup=lambda: evict(thumbnail_height), **thumbnail_params,
+            ))
+            results.append(measure('thumbnail_view_warm', request_thumbnail, iterations, warmup, **thumbnail_params))
+        for method in ('grayscale', 'otsu'):
+            results.append(measure(
+                'create_binary_image_data', lambda: create_binary_image_data(path, method),
+                iterations, warmup, method=method, **params,
+            ))
+        return results
+
+    def compare(self, results, baseline_path, tolerance):
+        """Fail when a benchmark got slower than the baseline by more than the tolerance"""
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        def identity(result):
+            return tuple(sorted((key, value) for key, value in result.items() if key in (
+                'name', 'format', 'size', 'height', 'method'
+            )))
+
+        baseline_p50 = {identity(result): result['p50_ms'] for result in baseline['results']}
+        regressions = []
+        for result in results:
+            previous = baseline_p50.get(identity(result))
+            if previous and result['p50_ms'] > max(previous * (1 + tolerance), previous + NOISE_FLOOR_MS):
+                regressions.append(f"{dict(identity(result))}: p50 {previous} ms -> {result['p50_ms']} ms")
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+        self.stderr.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -8,15 +8,15 @@ from images.models import UserTier
 TIERS = [
     {
         "tier_name":"Basic",
-        "permissions":{"thumbnail_sizes":[200],"original_image":False,"expiring_links":False}
+        "permissions":{"thumbnail_sizes":[200],"original_image":False,"expiring_links":False,"max_image_pixels":25_000_000,"max_original_dimension":2048,"max_animation_frames":100,"max_animation_seconds":10,"rate_limit_per_minute":120,"rate_limit_burst":20}
     },
     {
         "tier_name":"Premium",
-        "permissions":{"thumbnail_sizes":[200,400],"original_image":False,"expiring_links":False}
+        "permissions":{"thumbnail_sizes":[200,400],"original_image":False,"expiring_links":False,"max_image_pixels":50_000_000,"max_original_dimension":4096,"max_animation_frames":300,"max_animation_seconds":30,"rate_limit_per_minute":600,"rate_limit_burst":60}
     },
     {
         "tier_name":"Enterprice",
-        "permissions":{"thumbnail_sizes":[200,400],"original_image":True,"expiring_links":True}
+        "permissions":{"thumbnail_sizes":[200,400],"original_image":True,"expiring_links":True,"max_image_pixels":150_000_000,"max_original_dimension":0,"max_animation_frames":1000,"max_animation_seconds":0,"rate_limit_per_minute":3000,"rate_limit_burst":300}
     },
 ]
 
@@ -32,6 +32,12 @@ class Command(BaseCommand):
             new_tier.thumbnail_sizes = tier.get("permissions").get("thumbnail_sizes")
             new_tier.original_image = tier.get("permissions").get("original_image")
             new_tier.expiring_links = tier.get("permissions").get("expiring_links")
+            new_tier.max_image_pixels = tier.get("permissions").get("max_image_pixels")
+            new_tier.max_original_dimension = tier.get("permissions").get("max_original_dimension")
+            new_tier.max_animation_frames = tier.get("permissions").get("max_animation_frames")
+            new_tier.max_animation_seconds = tier.get("permissions").get("max_animation_seconds")
+            new_tier.rate_limit_per_minute = tier.get("permissions").get("rate_limit_per_minute")
+            new_tier.rate_limit_burst = tier.get("permissions").get("rate_limit_burst")
             new_tier.save()
             if created:
                 self.stdout.write(self.style.SUCCESS(f'Trier {new_tier} created!'))
\ No newline at end of file
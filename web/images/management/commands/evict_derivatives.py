@@ -0,0 +1,30 @@
+"""
+Django command to trim the derivative store to its size limit
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from images.services.derivatives import evict_derivatives
+
+
+class Command(BaseCommand):
+    """Django command to evict the least requested thumbnails from the derivative store"""
+
+    help = 'Removes the least requested thumbnails until the derivative store fits its size limit'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-size',
+            type=int,
+            default=settings.DERIVATIVE_STORE_MAX_BYTES // 1024 // 1024,
+            help='Size the derivative store may take, in MB',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Count the thumbnails without removing them')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        evicted, freed, stored = evict_derivatives(options['max_size'] * 1024 * 1024, dry_run=options['dry_run'])
+        action = 'would be evicted' if options['dry_run'] else 'evicted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{evicted} thumbnails {action}, {freed / 1024 / 1024:.1f} MB freed, {stored / 1024 / 1024:.1f} MB stored'
+        ))
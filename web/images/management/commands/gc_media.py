@@ -0,0 +1,36 @@
+"""
+Django command to remove stored files of images that no longer exist
+"""
+from django.core.management.base import BaseCommand
+
+from images.services.cleanup import iter_orphans, remove_path
+
+
+class Command(BaseCommand):
+    """Django command to garbage collect media files"""
+
+    help = 'Removes originals, pyramids and derivatives that are not referenced by any image'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of files checked with a single query')
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=3600,
+            help='Seconds a file must be unmodified to be removed, protects uploads in progress',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List the orphans without removing them')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        removed = freed = 0
+        for path in iter_orphans(batch_size=options['batch_size'], min_age=options['min_age']):
+            if options['dry_run']:
+                self.stdout.write(path)
+            else:
+                freed += remove_path(path)
+            removed += 1
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{removed} orphans found'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{removed} orphans removed, {freed / 1024 / 1024:.1f} MB freed'))
@@ -0,0 +1,65 @@
+"""
+Django command to run background image processing workers
+"""
+import multiprocessing
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from images.services.jobs import run_next_job
+from images.services.statistics import stats_counter
+
+
+def work(burst):
+    """Process jobs until stopped, or until the queue is empty in burst mode"""
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    signal.signal(signal.SIGINT, lambda signum, frame: stopping.append(signum))
+    while not stopping:
+        close_old_connections()
+        job = run_next_job()
+        if job is None:
+            stats_counter.flush()
+            if burst:
+                break
+            time.sleep(settings.IMAGE_WORKER_POLL_INTERVAL)
+    stats_counter.flush()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    """Django command to run background image processing workers"""
+
+    help = 'Runs worker processes rendering image derivatives from the job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        processes = options['processes']
+        self.stdout.write(f'Starting {processes} image worker(s)...')
+        if processes == 1:
+            work(options['burst'])
+        else:
+            connections.close_all()
+            workers = [
+                multiprocessing.Process(target=work, args=(options['burst'],), daemon=True)
+                for _ in range(processes)
+            ]
+            for worker in workers:
+                worker.start()
+
+            def stop_workers(signum, frame):
+                for worker in workers:
+                    worker.terminate()
+
+            signal.signal(signal.SIGTERM, stop_workers)
+            signal.signal(signal.SIGINT, stop_workers)
+            for worker in workers:
+                worker.join()
+        self.stdout.write(self.style.SUCCESS('Image workers stopped'))
@@ -0,0 +1,27 @@
+"""
+Django command to rebuild the storage totals of the admin dashboard
+"""
+from django.core.management.base import BaseCommand
+
+from images.services.statistics import measure_stored_images, rebuild_storage_usage
+
+
+class Command(BaseCommand):
+    """Django command to recompute the storage totals of all users from the images table"""
+
+    help = 'Recomputes the storage totals of the admin dashboard, kept up to date by database triggers afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--measure',
+            action='store_true',
+            help='Measure the originals and derivatives of all images first, needed once for images stored before',
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        if options['measure']:
+            measured = measure_stored_images()
+            self.stdout.write(f'{measured} images measured')
+        users = rebuild_storage_usage()
+        self.stdout.write(self.style.SUCCESS(f'Storage totals of {users} users rebuilt'))
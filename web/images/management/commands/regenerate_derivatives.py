@@ -0,0 +1,43 @@
+"""
+Django command to regenerate derivatives after a change of tier thumbnail sizes
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from images.models import UploadedImage, UserTier
+from images.services.backfill import backfill_tier
+
+
+class Command(BaseCommand):
+    """Django command to regenerate derivatives"""
+
+    help = 'Renders missing thumbnails, placeholders and perceptual hashes and refreshes thumbnail URLs of existing images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tier', action='append', dest='tiers', help='Name of the tier, all tiers by default')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Number of images processed at once')
+        parser.add_argument('--workers', type=int, default=None, help='Number of rendering threads')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        tiers = UserTier.objects.order_by('name')
+        if options['tiers']:
+            tiers = tiers.filter(name__in=options['tiers'])
+            if tiers.count() != len(set(options['tiers'])):
+                raise CommandError('Unknown tier name')
+        for tier in tiers:
+            total = UploadedImage.objects.filter(user__tier=tier).count()
+            self.stdout.write(f'Tier {tier}: {total} images, thumbnail sizes {tier.thumbnail_sizes}')
+
+            def report(processed, rendered, elapsed):
+                throughput = processed / elapsed if elapsed else 0
+                self.stdout.write(
+                    f'  {processed}/{total} images, {rendered} thumbnails rendered, {throughput:.1f} images/s'
+                )
+
+            processed, rendered = backfill_tier(
+                tier,
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                progress=report,
+            )
+            self.stdout.write(self.style.SUCCESS(f'Tier {tier}: {processed} images, {rendered} thumbnails rendered'))
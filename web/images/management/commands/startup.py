@@ -0,0 +1,29 @@
+"""
+Django command to prepare the database before the app server starts
+"""
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from images.models import UserTier
+from images.management.commands.create_tiers import TIERS
+
+
+class Command(BaseCommand):
+    """Django command running the startup steps of the app server in one process, skipping the ones already done"""
+
+    help = 'Waits for the database, applies pending migrations and creates missing tiers'
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        call_command('wait_for_db', stdout=self.stdout)
+        executor = MigrationExecutor(connection)
+        if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+            call_command('migrate', interactive=False, stdout=self.stdout)
+        else:
+            self.stdout.write('No migrations to apply')
+        tier_names = {tier['tier_name'] for tier in TIERS}
+        if UserTier.objects.filter(name__in=tier_names).count() < len(tier_names):
+            call_command('create_tiers', stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS('Startup done!'))
@@ -0,0 +1,23 @@
+"""
+Django command to load the most requested thumbnails into the cache
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from images.services.derivatives import warm_thumbnail_cache
+
+
+class Command(BaseCommand):
+    """Django command to warm up the thumbnail cache"""
+
+    help = 'Loads the most requested thumbnails into the cache, rendering the ones missing from the derivative store'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=settings.WARM_CACHE_TOP, help='Number of thumbnails to load')
+        parser.add_argument('--days', type=int, default=None, help='Only thumbnails requested within the last days')
+        parser.add_argument('--workers', type=int, default=None, help='Number of loading threads')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command"""
+        cached, loaded, failed = warm_thumbnail_cache(options['top'], days=options['days'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(f'{loaded} thumbnails loaded, {cached} already cached, {failed} failed'))
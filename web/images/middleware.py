@@ -0,0 +1,151 @@
+import cProfile
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.exceptions import AuthenticationFailed
+
+from api.authentication import TokenAuthentication
+from .routers import read_from_replica, read_primary_key, replica_state
+from .services.metrics import request_timings, server_timing_header, registry
+from .services.profiling import save_profile
+from .services.rate_limit import rate_limit_headers
+
+logger = logging.getLogger(__name__)
+
+
+class ServerTimingMiddleware:
+    """Collects the stage timings of a request and exposes them in the Server-Timing header"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = []
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        duration = time.perf_counter() - started
+        registry.observe_stage('request', duration)
+        timings.append(('total', duration))
+        response['Server-Timing'] = server_timing_header(timings)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serves the reads of safe requests from a read replica. After a successful write the client gets a cookie
+    keeping its requests on the primary for REPLICA_STICKY_SECONDS, so it reads its own writes despite the
+    replication lag. The write of an authenticated user is recorded in the cache as well, so clients sending
+    no cookies, like the ones authenticating with a Bearer token, and the other sessions of the user read from the primary too.
+    Runs after the authentication middleware, the user of a session is known before a replica is picked,
+    Bearer tokens are checked by the middleware itself, DRF authenticates them only in the views.
+    """
+
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        if request.method not in self.safe_methods:
+            response = self.get_response(request)
+            if response.status_code < 400:
+                response.set_cookie(
+                    settings.REPLICA_STICKY_COOKIE,
+                    '1',
+                    max_age=settings.REPLICA_STICKY_SECONDS,
+                    httponly=True,
+                    samesite='Lax',
+                )
+                if request.user.is_authenticated: # DRF sets the user it authenticated on the request
+                    cache.set(read_primary_key(request.user.pk), True, settings.REPLICA_STICKY_SECONDS)
+            return response
+        if request.COOKIES.get(settings.REPLICA_STICKY_COOKIE) or self.user_reads_primary(request):
+            return self.get_response(request)
+        token = read_from_replica()
+        try:
+            return self.get_response(request)
+        finally:
+            replica_state.reset(token)
+
+    def user_reads_primary(self, request):
+        user_id = self.user_id(request)
+        return user_id is not None and cache.get(read_primary_key(user_id)) is not None
+
+    def user_id(self, request):
+        if request.user.is_authenticated:
+            return request.user.pk
+        try:
+            authenticated = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return None
+        return authenticated[0].pk if authenticated is not None else None
+
+
+class RateLimitHeadersMiddleware:
+    """Adds the RateLimit headers of requests checked against the rate limit of the account tier"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        rate_limit = getattr(request, 'rate_limit', None)
+        if rate_limit is not None:
+            for header, value in rate_limit_headers(rate_limit).items():
+                response[header] = value
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a sample of requests, and requests of staff users sending the X-Profile header, with cProfile.
+    Profiles of slow requests are stored in a bounded ring of files listed in the admin.
+    Staff users are recognized by their session or by their API token, DRF authenticates tokens only in the views,
+    so the middleware checks the token of requests sending the header itself.
+    A profile which cannot be stored is logged and the response is returned without it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        forced = bool(request.META.get('HTTP_X_PROFILE')) and self.is_staff(request)
+        if not forced and random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError: # another profiler is already active in this thread
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration_ms = (time.perf_counter() - started) * 1000
+        if forced or duration_ms >= settings.PROFILING_MIN_DURATION_MS:
+            try:
+                profile = save_profile(profiler, request, response, duration_ms)
+            except Exception:
+                logger.exception('Saving the profile of %s failed', request.path)
+            else:
+                response['X-Profile-Id'] = str(profile.pk)
+        return response
+
+    def is_staff(self, request):
+        if request.user.is_staff:
+            return True
+        try:
+            authenticated = TokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
@@ -0,0 +1,233 @@
+# Generated by Django 4.1 on 2026-10-19 05:11
+
+from django.conf import settings
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+import django.utils.timezone
+import images.models
+import images.services.validators
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppUser',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('first_name', models.CharField(blank=True, max_length=150, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='email address')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+                'swappable': 'AUTH_USER_MODEL',
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='BinaryRenditionBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=20)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('rendered', models.PositiveIntegerField(default=0)),
+                ('failed_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), blank=True, default=list, size=None)),
+                ('seconds', models.FloatField(default=0)),
+                ('cores', models.PositiveSmallIntegerField(default=1)),
+                ('last_image_id', models.BigIntegerField(default=0, help_text='Images up to this id are processed')),
+                ('finished_at', models.DateTimeField(blank=True, help_text='Empty while the job is running', null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CacheStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('cache', models.CharField(max_length=20)),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('misses', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DerivativeAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('height', models.PositiveIntegerField()),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('last_accessed', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('kind', models.CharField(max_length=50)),
+                ('payload', models.JSONField(default=dict)),
+                ('priority', models.IntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('leased_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UploadedImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_url', models.ImageField(blank=True, upload_to=images.models.upload_to, validators=[images.services.validators.validate_image])),
+                ('thumbnails_urls', django.contrib.postgres.fields.ArrayField(base_field=models.URLField(), default=list, size=None)),
+                ('pyramid_levels', models.JSONField(blank=True, default=list)),
+                ('status', models.CharField(choices=[('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=10)),
+                ('processing_error', models.TextField(blank=True)),
+                ('placeholder', models.TextField(blank=True)),
+                ('perceptual_hash', models.BigIntegerField(blank=True, null=True)),
+                ('hash_chunks', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), blank=True, default=list, size=None)),
+                ('original_bytes', models.PositiveBigIntegerField(default=0)),
+                ('derivatives', models.PositiveIntegerField(default=0, help_text='Stored thumbnails and pyramid levels')),
+                ('derivative_bytes', models.PositiveBigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('thumbnail_sizes', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), default=list, size=None)),
+                ('original_image', models.BooleanField(default=False)),
+                ('expiring_links', models.BooleanField(default=False)),
+                ('max_image_pixels', models.PositiveBigIntegerField(default=25000000)),
+                ('max_original_dimension', models.PositiveIntegerField(default=0, help_text='Originals are downscaled to this longer side at upload, 0 keeps their size')),
+                ('max_animation_frames', models.PositiveIntegerField(default=100, help_text='1 allows still images only')),
+                ('max_animation_seconds', models.PositiveIntegerField(default=10, help_text='0 allows animations of any duration')),
+                ('rate_limit_per_minute', models.PositiveIntegerField(default=600, help_text='0 disables rate limiting')),
+                ('rate_limit_burst', models.PositiveIntegerField(default=60)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RenderStats',
+            fields=[
+                ('image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='images.uploadedimage')),
+                ('renders', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.FloatField(default=0)),
+                ('max_ms', models.FloatField(default=0)),
+                ('last_rendered', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('user', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('images', models.BigIntegerField(default=0)),
+                ('original_bytes', models.BigIntegerField(default=0)),
+                ('derivatives', models.BigIntegerField(default=0)),
+                ('derivative_bytes', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'dashboard',
+                'verbose_name_plural': 'dashboard',
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=2000)),
+                ('method', models.CharField(max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('file_name', models.CharField(max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['-priority', 'run_after', 'id'], name='imagejob_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['leased_until'], name='imagejob_running_idx'),
+        ),
+        migrations.AddField(
+            model_name='derivativeaccess',
+            name='image',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='images.uploadedimage'),
+        ),
+        migrations.AddConstraint(
+            model_name='cachestats',
+            constraint=models.UniqueConstraint(fields=('day', 'cache'), name='cachestats_day_cache_uniq'),
+        ),
+        migrations.AddField(
+            model_name='binaryrenditionbatch',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='appuser',
+            name='groups',
+            field=models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.group', verbose_name='groups'),
+        ),
+        migrations.AddField(
+            model_name='appuser',
+            name='tier',
+            field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='images.usertier'),
+        ),
+        migrations.AddField(
+            model_name='appuser',
+            name='user_permissions',
+            field=models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.permission', verbose_name='user permissions'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedimage',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['hash_chunks'], name='uploadedimage_hash_chunks_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='storageusage',
+            index=models.Index(models.OrderBy(django.db.models.expressions.CombinedExpression(models.F('original_bytes'), '+', models.F('derivative_bytes')), descending=True), name='storageusage_total_bytes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='renderstats',
+            index=models.Index(fields=['-max_ms'], name='renderstats_max_ms_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='derivativeaccess',
+            index=models.Index(fields=['-hits'], name='derivativeaccess_hits_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='derivativeaccess',
+            constraint=models.UniqueConstraint(fields=('image', 'height'), name='derivativeaccess_image_height_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='binaryrenditionbatch',
+            constraint=models.UniqueConstraint(fields=('user', 'method'), name='binaryrenditionbatch_user_method_uniq'),
+        ),
+    ]
@@ -0,0 +1,14 @@
+from django.db import migrations
+
+from images.services.statistics import drop_storage_usage_trigger_sql, storage_usage_trigger_sql
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(storage_usage_trigger_sql(), drop_storage_usage_trigger_sql()),
+    ]
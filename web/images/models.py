@@ -1,8 +1,11 @@
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.utils import timezone
 from .services.validators import validate_image
 
 def upload_to(instance, filename):
@@ -15,10 +18,28 @@ class UserTier(models.Model):
     thumbnail_sizes = ArrayField(models.IntegerField(), default=list)
     original_image = models.BooleanField(default=False)
     expiring_links = models.BooleanField(default=False)
+    max_image_pixels = models.PositiveBigIntegerField(default=25_000_000)
+    max_original_dimension = models.PositiveIntegerField(
+        default=0, help_text='Originals are downscaled to this longer side at upload, 0 keeps their size'
+    )
+    max_animation_frames = models.PositiveIntegerField(default=100, help_text='1 allows still images only')
+    max_animation_seconds = models.PositiveIntegerField(default=10, help_text='0 allows animations of any duration')
+    rate_limit_per_minute = models.PositiveIntegerField(default=600, help_text='0 disables rate limiting')
+    rate_limit_burst = models.PositiveIntegerField(default=60)
 
     def __str__(self) -> str:
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded sizes, so saving the tier can detect a change of thumbnail sizes,
+        # tiers loaded without them do not propagate their sizes
+        instance.loaded_thumbnail_sizes = (
+            list(instance.thumbnail_sizes) if 'thumbnail_sizes' in field_names else None
+        )
+        return instance
+
 class AppUser(AbstractUser):
     """Model of application user"""
     tier = models.ForeignKey(UserTier, on_delete=models.CASCADE, blank=True, null=True, default=None)
@@ -28,9 +49,179 @@ class AppUser(AbstractUser):
 
 class UploadedImage(models.Model):
     """Model of image uploaded by user"""
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PROCESSING, 'Processing'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(AppUser, on_delete=models.CASCADE)
     image_url = models.ImageField(upload_to=upload_to,validators=[validate_image], blank=True)
     thumbnails_urls = ArrayField(models.URLField(), default=list)
+    pyramid_levels = models.JSONField(default=list, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=READY)
+    processing_error = models.TextField(blank=True)
+    placeholder = models.TextField(blank=True)
+    perceptual_hash = models.BigIntegerField(blank=True, null=True)
+    hash_chunks = ArrayField(models.IntegerField(), default=list, blank=True)
+    original_bytes = models.PositiveBigIntegerField(default=0)
+    derivatives = models.PositiveIntegerField(default=0, help_text='Stored thumbnails and pyramid levels')
+    derivative_bytes = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['hash_chunks'], name='uploadedimage_hash_chunks_idx'),
+        ]
+
+class DerivativeAccess(models.Model):
+    """Model of the sampled request count of a thumbnail of an image"""
+    image = models.ForeignKey(UploadedImage, on_delete=models.CASCADE)
+    height = models.PositiveIntegerField()
+    hits = models.PositiveBigIntegerField(default=0)
+    last_accessed = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'height'], name='derivativeaccess_image_height_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['-hits'], name='derivativeaccess_hits_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.image_id} {self.height}px'
+
+class StorageUsage(models.Model):
+    """Model of the storage totals of a user, kept up to date by database triggers on the images table"""
+    # No foreign key constraint, the triggers update the totals while the images of a deleted user are deleted
+    user = models.OneToOneField(AppUser, on_delete=models.DO_NOTHING, db_constraint=False, primary_key=True)
+    images = models.BigIntegerField(default=0)
+    original_bytes = models.BigIntegerField(default=0)
+    derivatives = models.BigIntegerField(default=0)
+    derivative_bytes = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'dashboard'
+        verbose_name_plural = 'dashboard'
+        indexes = [
+            models.Index((F('original_bytes') + F('derivative_bytes')).desc(), name='storageusage_total_bytes_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return str(self.user_id)
+
+class CacheStats(models.Model):
+    """Model of the daily lookups of a derivative cache"""
+    day = models.DateField()
+    cache = models.CharField(max_length=20)
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'cache'], name='cachestats_day_cache_uniq'),
+        ]
+
+class RenderStats(models.Model):
+    """Model of the thumbnail render times of an image"""
+    image = models.OneToOneField(UploadedImage, on_delete=models.CASCADE, primary_key=True)
+    renders = models.PositiveIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    last_rendered = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-max_ms'], name='renderstats_max_ms_idx'),
+        ]
+
+    @property
+    def average_ms(self):
+        return self.total_ms / self.renders if self.renders else 0.0
+
+class BinaryRenditionBatch(models.Model):
+    """Model of the outcome of the last binary rendition job of an account"""
+    user = models.ForeignKey(AppUser, on_delete=models.CASCADE)
+    method = models.CharField(max_length=20)
+    processed = models.PositiveIntegerField(default=0)
+    rendered = models.PositiveIntegerField(default=0)
+    failed_ids = ArrayField(models.BigIntegerField(), default=list, blank=True)
+    seconds = models.FloatField(default=0)
+    cores = models.PositiveSmallIntegerField(default=1)
+    last_image_id = models.BigIntegerField(default=0, help_text='Images up to this id are processed')
+    finished_at = models.DateTimeField(null=True, blank=True, help_text='Empty while the job is running')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'method'], name='binaryrenditionbatch_user_method_uniq'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user_id}:{self.method}'
+
+    @property
+    def images_per_second_per_core(self):
+        return self.processed / self.seconds / self.cores if self.seconds else 0.0
+
+class ImageJob(models.Model):
+    """Model of a background image processing job"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    key = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    # A running job whose lease expired lost its worker and is claimed again
+    leased_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-priority', 'run_after', 'id'],
+                condition=models.Q(status='pending'),
+                name='imagejob_pending_idx',
+            ),
+            models.Index(
+                fields=['leased_until'],
+                condition=models.Q(status='running'),
+                name='imagejob_running_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return self.key
+
+class RequestProfile(models.Model):
+    """Model of a stored call-stack profile of a request"""
+    path = models.CharField(max_length=2000)
+    method = models.CharField(max_length=10)
+    user = models.ForeignKey(AppUser, on_delete=models.SET_NULL, blank=True, null=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    file_name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self) -> str:
+        return f'{self.method} {self.path}'
 
 @receiver(post_save, sender=AppUser)
 def set_tier(sender, instance, created, **kwargs):
@@ -38,3 +229,29 @@ def set_tier(sender, instance, created, **kwargs):
     if created:
         instance.tier = UserTier.objects.get(name="Basic")
         instance.save()
+
+@receiver(post_delete, sender=UploadedImage)
+def cleanup_image_files(sender, instance, **kwargs):
+    """Purge the cached thumbnails of a deleted image and enqueue removal of its files"""
+    from .services.cleanup import enqueue_image_cleanup
+
+    enqueue_image_cleanup(instance)
+
+@receiver(post_save, sender=UserTier)
+def propagate_thumbnail_sizes(sender, instance, created, **kwargs):
+    """Enqueue the backfill of existing images when thumbnail sizes of the tier change"""
+    from .services.jobs import enqueue_job_on_commit, JOB_PRIORITY_TIER_CHANGE
+
+    loaded_thumbnail_sizes = getattr(instance, 'loaded_thumbnail_sizes', None)
+    if created or loaded_thumbnail_sizes is None:
+        return
+    thumbnail_sizes = list(instance.thumbnail_sizes)
+    if set(thumbnail_sizes) != set(loaded_thumbnail_sizes):
+        removed_sizes = sorted(set(loaded_thumbnail_sizes) - set(thumbnail_sizes))
+        enqueue_job_on_commit(
+            'backfill_tier',
+            {'tier_id': instance.pk, 'removed_sizes': removed_sizes},
+            key=f'backfill_tier:{instance.pk}:{sorted(thumbnail_sizes)}',
+            priority=JOB_PRIORITY_TIER_CHANGE,
+        )
+    instance.loaded_thumbnail_sizes = thumbnail_sizes
@@ -0,0 +1,56 @@
+import contextvars
+import random
+
+from django.conf import settings
+
+
+class ReplicaState:
+    """Routing state of a request: the replica serving its reads, or None once reads are pinned to the primary"""
+
+    def __init__(self, replica):
+        self.replica = replica
+
+
+replica_state = contextvars.ContextVar('replica_state', default=None)
+
+
+def read_from_replica():
+    """
+    Route the reads of the current request to a randomly chosen replica, one replica serves all reads of a request.
+
+    Returns:
+    - A token restoring the previous routing with `replica_state.reset`.
+    """
+
+    replica = random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS else None
+    return replica_state.set(ReplicaState(replica))
+
+
+def read_primary_key(user_id):
+    return f'read_primary_{user_id}'
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of safe requests to a read replica and everything else to the primary.
+    Reads outside of a request, in workers and management commands, always go to the primary,
+    and a request is pinned to the primary after its first write.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = replica_state.get()
+        if state is None:
+            return None
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = replica_state.get()
+        if state is not None:
+            state.replica = None
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
@@ -1,16 +1,42 @@
+import os
+
+from django.urls import reverse
 from rest_framework import serializers
 from .models import UploadedImage, validate_image
+from .services.validators import validate_image_header
+
+class ImageHeaderValidationMixin:
+    """Validates the image header against the limits of the uploading user's tier"""
 
-class WithoutImageSerializer(serializers.ModelSerializer):
+    def validate_image_url(self, value):
+        request = self.context.get('request')
+        user_tier = getattr(getattr(request, 'user', None), 'tier', None)
+        validate_image_header(
+            value,
+            getattr(user_tier, 'max_image_pixels', None),
+            getattr(user_tier, 'max_animation_frames', None),
+            getattr(user_tier, 'max_animation_seconds', None),
+        )
+        return value
+
+class WithoutImageSerializer(ImageHeaderValidationMixin, serializers.ModelSerializer):
     image_url = serializers.ImageField(write_only=True,validators=[validate_image])
     class Meta:
         model = UploadedImage
-        fields = ['id', 'thumbnails_urls','image_url']
-        read_only_fields = ['id', 'thumbnails_urls']
+        fields = ['id', 'thumbnails_urls','image_url', 'status', 'placeholder']
+        read_only_fields = ['id', 'thumbnails_urls', 'status', 'placeholder']
 
-class WithImageSerializer(serializers.ModelSerializer):
+class WithImageSerializer(ImageHeaderValidationMixin, serializers.ModelSerializer):
     image_url = serializers.ImageField(validators=[validate_image])
     class Meta:
         model = UploadedImage
-        fields = ['id', 'thumbnails_urls','image_url']
-        read_only_fields = ['id', 'thumbnails_urls']
+        fields = ['id', 'thumbnails_urls','image_url', 'status', 'placeholder']
+        read_only_fields = ['id', 'thumbnails_urls', 'status', 'placeholder']
+
+    def to_representation(self, instance):
+        # originals are linked to the view checking the owner and the tier, the media directory is not served
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        url = reverse('images:original_image_view', args=[instance.pk, os.path.basename(instance.image_url.name)])
+        data['image_url'] = request.build_absolute_uri(url) if request is not None else url
+        return data
\ No newline at end of file
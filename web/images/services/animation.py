@@ -0,0 +1,120 @@
+"""Animated GIF, APNG and WebP images: frame limits and transforms decoding a single frame at a time"""
+from io import BytesIO
+from PIL import Image, ImageSequence
+
+ANIMATED_FORMATS = ('GIF', 'PNG', 'WEBP')
+# Frames are disposed to the background, every encoded frame is a full canvas
+GIF_DISPOSAL_BACKGROUND = 2
+
+def is_animated(img):
+    """
+    Check whether an opened image has more than one frame.
+
+    Args:
+        img (PIL.Image.Image): The opened image.
+
+    Returns:
+        bool: True for animated GIF, APNG and WebP images.
+    """
+
+    return img.format in ANIMATED_FORMATS and getattr(img, 'is_animated', False)
+
+def animation_duration(img, max_duration=None):
+    """
+    Add up the frame durations of an animated image. Frames are decoded one at a time,
+    the count stops as soon as it exceeds max_duration.
+
+    Args:
+        img (PIL.Image.Image): The opened animated image.
+        max_duration (int): The duration in milliseconds to stop at, None counts all frames.
+
+    Returns:
+        int: The duration of the animation in milliseconds.
+    """
+
+    duration = 0
+    try:
+        for frame in ImageSequence.Iterator(img):
+            frame.load() # WebP images read the frame duration while decoding the frame
+            duration += frame.info.get('duration', 0)
+            if max_duration is not None and duration > max_duration:
+                break
+    finally:
+        img.seek(0)
+    return int(duration)
+
+def animation_decoded_bytes(img, size):
+    """
+    Estimate the memory taken by resizing an animated image: the decoded canvas and its RGBA copy
+    of a single frame, and the resized frames collected for the encoder.
+
+    Args:
+        img (PIL.Image.Image): The opened animated image.
+        size (tuple): The (width, height) the frames are resized to.
+
+    Returns:
+        int: The number of bytes the transform occupies.
+    """
+
+    return img.width * img.height * 4 * 2 + size[0] * size[1] * 4 * img.n_frames
+
+def iter_resized_frames(img, size):
+    """
+    Decode the frames of an animated image one at a time and resize them.
+    Every frame is the full composited canvas, so frames can be dropped once they are resized.
+
+    Args:
+        img (PIL.Image.Image): The opened animated image.
+        size (tuple): The (width, height) the frames have to fit in.
+
+    Yields:
+        (PIL.Image.Image, int) tuples of a resized RGBA frame and its duration in milliseconds.
+    """
+
+    for frame in ImageSequence.Iterator(img):
+        resized_frame = frame.convert('RGBA')
+        duration = frame.info.get('duration', 0)
+        if resized_frame.size != size:
+            resized_frame.thumbnail(size, Image.LANCZOS)
+        yield resized_frame, int(duration)
+
+def encode_animation(frames, save_format, loop=None):
+    """
+    Encode frames as an animated image. The APNG and WebP writers of Pillow need all frames at once,
+    the resized frames are collected while the source frames stay decoded one at a time.
+
+    Args:
+        frames (Iterable): (PIL.Image.Image, int) tuples of the frames and their durations in milliseconds.
+        save_format (str): 'GIF', 'PNG' or 'WEBP'.
+        loop (int): The number of loops, 0 loops forever. None writes no loop count, a GIF without one plays once.
+
+    Returns:
+        bytes: The bytes of the animated image.
+    """
+
+    images, durations = [], []
+    for frame, duration in frames:
+        images.append(frame)
+        durations.append(duration)
+    options = {'save_all': True, 'append_images': images[1:], 'duration': durations}
+    if loop is not None:
+        options['loop'] = loop
+    if save_format == 'GIF':
+        options['disposal'] = GIF_DISPOSAL_BACKGROUND
+    animation_io = BytesIO()
+    images[0].save(animation_io, save_format, **options)
+    return animation_io.getvalue()
+
+def resize_animation_data(img, size):
+    """
+    Resize every frame of an animated image.
+
+    Args:
+        img (PIL.Image.Image): The opened animated image.
+        size (tuple): The (width, height) the frames have to fit in.
+
+    Returns:
+        bytes: The bytes of the resized animation in the format of the image.
+    """
+
+    return encode_animation(iter_resized_frames(img, size), img.format, img.info.get('loop'))
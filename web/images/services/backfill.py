@@ -0,0 +1,135 @@
+"""Propagation of account tier changes to the derivatives and thumbnail URLs of existing images"""
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from django.conf import settings
+from django.core.cache import cache
+from ..models import UploadedImage, UserTier
+from .custom_exceptions import ImageTooLarge
+from .derivatives import derivative_path, render_thumbnail, thumbnail_cache_key
+from .jobs import extend_lease, job_handler
+from .perceptual_hash import hash_image
+from .statistics import measure_image
+from .tools import create_placeholder, create_thumbnail_urls
+
+BASE_URL_PATTERN = re.compile(r'https?://[^/\'"]+')
+
+def get_base_url(instance):
+    """
+    Recover the scheme and host the thumbnail URLs of an image were built with.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+
+    Returns:
+    - A string with the scheme and host, the SITE_URL setting when the image has no URLs yet.
+    """
+
+    for thumbnail_url in instance.thumbnails_urls:
+        match = BASE_URL_PATTERN.search(str(thumbnail_url))
+        if match:
+            return match.group()
+    return settings.SITE_URL
+
+def backfill_image(instance, thumbnail_sizes, removed_sizes=()):
+    """
+    Render the missing thumbnails, placeholder and perceptual hash of an image and drop the derivatives of removed sizes.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - thumbnail_sizes: A list of integers representing the heights the tier allows.
+    - removed_sizes: A list of integers representing the heights no longer allowed.
+
+    Returns:
+    - An integer representing the number of rendered thumbnails.
+    """
+
+    rendered = 0
+    if os.path.exists(instance.image_url.path):
+        for height in thumbnail_sizes:
+            if not os.path.exists(derivative_path(instance, f'thumbnail_{height}')):
+                try:
+                    render_thumbnail(instance, height)
+                    rendered += 1
+                except ImageTooLarge:
+                    pass
+        if not instance.placeholder:
+            instance.placeholder = create_placeholder(instance)
+        if instance.perceptual_hash is None:
+            hash_image(instance)
+    for height in removed_sizes:
+        try:
+            os.remove(derivative_path(instance, f'thumbnail_{height}'))
+        except FileNotFoundError:
+            pass
+        cache.delete(thumbnail_cache_key(instance.pk, height))
+    measure_image(instance)
+    return rendered
+
+def backfill_tier(tier, removed_sizes=(), chunk_size=500, workers=None, progress=None):
+    """
+    Propagate the thumbnail sizes of a tier to the existing images of its users.
+    Images are streamed in chunks, the missing thumbnails, placeholders and hashes of a chunk are rendered
+    in parallel and the thumbnail URLs, placeholders and hashes of the chunk are written with a single bulk update.
+
+    Args:
+    - tier: An instance of the `UserTier` model.
+    - removed_sizes: A list of integers representing the heights the tier no longer allows.
+    - chunk_size: An integer representing the number of images processed at once.
+    - workers: An integer representing the number of rendering threads, defaults to the CPU count.
+    - progress: An optional callable receiving the number of processed images, the number of
+      rendered thumbnails and the elapsed seconds after every chunk.
+
+    Returns:
+    - A tuple of the number of processed images and the number of rendered thumbnails.
+    """
+
+    thumbnail_sizes = list(tier.thumbnail_sizes)
+    images = (
+        UploadedImage.objects.filter(user__tier=tier)
+        .only(
+            'pk', 'image_url', 'thumbnails_urls', 'pyramid_levels', 'placeholder', 'perceptual_hash', 'hash_chunks',
+            'original_bytes', 'derivatives', 'derivative_bytes',
+        )
+        .order_by('pk')
+        .iterator(chunk_size=chunk_size)
+    )
+    processed = rendered = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        while True:
+            chunk = list(islice(images, chunk_size))
+            if not chunk:
+                break
+            rendered += sum(executor.map(
+                lambda instance: backfill_image(instance, thumbnail_sizes, removed_sizes),
+                chunk,
+            ))
+            for instance in chunk:
+                instance.thumbnails_urls = create_thumbnail_urls(
+                    None, instance, thumbnail_sizes, base_url=get_base_url(instance)
+                )
+            UploadedImage.objects.bulk_update(chunk, [
+                'thumbnails_urls', 'placeholder', 'perceptual_hash', 'hash_chunks',
+                'original_bytes', 'derivatives', 'derivative_bytes',
+            ])
+            processed += len(chunk)
+            if progress is not None:
+                progress(processed, rendered, time.monotonic() - started)
+    return processed, rendered
+
+@job_handler('backfill_tier')
+def backfill_tier_job(tier_id, removed_sizes):
+    """
+    Job handler propagating a change of the thumbnail sizes of a tier, every chunk is committed and extends the job lease.
+
+    Args:
+    - tier_id: An integer representing the primary key of the `UserTier` model instance.
+    - removed_sizes: A list of integers representing the heights the tier no longer allows.
+    """
+
+    tier = UserTier.objects.filter(pk=tier_id).first()
+    if tier is not None:
+        backfill_tier(tier, removed_sizes, progress=lambda *args: extend_lease())
@@ -0,0 +1,131 @@
+"""True 1-bit binarization of images implemented with vectorized NumPy operations"""
+from io import BytesIO
+import numpy as np
+from PIL import Image
+from .tiling import iter_strips
+
+BINARIZATION_METHODS = ('grayscale', 'threshold', 'otsu', 'dither')
+
+# 8x8 Bayer matrix used for ordered dithering, normalized to the 0-255 range
+BAYER_MATRIX = np.array([
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+], dtype=np.uint16) * 4 + 2
+
+def otsu_threshold(histogram):
+    """
+    Compute the Otsu threshold of a 256-bin grayscale histogram.
+
+    Args:
+        histogram (list): The 256-bin histogram of a grayscale image.
+
+    Returns:
+        int: The threshold that maximizes the between-class variance.
+    """
+
+    counts = np.asarray(histogram[:256], dtype=np.float64)
+    total = counts.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256, dtype=np.float64)
+    weight_background = np.cumsum(counts)
+    weight_foreground = total - weight_background
+    cumulative_mean = np.cumsum(counts * levels)
+    mean_background = cumulative_mean / np.where(weight_background == 0, 1, weight_background)
+    mean_foreground = (cumulative_mean[-1] - cumulative_mean) / np.where(weight_foreground == 0, 1, weight_foreground)
+    between_class_variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+    return int(np.argmax(between_class_variance)) + 1
+
+def binarize_array(gray, method, threshold=128, row_offset=0):
+    """
+    Binarize a grayscale pixel buffer.
+
+    Args:
+        gray (numpy.ndarray): A 2D uint8 array of grayscale pixels.
+        method (str): One of 'threshold', 'otsu' or 'dither'.
+        threshold (int): The threshold used by the 'threshold' and 'otsu' methods.
+        row_offset (int): The index of the first row of the buffer in the whole image,
+            keeps the dithering pattern continuous when an image is processed in strips.
+
+    Returns:
+        numpy.ndarray: A 2D boolean array, True for white pixels.
+
+    Raises:
+        ValueError: If the method is not supported.
+    """
+
+    if method in ('threshold', 'otsu'):
+        return gray >= threshold
+    if method == 'dither':
+        rows = (np.arange(gray.shape[0]) + row_offset) % 8
+        columns = np.arange(gray.shape[1]) % 8
+        return gray >= BAYER_MATRIX[rows[:, None], columns[None, :]]
+    raise ValueError('Unsupported binarization method')
+
+def bits_to_image(bits):
+    """
+    Pack a boolean array into a 1-bit Pillow image.
+
+    Args:
+        bits (numpy.ndarray): A 2D boolean array, True for white pixels.
+
+    Returns:
+        PIL.Image.Image: An image in '1' mode.
+    """
+
+    height, width = bits.shape
+    return Image.frombytes('1', (width, height), np.packbits(bits, axis=1).tobytes())
+
+def binarize(img, method='otsu', threshold=128, strip_height=None):
+    """
+    Create a true 1-bit version of an image.
+
+    Args:
+        img (PIL.Image.Image): The image to binarize.
+        method (str): One of 'threshold', 'otsu' or 'dither'.
+        threshold (int): The threshold used by the 'threshold' method.
+        strip_height (int): When given, the image is converted in strips of this many rows,
+            so only the packed 1-bit result grows with the image size.
+
+    Returns:
+        PIL.Image.Image: An image in '1' mode.
+    """
+
+    if strip_height is None:
+        gray_image = img if img.mode == 'L' else img.convert('L')
+        if method == 'otsu':
+            threshold = otsu_threshold(gray_image.histogram())
+        return bits_to_image(binarize_array(np.asarray(gray_image), method, threshold))
+    if method == 'otsu':
+        histogram = np.zeros(256, dtype=np.int64)
+        for _, strip in iter_strips(img, strip_height):
+            histogram += (strip if strip.mode == 'L' else strip.convert('L')).histogram()
+        threshold = otsu_threshold(histogram)
+    packed_rows = []
+    for top, strip in iter_strips(img, strip_height):
+        gray = np.asarray(strip if strip.mode == 'L' else strip.convert('L'))
+        packed_rows.append(np.packbits(binarize_array(gray, method, threshold, top), axis=1))
+    return Image.frombytes('1', img.size, np.concatenate(packed_rows).tobytes())
+
+def encode_1bit_png(img):
+    """
+    Encode a 1-bit image as a compact PNG.
+
+    Args:
+        img (PIL.Image.Image): An image in '1' mode.
+
+    Returns:
+        bytes: The bytes of the PNG image.
+    """
+
+    png_io = BytesIO()
+    img.save(png_io, 'PNG')
+    png_data = png_io.getvalue()
+    png_io.close()
+    return png_data
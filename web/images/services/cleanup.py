@@ -0,0 +1,160 @@
+"""Removal of the files, derivatives and cached thumbnails of deleted images"""
+import os
+import re
+import shutil
+import time
+from itertools import islice
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import transaction
+from ..models import UploadedImage
+from .derivatives import THUMBNAIL_NAME_PATTERN, thumbnail_cache_key
+from .jobs import job_handler, enqueue_job_on_commit, JOB_PRIORITY_CLEANUP
+from .tools import DERIVATIVE_DIRECTORIES
+
+THUMBNAIL_URL_HEIGHT_PATTERN = re.compile(r'/thumbnail_view/(\d+)/')
+
+def purge_thumbnail_cache(pk, heights):
+    """
+    Remove the cached thumbnails of an image.
+
+    Args:
+    - pk: An integer representing the primary key of the image.
+    - heights: A list of integers representing the heights of the thumbnails.
+    """
+
+    if heights:
+        cache.delete_many([thumbnail_cache_key(pk, height) for height in heights])
+
+def enqueue_image_cleanup(instance):
+    """
+    Purge the cached thumbnails of a deleted image and enqueue removal of its files once the deletion commits.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model being deleted.
+    """
+
+    pk = instance.pk
+    heights = sorted({
+        int(height)
+        for thumbnail_url in instance.thumbnails_urls
+        for height in THUMBNAIL_URL_HEIGHT_PATTERN.findall(str(thumbnail_url))
+    })
+    transaction.on_commit(lambda: purge_thumbnail_cache(pk, heights))
+    enqueue_job_on_commit(
+        'delete_image_files',
+        {'pk': pk, 'image_name': instance.image_url.name, 'heights': heights},
+        key=f'delete_image_files:{pk}',
+        priority=JOB_PRIORITY_CLEANUP,
+    )
+
+@job_handler('delete_image_files')
+def delete_image_files(pk, image_name, heights):
+    """
+    Job handler removing the original, the pyramid and the derivatives of a deleted or rejected image.
+    The original is kept when another image refers to the same file. Thumbnails found in the derivative store are purged from the cache as well, their sizes
+    may no longer be listed in the thumbnail URLs of the image.
+
+    Args:
+    - pk: An integer representing the primary key of the deleted or rejected image.
+    - image_name: A string representing the storage name of the original.
+    - heights: A list of integers representing the heights of the thumbnails listed for the image.
+    """
+
+    try:
+        derivative_names = os.listdir(default_storage.path(f'derivatives/{pk}'))
+    except FileNotFoundError:
+        derivative_names = []
+    heights = set(heights)
+    for name in derivative_names:
+        match = THUMBNAIL_NAME_PATTERN.match(name)
+        if match:
+            heights.add(int(match.group(1)))
+    purge_thumbnail_cache(pk, heights)
+    if image_name and not UploadedImage.objects.filter(image_url=image_name).exclude(pk=pk).exists():
+        default_storage.delete(image_name)
+    for directory in DERIVATIVE_DIRECTORIES:
+        shutil.rmtree(default_storage.path(f'{directory}/{pk}'), ignore_errors=True)
+
+def iter_batches(iterable, batch_size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def iter_old_entries(directory, min_age):
+    """
+    Scan a storage directory lazily, skipping entries modified within the last min_age seconds,
+    they may belong to uploads whose rows are not committed yet.
+
+    Args:
+    - directory: A string representing the storage name of the directory.
+    - min_age: An integer representing the number of seconds.
+
+    Yields:
+    - os.DirEntry objects of the directory.
+    """
+
+    try:
+        entries = os.scandir(default_storage.path(directory))
+    except FileNotFoundError:
+        return
+    modified_before = time.time() - min_age
+    with entries:
+        for entry in entries:
+            if entry.stat().st_mtime < modified_before:
+                yield entry
+
+def iter_orphans(batch_size=500, min_age=3600):
+    """
+    Find stored files no longer referenced by any image, the storage is compared with the database
+    one batch of entries at a time.
+
+    Args:
+    - batch_size: An integer representing the number of entries checked with a single query.
+    - min_age: An integer representing the number of seconds files must be unmodified to be considered.
+
+    Yields:
+    - Paths of unreferenced originals, and of pyramid and derivative directories of deleted images.
+    """
+
+    originals = (entry for entry in iter_old_entries('images', min_age) if entry.is_file())
+    for batch in iter_batches(originals, batch_size):
+        names = {f'images/{entry.name}': entry.path for entry in batch}
+        referenced = set(UploadedImage.objects.filter(image_url__in=names).values_list('image_url', flat=True))
+        for name, path in names.items():
+            if name not in referenced:
+                yield path
+    for directory in DERIVATIVE_DIRECTORIES:
+        image_directories = (
+            entry for entry in iter_old_entries(directory, min_age) if entry.is_dir() and entry.name.isdigit()
+        )
+        for batch in iter_batches(image_directories, batch_size):
+            paths = {int(entry.name): entry.path for entry in batch}
+            existing = set(UploadedImage.objects.filter(pk__in=paths).values_list('pk', flat=True))
+            for pk, path in paths.items():
+                if pk not in existing:
+                    yield path
+
+def remove_path(path):
+    """
+    Remove a file or a directory tree.
+
+    Args:
+    - path: A string representing the path.
+
+    Returns:
+    - An integer representing the number of bytes freed.
+    """
+
+    if os.path.isdir(path):
+        size = sum(
+            os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+        )
+        shutil.rmtree(path, ignore_errors=True)
+        return size
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    return size
@@ -0,0 +1,59 @@
+"""Background flushing of the process wide counters buffered in memory"""
+import atexit
+import os
+import threading
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+class BackgroundFlusher:
+    """
+    Flushes a process wide counter from a daemon thread every interval seconds, whether requests come in or not,
+    and once more when the process exits, uWSGI runs the atexit functions when it stops a worker.
+    The thread is started by the first count of every process, so workers forked from the master start their own.
+    Flushes use the connection of the thread, outside the transactions of the requests and jobs doing the counting,
+    and the connection is closed after every flush.
+    """
+
+    def __init__(self, flush, interval_setting):
+        self.flush = flush
+        self.interval_setting = interval_setting
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.pid = None
+
+    def notify(self, flush_now=False):
+        """
+        Start the thread of the current process when needed.
+
+        Args:
+        - flush_now: A boolean, True wakes the thread to flush before the interval is over.
+        """
+
+        if self.pid != os.getpid():
+            self.start()
+        if flush_now:
+            self.wake.set()
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            if self.pid is None:
+                atexit.register(self.flush_and_close)
+            self.pid = os.getpid()
+            self.wake = threading.Event()
+            threading.Thread(target=self.run, args=(self.wake,), name=f'flush-{self.interval_setting.lower()}', daemon=True).start()
+
+    def run(self, wake):
+        while True:
+            wake.wait(getattr(settings, self.interval_setting))
+            wake.clear()
+            self.flush_and_close()
+
+    def flush_and_close(self):
+        try:
+            self.flush()
+        except DatabaseError: # the counts are lost, counters are statistics and the next flush writes new ones
+            pass
+        finally:
+            connection.close()
@@ -4,4 +4,25 @@ class InvalidExpirationSeconds(Exception):
     pass
 
 class InvalidExpirationRange(Exception):
+    pass
+
+class InvalidBinarizationMethod(Exception):
+    pass
+
+class ImageTooLarge(Exception):
+    pass
+
+class InvalidThumbnailBatch(Exception):
+    pass
+
+class InvalidImageIds(Exception):
+    pass
+
+class InvalidStatusWait(Exception):
+    pass
+
+class DuplicateImage(Exception):
+    pass
+
+class UndecodableImage(Exception):
     pass
\ No newline at end of file
@@ -0,0 +1,331 @@
+"""Derivative store keeping rendered thumbnails next to the originals"""
+import os
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.http import Http404
+from django.core.files.storage import default_storage
+from ..models import UploadedImage
+from .custom_exceptions import ImageTooLarge
+from .jobs import job_handler, enqueue_job_on_commit
+from .metrics import registry, timed
+from .popularity import most_requested, thumbnail_hits
+from .statistics import refresh_derivative_usage, stats_counter
+from .tools import create_thumbnail_data, select_pyramid_source
+
+THUMBNAIL_NAME_PATTERN = re.compile(r'^thumbnail_(\d+)\.')
+
+def thumbnail_cache_key(pk, height):
+    """
+    Build the cache key of a thumbnail.
+
+    Args:
+    - pk: An integer representing the primary key of the `UploadedImage` model instance.
+    - height: An integer representing the height of the thumbnail.
+
+    Returns:
+    - A string representing the cache key.
+    """
+
+    return f"thumbnail_{pk}_{height}"
+
+def derivative_path(instance, name):
+    """
+    Build the path of a derivative in the derivative store.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - name: A string representing the name of the derivative, e.g. "thumbnail_200".
+
+    Returns:
+    - A string representing the path to the derivative, it keeps the extension of the original.
+    """
+
+    extension = instance.image_url.name.split('.')[-1].lower()
+    return default_storage.path(f'derivatives/{instance.pk}/{name}.{extension}')
+
+def read_derivative(instance, name):
+    """
+    Read a derivative from the derivative store.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - name: A string representing the name of the derivative.
+
+    Returns:
+    - The bytes of the derivative, or None when it has not been rendered yet.
+    """
+
+    try:
+        with open(derivative_path(instance, name), 'rb') as derivative_file:
+            return derivative_file.read()
+    except FileNotFoundError:
+        return None
+
+def write_derivative(instance, name, data):
+    """
+    Atomically write a derivative to the derivative store, concurrent readers never see a partial file.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - name: A string representing the name of the derivative.
+    - data: The bytes of the derivative.
+    """
+
+    path = derivative_path(instance, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def count_cache_request(cache_name, hit):
+    """Count a cache lookup in the metrics of the process and in the daily cache statistics of the dashboard"""
+    registry.count_cache_request(cache_name, hit)
+    stats_counter.record_cache(cache_name, hit)
+
+def render_thumbnail(instance, height):
+    """
+    Render a thumbnail into the derivative store and the cache.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - height: An integer representing the height of the thumbnail.
+
+    Returns:
+    - The bytes of the thumbnail.
+    """
+
+    started = time.perf_counter()
+    thumbnail_data = create_thumbnail_data(select_pyramid_source(instance, height), height)
+    stats_counter.record_render(instance.pk, (time.perf_counter() - started) * 1000)
+    write_derivative(instance, f'thumbnail_{height}', thumbnail_data)
+    cache.set(thumbnail_cache_key(instance.pk, height), thumbnail_data)
+    return thumbnail_data
+
+def load_thumbnail_data(instance, height):
+    """
+    Load a thumbnail from the cache, then from the derivative store, rendering it only when both miss.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - height: An integer representing the height of the thumbnail.
+
+    Returns:
+    - The bytes of the thumbnail.
+
+    Raises:
+    - ImageTooLarge: If rendering the thumbnail would exceed the transform memory budget.
+    """
+
+    cache_key = thumbnail_cache_key(instance.pk, height)
+    with timed('cache'):
+        thumbnail_data = cache.get(cache_key)
+    count_cache_request('memory', thumbnail_data is not None)
+    if thumbnail_data is None:
+        thumbnail_data = load_uncached_thumbnail_data(instance, height)
+    return thumbnail_data
+
+def load_uncached_thumbnail_data(instance, height):
+    """
+    Load a thumbnail missing from the cache from the derivative store, rendering it when the store misses too.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - height: An integer representing the height of the thumbnail.
+
+    Returns:
+    - The bytes of the thumbnail.
+
+    Raises:
+    - ImageTooLarge: If rendering the thumbnail would exceed the transform memory budget.
+    """
+
+    with timed('store'):
+        thumbnail_data = read_derivative(instance, f'thumbnail_{height}')
+    count_cache_request('store', thumbnail_data is not None)
+    if thumbnail_data is None:
+        return render_thumbnail(instance, height)
+    cache.set(thumbnail_cache_key(instance.pk, height), thumbnail_data)
+    return thumbnail_data
+
+def load_pooled_thumbnail_data(instance, height):
+    """
+    Load a thumbnail missing from the cache in a thread of a pool. The database connection of the thread is closed
+    afterwards, connections of pool threads are never closed otherwise and would be inherited by forked workers.
+    """
+
+    try:
+        return load_uncached_thumbnail_data(instance, height)
+    finally:
+        connection.close()
+
+def iter_thumbnails_data(thumbnails, max_workers=None):
+    """
+    Load the thumbnails of many images with a single cache round trip, cache misses are filled in parallel.
+
+    Args:
+    - thumbnails: A list of (instance, height) tuples of `UploadedImage` instances and thumbnail heights.
+    - max_workers: An integer limiting the parallel loads of missed thumbnails, defaults to THUMBNAIL_BATCH_WORKERS.
+
+    Yields:
+    - (instance, height, data) tuples as soon as each thumbnail is available, cache hits first. The data is
+      the bytes of the thumbnail, or the ImageTooLarge or Http404 exception when it could not be rendered.
+    """
+
+    cache_keys = {thumbnail_cache_key(instance.pk, height): (instance, height) for instance, height in thumbnails}
+    with timed('cache'):
+        cached = cache.get_many(cache_keys) if cache_keys else {}
+    misses = []
+    for cache_key, (instance, height) in cache_keys.items():
+        count_cache_request('memory', cache_key in cached)
+        if cache_key in cached:
+            yield instance, height, cached[cache_key]
+        else:
+            misses.append((instance, height))
+    if not misses:
+        return
+    with ThreadPoolExecutor(max_workers=min(len(misses), max_workers or settings.THUMBNAIL_BATCH_WORKERS)) as executor:
+        futures = {
+            executor.submit(load_pooled_thumbnail_data, instance, height): (instance, height)
+            for instance, height in misses
+        }
+        for future in as_completed(futures):
+            instance, height = futures[future]
+            try:
+                thumbnail_data = future.result()
+            except (ImageTooLarge, Http404) as err:
+                thumbnail_data = err
+            yield instance, height, thumbnail_data
+
+@job_handler('render_thumbnail')
+def render_thumbnail_job(pk, height):
+    """
+    Job handler pre-rendering a thumbnail into the derivative store.
+
+    Args:
+    - pk: An integer representing the primary key of the `UploadedImage` model instance.
+    - height: An integer representing the height of the thumbnail.
+    """
+
+    instance = UploadedImage.objects.filter(pk=pk).first()
+    if instance is None or not os.path.exists(instance.image_url.path):
+        return
+    render_thumbnail(instance, height)
+
+def enqueue_thumbnails(instance, thumbnail_sizes, priority):
+    """
+    Enqueue rendering of the thumbnails of an image once the current transaction commits.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - thumbnail_sizes: A list of integers representing the heights of the thumbnails.
+    - priority: An integer representing the priority of the jobs.
+    """
+
+    for height in thumbnail_sizes:
+        enqueue_job_on_commit(
+            'render_thumbnail',
+            {'pk': instance.pk, 'height': height},
+            key=f'render_thumbnail:{instance.pk}:{height}',
+            priority=priority,
+        )
+
+def warm_thumbnail_cache(top, days=None, workers=None):
+    """
+    Load the most requested thumbnails into the cache, rendering the ones missing from the derivative store.
+    Thumbnails of sizes the tier of the image no longer allows are skipped.
+
+    Args:
+    - top: An integer representing the number of most requested thumbnails to load.
+    - days: An integer limiting the thumbnails to the ones requested within the last days, None for all.
+    - workers: An integer limiting the parallel loads, defaults to THUMBNAIL_BATCH_WORKERS.
+
+    Returns:
+    - A tuple of the numbers of thumbnails found in the cache, loaded into it and failed to load.
+    """
+
+    thumbnails = [
+        (access.image, access.height)
+        for access in most_requested(top, days)
+        if access.image.user.tier is not None and access.height in access.image.user.tier.thumbnail_sizes
+    ]
+    cache_keys = [thumbnail_cache_key(instance.pk, height) for instance, height in thumbnails]
+    cached = cache.get_many(cache_keys) if cache_keys else {}
+    misses = [thumbnail for thumbnail, cache_key in zip(thumbnails, cache_keys) if cache_key not in cached]
+    loaded = failed = 0
+    with ThreadPoolExecutor(max_workers=workers or settings.THUMBNAIL_BATCH_WORKERS) as executor:
+        futures = [executor.submit(load_pooled_thumbnail_data, instance, height) for instance, height in misses]
+        for future in as_completed(futures):
+            try:
+                future.result()
+                loaded += 1
+            except (ImageTooLarge, Http404, OSError):
+                failed += 1
+    return len(cached), loaded, failed
+
+def iter_thumbnail_files():
+    """
+    Scan the derivative store for stored thumbnails.
+
+    Yields:
+    - (pk, height, path, stat) tuples of the thumbnails, stat is the os.stat_result of the file.
+    """
+
+    try:
+        image_directories = os.scandir(default_storage.path('derivatives'))
+    except FileNotFoundError:
+        return
+    with image_directories:
+        for image_directory in image_directories:
+            if not image_directory.name.isdigit() or not image_directory.is_dir():
+                continue
+            with os.scandir(image_directory.path) as entries:
+                for entry in entries:
+                    match = THUMBNAIL_NAME_PATTERN.match(entry.name)
+                    if match and entry.is_file():
+                        yield int(image_directory.name), int(match.group(1)), entry.path, entry.stat()
+
+def evict_derivatives(max_bytes, dry_run=False):
+    """
+    Trim the derivative store down to max_bytes. The least requested thumbnails are evicted first and
+    among equally requested ones the least recently written, evicted thumbnails are rendered again on demand.
+
+    Args:
+    - max_bytes: An integer representing the size the derivative store may take.
+    - dry_run: A boolean, True only counts the thumbnails that would be evicted.
+
+    Returns:
+    - A tuple of the number of evicted thumbnails, the bytes freed and the bytes the store takes afterwards.
+    """
+
+    thumbnail_files = list(iter_thumbnail_files())
+    stored = sum(stat.st_size for _, _, _, stat in thumbnail_files)
+    if stored <= max_bytes:
+        return 0, 0, stored
+    hits = thumbnail_hits()
+    thumbnail_files.sort(key=lambda thumbnail: (hits.get(thumbnail[:2], 0), thumbnail[3].st_mtime))
+    evicted = freed = 0
+    evicted_pks = set()
+    for pk, height, path, stat in thumbnail_files:
+        if stored - freed <= max_bytes:
+            break
+        if not dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+        evicted += 1
+        freed += stat.st_size
+        evicted_pks.add(pk)
+    if not dry_run:
+        refresh_derivative_usage(evicted_pks)
+    return evicted, freed, stored - freed
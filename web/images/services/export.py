@@ -0,0 +1,102 @@
+"""Streaming ZIP export of the images of a user"""
+import os
+import zipfile
+from datetime import datetime
+from django.core.cache import cache
+from ..models import UploadedImage
+from .custom_exceptions import ImageTooLarge
+from .derivatives import read_derivative, thumbnail_cache_key, write_derivative
+from .tools import create_thumbnail_data, select_pyramid_source
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_QUERY_CHUNK_SIZE = 200
+
+class ZipStream:
+    """
+    Write-only file object collecting the bytes zipfile writes until the export generator yields them.
+    It has no seek method, so zipfile writes data descriptors instead of rewinding to patch local headers.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def load_export_thumbnail_data(instance, height):
+    """
+    Load a thumbnail for an export from the cache or the derivative store, rendering it into the store when missing.
+    Rendered thumbnails are not cached, so an export does not evict the thumbnails other requests use.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - height: An integer representing the height of the thumbnail.
+
+    Returns:
+    - The bytes of the thumbnail.
+
+    Raises:
+    - ImageTooLarge: If rendering the thumbnail would exceed the transform memory budget.
+    """
+
+    thumbnail_data = cache.get(thumbnail_cache_key(instance.pk, height))
+    if thumbnail_data is None:
+        thumbnail_data = read_derivative(instance, f'thumbnail_{height}')
+    if thumbnail_data is None:
+        thumbnail_data = create_thumbnail_data(select_pyramid_source(instance, height), height)
+        write_derivative(instance, f'thumbnail_{height}', thumbnail_data)
+    return thumbnail_data
+
+def iter_export_zip(user):
+    """
+    Generate a ZIP archive of the images of a user chunk by chunk.
+    Images are read from the database in batches and files are copied in EXPORT_CHUNK_SIZE pieces,
+    so memory use does not depend on the size of the library. JPEG and PNG files are already compressed
+    and are stored without compression.
+
+    Args:
+    - user: An instance of the `AppUser` model.
+
+    Yields:
+    - The bytes of the archive. Originals are included when the account tier allows them, as
+      "<pk>/<name>", thumbnails of the tier sizes as "<pk>/thumbnails/<height>px_<name>".
+    """
+
+    stream = ZipStream()
+    tier = user.tier
+    with zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        images = UploadedImage.objects.filter(user=user).order_by('pk').iterator(chunk_size=EXPORT_QUERY_CHUNK_SIZE)
+        for image in images:
+            path = image.image_url.path
+            if not os.path.exists(path):
+                continue
+            name = os.path.basename(path)
+            if tier.original_image:
+                entry = zipfile.ZipInfo(f'{image.pk}/{name}', datetime.fromtimestamp(os.path.getmtime(path)).timetuple()[:6])
+                entry.file_size = os.path.getsize(path)
+                with open(path, 'rb') as original_file, archive.open(entry, mode='w') as archive_file:
+                    for chunk in iter(lambda: original_file.read(EXPORT_CHUNK_SIZE), b''):
+                        archive_file.write(chunk)
+                        yield stream.drain()
+            for height in tier.thumbnail_sizes:
+                try:
+                    thumbnail_data = load_export_thumbnail_data(image, height)
+                except ImageTooLarge:
+                    continue
+                archive.writestr(f'{image.pk}/thumbnails/{height}px_{name}', thumbnail_data)
+                yield stream.drain()
+    yield stream.drain()
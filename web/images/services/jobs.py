@@ -0,0 +1,175 @@
+"""
+Lightweight Postgres backed job queue.
+Workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED and lease them for IMAGE_JOB_LEASE_SECONDS,
+a crashed worker stops extending the lease and its job is claimed again once the lease expires.
+"""
+import datetime
+import threading
+import traceback
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from ..models import ImageJob
+
+JOB_HANDLERS = {}
+running_job = threading.local()
+
+JOB_PRIORITY_UPLOAD = 10
+JOB_PRIORITY_TIER_CHANGE = 5
+JOB_PRIORITY_WARM_UP = 0
+JOB_PRIORITY_BULK = -1
+JOB_PRIORITY_CLEANUP = -5
+
+def job_handler(kind):
+    """
+    A decorator that registers a function as the handler of a job kind.
+    The handler receives the job payload as keyword arguments.
+
+    Args:
+        kind (str): The kind of jobs the function handles.
+
+    Returns:
+        The decorator registering the handler.
+    """
+
+    def decorator(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+def enqueue_job(kind, payload, key=None, priority=0):
+    """
+    Enqueue a job, jobs are idempotent by their key.
+    A pending or running job with the same key is left untouched, a finished one is queued again.
+
+    Args:
+        kind (str): The kind of the job.
+        payload (dict): JSON serializable keyword arguments of the job handler.
+        key (str): The idempotency key of the job, defaults to the kind and the payload.
+        priority (int): Jobs with higher priority run first.
+
+    Returns:
+        ImageJob: The queued job.
+    """
+
+    if key is None:
+        key = ':'.join([kind] + [f'{name}={value}' for name, value in sorted(payload.items())])
+    job, created = ImageJob.objects.get_or_create(
+        key=key,
+        defaults={
+            'kind': kind,
+            'payload': payload,
+            'priority': priority,
+            'max_attempts': settings.IMAGE_JOB_MAX_ATTEMPTS,
+        },
+    )
+    if not created and job.status not in (ImageJob.PENDING, ImageJob.RUNNING):
+        ImageJob.objects.filter(pk=job.pk).exclude(status__in=[ImageJob.PENDING, ImageJob.RUNNING]).update(
+            kind=kind,
+            payload=payload,
+            priority=priority,
+            status=ImageJob.PENDING,
+            attempts=0,
+            run_after=timezone.now(),
+            last_error='',
+        )
+    return job
+
+def enqueue_job_on_commit(kind, payload, key=None, priority=0):
+    """
+    Enqueue a job once the current transaction commits, so workers never see rows that do not exist yet.
+
+    Args:
+        kind (str): The kind of the job.
+        payload (dict): JSON serializable keyword arguments of the job handler.
+        key (str): The idempotency key of the job.
+        priority (int): Jobs with higher priority run first.
+    """
+
+    transaction.on_commit(lambda: enqueue_job(kind, payload, key, priority))
+
+def claim_next_job():
+    """
+    Claim the next due job with the highest priority in a short transaction of its own.
+    The attempt is recorded before the job runs, so a job that kills its worker runs out of attempts too.
+    Running jobs whose lease expired are claimed again, or failed when they have no attempts left.
+
+    Returns:
+        ImageJob: The claimed job, or None when no job is due.
+    """
+
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            ImageJob.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ImageJob.PENDING, run_after__lte=now)
+                | Q(status=ImageJob.RUNNING, leased_until__lt=now)
+            )
+            .order_by('-priority', 'run_after', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+        if job.status == ImageJob.RUNNING and job.attempts >= job.max_attempts:
+            job.status = ImageJob.FAILED
+            job.leased_until = None
+            job.last_error = 'The worker running the job stopped before it finished'
+        else:
+            job.status = ImageJob.RUNNING
+            job.attempts += 1
+            job.leased_until = now + datetime.timedelta(seconds=settings.IMAGE_JOB_LEASE_SECONDS)
+        job.save(update_fields=['status', 'attempts', 'leased_until', 'last_error', 'updated_at'])
+    return job
+
+def extend_lease():
+    """
+    Extend the lease of the job running in the current thread, called by long job handlers as they progress.
+    """
+
+    job = getattr(running_job, 'job', None)
+    if job is not None:
+        job.leased_until = timezone.now() + datetime.timedelta(seconds=settings.IMAGE_JOB_LEASE_SECONDS)
+        ImageJob.objects.filter(pk=job.pk, attempts=job.attempts).update(leased_until=job.leased_until)
+
+def run_next_job():
+    """
+    Claim and run the next due job with the highest priority.
+    The handler runs outside of any transaction, so long handlers commit their work as they go
+    and hold no locks, and its outcome is recorded in a transaction of its own.
+    Failed jobs are retried with an exponential backoff until they run out of attempts.
+
+    Returns:
+        ImageJob: The job that was run, or None when the queue is empty.
+    """
+
+    job = claim_next_job()
+    if job is None or job.status == ImageJob.FAILED:
+        return job
+    running_job.job = job
+    try:
+        JOB_HANDLERS[job.kind](**job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = ImageJob.FAILED
+        else:
+            job.status = ImageJob.PENDING
+            delay = settings.IMAGE_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            job.run_after = timezone.now() + datetime.timedelta(seconds=delay)
+    else:
+        job.status = ImageJob.DONE
+        job.last_error = ''
+    finally:
+        running_job.job = None
+    job.leased_until = None
+    # A job whose lease expired meanwhile belongs to the worker that claimed it again
+    ImageJob.objects.filter(pk=job.pk, status=ImageJob.RUNNING, attempts=job.attempts).update(
+        status=job.status,
+        run_after=job.run_after,
+        leased_until=None,
+        last_error=job.last_error,
+        updated_at=timezone.now(),
+    )
+    return job
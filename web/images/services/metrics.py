@@ -0,0 +1,157 @@
+"""
+Lightweight in-process instrumentation of the image pipeline.
+Stage timings are collected per request for the Server-Timing header and aggregated per process
+into histograms and counters rendered in the Prometheus text format.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+request_timings = contextvars.ContextVar('request_timings', default=None)
+
+class Histogram:
+    """Cumulative histogram of observed values"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+class MetricsRegistry:
+    """Process wide registry of the image pipeline metrics"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage_durations = {}
+        self.cache_requests = {}
+        self.bytes_served = {}
+        self.transforms_in_flight = 0
+
+    def observe_stage(self, stage, duration):
+        with self.lock:
+            self.stage_durations.setdefault(stage, Histogram()).observe(duration)
+
+    def count_cache_request(self, cache_name, hit):
+        key = (cache_name, 'hit' if hit else 'miss')
+        with self.lock:
+            self.cache_requests[key] = self.cache_requests.get(key, 0) + 1
+
+    def count_bytes_served(self, view, size):
+        with self.lock:
+            self.bytes_served[view] = self.bytes_served.get(view, 0) + size
+
+    def change_transforms_in_flight(self, delta):
+        with self.lock:
+            self.transforms_in_flight += delta
+
+    def reset(self):
+        """Drop the collected metrics, e.g. the ones of a warm-up in the master of the app server"""
+        with self.lock:
+            self.stage_durations = {}
+            self.cache_requests = {}
+            self.bytes_served = {}
+
+    def render(self):
+        """
+        Render the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics of this process.
+        """
+
+        lines = [
+            '# HELP imageocean_stage_duration_seconds Duration of image pipeline stages.',
+            '# TYPE imageocean_stage_duration_seconds histogram',
+        ]
+        with self.lock:
+            for stage, histogram in sorted(self.stage_durations.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'imageocean_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'imageocean_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'imageocean_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'imageocean_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines += [
+                '# HELP imageocean_cache_requests_total Derivative lookups by cache and result.',
+                '# TYPE imageocean_cache_requests_total counter',
+            ]
+            for (cache_name, result), count in sorted(self.cache_requests.items()):
+                lines.append(f'imageocean_cache_requests_total{{cache="{cache_name}",result="{result}"}} {count}')
+            lines += [
+                '# HELP imageocean_cache_hit_ratio Share of derivative lookups served by the cache.',
+                '# TYPE imageocean_cache_hit_ratio gauge',
+            ]
+            for cache_name in sorted({cache_name for cache_name, _ in self.cache_requests}):
+                hits = self.cache_requests.get((cache_name, 'hit'), 0)
+                total = hits + self.cache_requests.get((cache_name, 'miss'), 0)
+                lines.append(f'imageocean_cache_hit_ratio{{cache="{cache_name}"}} {hits / total:.4f}')
+            lines += [
+                '# HELP imageocean_bytes_served_total Image bytes sent in responses.',
+                '# TYPE imageocean_bytes_served_total counter',
+            ]
+            for view, size in sorted(self.bytes_served.items()):
+                lines.append(f'imageocean_bytes_served_total{{view="{view}"}} {size}')
+            lines += [
+                '# HELP imageocean_transforms_in_flight Image transforms currently running.',
+                '# TYPE imageocean_transforms_in_flight gauge',
+                f'imageocean_transforms_in_flight {self.transforms_in_flight}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+@contextmanager
+def timed(stage):
+    """
+    Measure a stage of the image pipeline.
+    The duration is added to the stage histogram and to the timings of the current request.
+
+    Args:
+        stage (str): The name of the stage, e.g. "db", "decode" or "encode".
+    """
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        registry.observe_stage(stage, duration)
+        timings = request_timings.get()
+        if timings is not None:
+            timings.append((stage, duration))
+
+@contextmanager
+def track_transform():
+    """Count an image transform as in flight while it runs"""
+    registry.change_transforms_in_flight(1)
+    try:
+        yield
+    finally:
+        registry.change_transforms_in_flight(-1)
+
+def server_timing_header(timings):
+    """
+    Build the value of the Server-Timing header.
+    Repeated stages of a request are summed up.
+
+    Args:
+        timings (list): A list of (stage, duration in seconds) tuples.
+
+    Returns:
+        str: The header value with durations in milliseconds.
+    """
+
+    totals = {}
+    for stage, duration in timings:
+        totals[stage] = totals.get(stage, 0.0) + duration
+    return ', '.join(f'{stage};dur={duration * 1000:.2f}' for stage, duration in totals.items())
@@ -0,0 +1,249 @@
+"""Upload-time normalization of originals: EXIF orientation, metadata removal and the size cap of the tier"""
+import math
+import os
+import tempfile
+from io import BytesIO
+from django.conf import settings
+from PIL import Image, ImageOps
+from .animation import animation_decoded_bytes, is_animated, resize_animation_data
+from .custom_exceptions import ImageTooLarge
+from .metrics import timed
+from .tools import check_memory_budget, estimate_decoded_bytes
+from .validators import image_save_format
+
+NORMALIZED_JPEG_QUALITY = 90
+EXIF_ORIENTATION = 0x0112
+# APP1 (EXIF, XMP), APP13 (IPTC) and COM segments, the ICC profile (APP2) and Adobe color transform (APP14) are kept
+JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE}
+JPEG_METADATA_SEGMENTS = {'APP1', 'APP13', 'COM'}
+# EXIF and XMP chunks of WebP and their flags in the VP8X header, the ICC profile (ICCP) is kept
+WEBP_METADATA_CHUNKS = {b'EXIF', b'XMP '}
+WEBP_METADATA_FLAGS = 0x08 | 0x04
+
+def strip_jpeg_metadata(data, primary_only=False):
+    """
+    Remove the metadata segments of a JPEG image without decoding it, the compressed image data is copied as is.
+
+    Args:
+        data (bytes): The bytes of the JPEG image.
+        primary_only (bool): Keep only the primary picture of a multi-picture JPEG (MPO), the MPF segment
+            and the pictures appended after its end of image marker are removed.
+
+    Returns:
+        bytes: The bytes of the image without EXIF, XMP, IPTC and comment segments.
+
+    Raises:
+        ValueError: If the segment structure of the image is invalid.
+    """
+
+    if data[:2] != b'\xff\xd8':
+        raise ValueError('Not a JPEG image')
+    segments = [data[:2]]
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise ValueError('Invalid JPEG marker')
+        marker = data[position + 1]
+        if marker == 0xFF: # fill byte
+            position += 1
+            continue
+        if marker in (0xDA, 0xD9): # start of scan, the rest is image data
+            # 0xFF bytes are stuffed in the entropy coded data, the first end of image marker ends the primary picture
+            end = data.find(b'\xff\xd9', position) if primary_only else -1
+            segments.append(data[position:] if end < 0 else data[position:end + 2])
+            return b''.join(segments)
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01: # markers without a length
+            segments.append(data[position:position + 2])
+            position += 2
+            continue
+        segment_end = position + 2 + int.from_bytes(data[position + 2:position + 4], 'big')
+        is_mpf = marker == 0xE2 and data[position + 4:position + 8] == b'MPF\x00'
+        if marker not in JPEG_METADATA_MARKERS and not (primary_only and is_mpf):
+            segments.append(data[position:segment_end])
+        position = segment_end
+    raise ValueError('JPEG image has no image data')
+
+def iter_webp_chunks(data):
+    """
+    Split a WebP image into the chunks of its RIFF container.
+
+    Args:
+        data (bytes): The bytes of the WebP image.
+
+    Yields:
+        tuple: (fourcc, chunk) tuples, chunk holds the header, the payload and the padding byte of the chunk.
+
+    Raises:
+        ValueError: If the container structure of the image is invalid.
+    """
+
+    if data[:4] != b'RIFF' or data[8:12] != b'WEBP':
+        raise ValueError('Not a WebP image')
+    position = 12
+    while position < len(data):
+        if position + 8 > len(data):
+            raise ValueError('Truncated WebP chunk')
+        size = int.from_bytes(data[position + 4:position + 8], 'little')
+        chunk_end = position + 8 + size + (size & 1)
+        if chunk_end > len(data):
+            raise ValueError('Truncated WebP chunk')
+        yield data[position:position + 4], data[position:chunk_end]
+        position = chunk_end
+
+def strip_webp_metadata(data):
+    """
+    Remove the EXIF and XMP chunks of a WebP image without decoding it, the compressed image data is copied as is.
+
+    Args:
+        data (bytes): The bytes of the WebP image.
+
+    Returns:
+        bytes: The bytes of the image without EXIF and XMP chunks.
+
+    Raises:
+        ValueError: If the container structure of the image is invalid.
+    """
+
+    chunks = []
+    for fourcc, chunk in iter_webp_chunks(data):
+        if fourcc in WEBP_METADATA_CHUNKS:
+            continue
+        if fourcc == b'VP8X':
+            chunk = chunk[:8] + bytes([chunk[8] & ~WEBP_METADATA_FLAGS]) + chunk[9:]
+        chunks.append(chunk)
+    body = b'WEBP' + b''.join(chunks)
+    return b'RIFF' + len(body).to_bytes(4, 'little') + body
+
+def is_lossless_webp(data):
+    """
+    Check whether a WebP image is compressed losslessly (VP8L), it is then re-encoded losslessly too.
+
+    Args:
+        data (bytes): The bytes of the WebP image.
+
+    Returns:
+        bool: True if the image data is a VP8L chunk.
+    """
+
+    try:
+        return any(fourcc == b'VP8L' for fourcc, _ in iter_webp_chunks(data))
+    except ValueError:
+        return False
+
+def has_metadata(img):
+    """
+    Check whether an opened image carries metadata normalization removes.
+
+    Args:
+        img (PIL.Image.Image): The opened image.
+
+    Returns:
+        bool: True if the image has EXIF data, XMP, IPTC, comments or text chunks.
+    """
+
+    if img.format in ('JPEG', 'MPO'):
+        return any(name in JPEG_METADATA_SEGMENTS for name, _ in img.applist)
+    return 'exif' in img.info or any(isinstance(value, str) for value in img.info.values())
+
+def normalize_image_data(data, max_dimension=0):
+    """
+    Normalize the bytes of an image: apply the EXIF orientation, remove metadata and downscale it so its
+    longer side does not exceed max_dimension. JPEG and WebP images which only carry metadata are stripped without
+    re-encoding, lossless WebP images are re-encoded losslessly, JPEG images downscaled on decode are decoded
+    at reduced scale. The ICC profile is kept.
+    Animated images are only downscaled, frame by frame, their orientation and metadata are kept.
+
+    Args:
+        data (bytes): The bytes of the image.
+        max_dimension (int): The longest side the image may have, 0 keeps the size.
+
+    Returns:
+        bytes: The bytes of the normalized image, or None when the image needs no normalization.
+
+    Raises:
+        ImageTooLarge: If decoding the image would exceed the transform memory budget.
+    """
+
+    img = Image.open(BytesIO(data))
+    save_format = image_save_format(img)
+    if is_animated(img):
+        if not max_dimension or max(img.size) <= max_dimension:
+            return None
+        ratio = max_dimension / max(img.size)
+        size = (max(1, round(img.width * ratio)), max(1, round(img.height * ratio)))
+        check_memory_budget(animation_decoded_bytes(img, size))
+        return resize_animation_data(img, size)
+    orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+    resize = bool(max_dimension) and max(img.size) > max_dimension
+    if orientation == 1 and not resize:
+        if not has_metadata(img):
+            return None
+        if save_format == 'JPEG':
+            try:
+                return strip_jpeg_metadata(data, primary_only=img.format == 'MPO')
+            except ValueError:
+                pass
+        if save_format == 'WEBP':
+            try:
+                return strip_webp_metadata(data)
+            except ValueError:
+                pass
+    if resize:
+        ratio = max_dimension / max(img.size)
+        img.draft(None, (math.ceil(img.width * ratio), math.ceil(img.height * ratio)))
+    check_memory_budget(estimate_decoded_bytes(img))
+    icc_profile = img.info.get('icc_profile')
+    transparency = img.info.get('transparency')
+    img = ImageOps.exif_transpose(img)
+    if resize:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    normalized_io = BytesIO()
+    if save_format == 'JPEG':
+        img.save(normalized_io, 'JPEG', quality=NORMALIZED_JPEG_QUALITY, optimize=True, icc_profile=icc_profile)
+    else:
+        options = {'icc_profile': icc_profile} if icc_profile else {}
+        if transparency is not None:
+            options['transparency'] = transparency
+        if save_format == 'WEBP' and is_lossless_webp(data):
+            options['lossless'] = True
+        img.save(normalized_io, save_format, **options)
+    normalized_data = normalized_io.getvalue()
+    if orientation == 1 and not resize and len(normalized_data) >= len(data):
+        return None # stripping the metadata by re-encoding would not shrink the image
+    return normalized_data
+
+def normalize_original(instance):
+    """
+    Normalize the stored original of an uploaded image in place, with the size cap of the account tier.
+    Nothing is done when the NORMALIZE_ORIGINALS setting is off or the image is too large to be decoded.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model with its user and tier.
+
+    Returns:
+    - A tuple of the sizes of the original before and after normalization in bytes, or None when it is unchanged.
+    """
+
+    if not settings.NORMALIZE_ORIGINALS:
+        return None
+    tier = instance.user.tier
+    path = instance.image_url.path
+    with timed('normalize'):
+        with open(path, 'rb') as original_file:
+            data = original_file.read()
+        try:
+            normalized_data = normalize_image_data(data, getattr(tier, 'max_original_dimension', 0))
+        except ImageTooLarge:
+            return None
+        if normalized_data is None:
+            return None
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as temp_file:
+                temp_file.write(normalized_data)
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    return len(data), len(normalized_data)
@@ -0,0 +1,272 @@
+"""Perceptual hashing of images and multi-index hashing for near-duplicate lookups"""
+import os
+from collections import defaultdict
+from itertools import combinations
+import numpy as np
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import Http404
+from PIL import Image, ImageOps
+from ..models import UploadedImage
+from .custom_exceptions import DuplicateImage, ImageTooLarge
+from .tools import check_memory_budget, estimate_decoded_bytes, select_pyramid_source
+
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+HASH_CHUNKS = 4
+CHUNK_BITS = HASH_BITS // HASH_CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+HASH_SOURCE_HEIGHT = 64
+
+def dhash(img):
+    """
+    Compute the difference hash of an image: the image is reduced to 9x8 grayscale pixels and every bit
+    tells whether a pixel is brighter than its left neighbour.
+
+    Args:
+        img (PIL.Image.Image): The image.
+
+    Returns:
+        int: The unsigned 64-bit hash.
+    """
+
+    gray = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def create_perceptual_hash(image_path):
+    """
+    Compute the perceptual hash of an image file. JPEG images are decoded at reduced scale
+    and the EXIF orientation is applied, so rotated copies hash alike.
+
+    Args:
+        image_path (str): The path to the image, preferably a small pyramid level.
+
+    Returns:
+        int: The unsigned 64-bit hash.
+
+    Raises:
+        ImageTooLarge: If decoding the image would exceed the transform memory budget.
+    """
+
+    if not os.path.exists(image_path):
+        raise Http404
+    with Image.open(image_path) as img:
+        img.draft('L', (HASH_SOURCE_HEIGHT, HASH_SOURCE_HEIGHT))
+        check_memory_budget(estimate_decoded_bytes(img))
+        return dhash(ImageOps.exif_transpose(img))
+
+def to_signed(value):
+    """Map an unsigned 64-bit hash onto the range of a signed bigint column"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def to_unsigned(value):
+    """Map a hash read from a signed bigint column back onto the unsigned range"""
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+def hash_chunks(value):
+    """
+    Split a hash into its chunks for multi-index hashing, every chunk is tagged with its position
+    so the chunks of all positions can be stored and matched in a single integer array.
+
+    Args:
+        value (int): The unsigned 64-bit hash.
+
+    Returns:
+        list: A list of HASH_CHUNKS integers.
+    """
+
+    return [(index << CHUNK_BITS) | ((value >> (index * CHUNK_BITS)) & CHUNK_MASK) for index in range(HASH_CHUNKS)]
+
+def chunk_probes(value, max_distance):
+    """
+    List the tagged chunk values a near-duplicate must share with a hash.
+    Hashes within max_distance bits differ by at most max_distance // HASH_CHUNKS bits in at least one chunk,
+    so matching every chunk with the values that close to it finds all of them.
+
+    Args:
+        value (int): The unsigned 64-bit hash.
+        max_distance (int): The largest Hamming distance of a near-duplicate.
+
+    Returns:
+        list: A list of tagged chunk values.
+    """
+
+    radius = max_distance // HASH_CHUNKS
+    masks = [0] + [
+        sum(1 << bit for bit in bits)
+        for flipped in range(1, radius + 1)
+        for bits in combinations(range(CHUNK_BITS), flipped)
+    ]
+    return [chunk ^ mask for chunk in hash_chunks(value) for mask in masks]
+
+def hamming_distances(value, hashes):
+    """
+    Compute the Hamming distances of a hash to many hashes at once.
+
+    Args:
+        value (int): The unsigned 64-bit hash.
+        hashes (list): A list of unsigned 64-bit hashes.
+
+    Returns:
+        numpy.ndarray: The distances in the order of the hashes.
+    """
+
+    differences = np.array(hashes, dtype=np.uint64) ^ np.uint64(value)
+    return np.unpackbits(differences.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class MultiIndexHash:
+    """In-memory multi-index hash of 64-bit hashes, one exact-match table per chunk position"""
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self.table = defaultdict(list)
+        self.hashes = {}
+
+    def add(self, key, value):
+        self.hashes[key] = value
+        for chunk in hash_chunks(value):
+            self.table[chunk].append(key)
+
+    def search(self, value):
+        """
+        Find the stored hashes within max_distance bits of a hash.
+
+        Args:
+            value (int): The unsigned 64-bit hash.
+
+        Returns:
+            list: A list of (key, distance) tuples, the closest first.
+        """
+
+        candidates = list({key for chunk in chunk_probes(value, self.max_distance) for key in self.table.get(chunk, ())})
+        if not candidates:
+            return []
+        distances = hamming_distances(value, [self.hashes[key] for key in candidates])
+        return sorted(
+            ((key, int(distance)) for key, distance in zip(candidates, distances) if distance <= self.max_distance),
+            key=lambda duplicate: (duplicate[1], duplicate[0]),
+        )
+
+def hash_image(instance):
+    """
+    Compute the perceptual hash of an uploaded image from its smallest stored pyramid level and set it on the instance.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+
+    Returns:
+    - An integer representing the unsigned hash, or None when the image is too large to be decoded.
+    """
+
+    try:
+        value = create_perceptual_hash(select_pyramid_source(instance, HASH_SOURCE_HEIGHT))
+    except ImageTooLarge:
+        return None
+    instance.perceptual_hash = to_signed(value)
+    instance.hash_chunks = hash_chunks(value)
+    return value
+
+def find_near_duplicates(instance, max_distance=None):
+    """
+    Find the near-duplicates of an image among the other images of its user with the multi-index hash in the database.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model with its perceptual hash.
+    - max_distance: An integer representing the largest Hamming distance, defaults to DUPLICATE_HASH_DISTANCE.
+
+    Returns:
+    - A list of (pk, distance) tuples, the closest first.
+    """
+
+    if instance.perceptual_hash is None:
+        return []
+    if max_distance is None:
+        max_distance = settings.DUPLICATE_HASH_DISTANCE
+    value = to_unsigned(instance.perceptual_hash)
+    candidates = list(
+        UploadedImage.objects.filter(user_id=instance.user_id, hash_chunks__overlap=chunk_probes(value, max_distance))
+        .exclude(pk=instance.pk)
+        .values_list('pk', 'perceptual_hash')
+    )
+    if not candidates:
+        return []
+    distances = hamming_distances(value, [to_unsigned(candidate_hash) for _, candidate_hash in candidates])
+    return sorted(
+        ((pk, int(distance)) for (pk, _), distance in zip(candidates, distances) if distance <= max_distance),
+        key=lambda duplicate: (duplicate[1], duplicate[0]),
+    )
+
+def reject_duplicate_upload(instance):
+    """
+    Apply the REJECT_DUPLICATE_UPLOADS policy to a new upload with its perceptual hash.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model with its perceptual hash.
+
+    Raises:
+    - DuplicateImage: If the policy is on and the user already has a near-duplicate of the image.
+    """
+
+    if not settings.REJECT_DUPLICATE_UPLOADS:
+        return
+    duplicates = find_near_duplicates(instance)
+    if duplicates:
+        raise DuplicateImage(f'Image is a near-duplicate of image {duplicates[0][0]}')
+
+def group_near_duplicates(user, max_distance=None):
+    """
+    Group the images of a user that are near-duplicates of each other.
+    The hashes are loaded with a single query and matched with an in-memory multi-index hash,
+    images linked by a chain of near-duplicates end up in the same group.
+
+    Args:
+    - user: An instance of the `AppUser` model.
+    - max_distance: An integer representing the largest Hamming distance, defaults to DUPLICATE_HASH_DISTANCE.
+
+    Returns:
+    - A list of dictionaries with the `ids` of the images of a group, the largest file first, and the
+      `reclaimable_bytes` deleting all but the first one would free. Groups freeing the most bytes come first.
+    """
+
+    if max_distance is None:
+        max_distance = settings.DUPLICATE_HASH_DISTANCE
+    images = UploadedImage.objects.filter(user=user, perceptual_hash__isnull=False).values_list(
+        'pk', 'perceptual_hash', 'image_url'
+    )
+    index = MultiIndexHash(max_distance)
+    names = {}
+    for pk, perceptual_hash, name in images.iterator(chunk_size=2000):
+        index.add(pk, to_unsigned(perceptual_hash))
+        names[pk] = name
+    parents = {}
+
+    def find(pk):
+        root = pk
+        while parents.get(root, root) != root:
+            root = parents[root]
+        parents[pk] = root
+        return root
+
+    linked = set()
+    for pk, value in index.hashes.items():
+        for duplicate_pk, _ in index.search(value):
+            if duplicate_pk != pk:
+                parents[find(duplicate_pk)] = find(pk)
+                linked.update((pk, duplicate_pk))
+    members = defaultdict(list)
+    for pk in linked:
+        members[find(pk)].append(pk)
+    groups = []
+    for pks in members.values():
+        sizes = {pk: file_size(names[pk]) for pk in pks}
+        ids = sorted(sizes, key=lambda pk: (-sizes[pk], pk))
+        groups.append({'ids': ids, 'reclaimable_bytes': sum(sizes[pk] for pk in ids[1:])})
+    return sorted(groups, key=lambda group: (-group['reclaimable_bytes'], group['ids'][0]))
+
+def file_size(name):
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
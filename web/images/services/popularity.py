@@ -0,0 +1,93 @@
+"""Sampled, batched request counters of thumbnails and the popularity queries built on them"""
+import random
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from ..models import DerivativeAccess, UploadedImage
+from .counters import BackgroundFlusher
+
+class AccessCounter:
+    """
+    Process wide counters of thumbnail requests.
+    Only ACCESS_SAMPLE_RATE of the requests are counted, each with the weight of the skipped ones, and the
+    counts are written with a single upsert every ACCESS_FLUSH_INTERVAL seconds instead of a write per request,
+    by a background thread so no request waits for the write.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.flusher = BackgroundFlusher(self.flush, 'ACCESS_FLUSH_INTERVAL')
+
+    def record(self, pk, height):
+        sample_rate = settings.ACCESS_SAMPLE_RATE
+        if sample_rate <= 0 or random.random() >= sample_rate:
+            return
+        with self.lock:
+            self.counts[(pk, height)] = self.counts.get((pk, height), 0) + max(1, round(1 / sample_rate))
+            full = len(self.counts) >= settings.ACCESS_FLUSH_MAX_KEYS
+        self.flusher.notify(flush_now=full)
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, {}
+        if counts:
+            write_access_counts(counts)
+
+access_counter = AccessCounter()
+
+def write_access_counts(counts):
+    """
+    Add request counts to the stored counters of thumbnails with a single upsert.
+    Counts of images deleted in the meantime are dropped.
+
+    Args:
+    - counts: A dictionary mapping (pk, height) tuples of thumbnails to the number of requests.
+    """
+
+    values = ', '.join(['(%s, %s, %s)'] * len(counts))
+    params = [value for (pk, height), hits in counts.items() for value in (pk, height, hits)]
+    table = DerivativeAccess._meta.db_table
+    sql = f"""
+        INSERT INTO {table} (image_id, height, hits, last_accessed)
+        SELECT counts.image_id, counts.height, counts.hits, %s
+        FROM (VALUES {values}) AS counts (image_id, height, hits)
+        JOIN {UploadedImage._meta.db_table} image ON image.id = counts.image_id
+        ON CONFLICT (image_id, height) DO UPDATE
+        SET hits = {table}.hits + EXCLUDED.hits, last_accessed = EXCLUDED.last_accessed
+    """
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [timezone.now(), *params])
+    except IntegrityError: # an image was deleted while its counts were written
+        pass
+
+def most_requested(top, days=None):
+    """
+    Find the most requested thumbnails.
+
+    Args:
+    - top: An integer representing the number of thumbnails.
+    - days: An integer limiting the thumbnails to the ones requested within the last days, None for all.
+
+    Returns:
+    - A queryset of the `DerivativeAccess` model with the images and their tiers, the most requested first.
+    """
+
+    accesses = DerivativeAccess.objects.select_related('image__user__tier').order_by('-hits', '-last_accessed')
+    if days is not None:
+        accesses = accesses.filter(last_accessed__gte=timezone.now() - timedelta(days=days))
+    return accesses[:top]
+
+def thumbnail_hits():
+    """
+    Read the request counts of all thumbnails.
+
+    Returns:
+    - A dictionary mapping (pk, height) tuples of thumbnails to their request counts.
+    """
+
+    accesses = DerivativeAccess.objects.values_list('image_id', 'height', 'hits').iterator(chunk_size=5000)
+    return {(pk, height): hits for pk, height, hits in accesses}
@@ -0,0 +1,52 @@
+"""Warm-up of the application in the app server master process before the workers are forked"""
+import gc
+import logging
+from io import BytesIO
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+from PIL import Image
+from .derivatives import warm_thumbnail_cache
+from .metrics import registry
+from .statistics import stats_counter
+
+PRELOAD_FORMATS = ('JPEG', 'PNG', 'WEBP')
+PRELOAD_TEMPLATES = ('rest_framework/api.html', 'admin/index.html')
+
+logger = logging.getLogger(__name__)
+
+def preload_app():
+    """
+    Load everything the workers would otherwise load on their first requests: the URL configuration with all views,
+    the Pillow plugins and codecs, the compiled templates and the most requested thumbnails. Called in the master,
+    the workers forked from it share these pages copy-on-write. Warming the thumbnail cache is best effort,
+    when it fails the error is logged and the workers start with a cold cache.
+    The statistics counted by the warm-up are written before the fork, so they are not inherited and written by every worker.
+    Database connections are closed afterwards so no worker inherits a connection of the master,
+    and the loaded objects are frozen so the garbage collector of a worker does not touch, and copy, their pages.
+
+    Returns:
+    - A tuple of the numbers of thumbnails found in the cache, loaded into it and failed to load.
+    """
+
+    get_resolver().url_patterns
+    Image.init()
+    for save_format in PRELOAD_FORMATS:
+        image_io = BytesIO()
+        Image.new('RGB', (8, 8)).save(image_io, save_format)
+        Image.open(image_io).load()
+    for template_name in PRELOAD_TEMPLATES:
+        get_template(template_name)
+    thumbnails = (0, 0, 0)
+    try:
+        thumbnails = warm_thumbnail_cache(settings.WARM_CACHE_TOP)
+        stats_counter.flush()
+    except Exception:
+        logger.exception('Thumbnail cache warm-up failed')
+    finally:
+        connections.close_all()
+    registry.reset()
+    gc.collect()
+    gc.freeze()
+    return thumbnails
@@ -0,0 +1,62 @@
+"""Storage of request profiles in a bounded on-disk ring"""
+import os
+import uuid
+from django.conf import settings
+from ..models import RequestProfile
+
+def profile_path(profile):
+    """
+    Build the path of a stored profile.
+
+    Args:
+    - profile: An instance of the `RequestProfile` model.
+
+    Returns:
+    - A string representing the path to the pstats file.
+    """
+
+    return os.path.join(settings.PROFILES_ROOT, profile.file_name)
+
+def save_profile(profiler, request, response, duration_ms):
+    """
+    Store the profile of a request and drop the oldest profiles beyond PROFILING_MAX_PROFILES.
+
+    Args:
+    - profiler: The disabled `cProfile.Profile` of the request.
+    - request: The HTTP request object.
+    - response: The HTTP response object.
+    - duration_ms: A float representing the duration of the request in milliseconds.
+
+    Returns:
+    - The created instance of the `RequestProfile` model.
+    """
+
+    os.makedirs(settings.PROFILES_ROOT, exist_ok=True)
+    file_name = f'{uuid.uuid4().hex}.prof'
+    profiler.dump_stats(os.path.join(settings.PROFILES_ROOT, file_name))
+    profile = RequestProfile.objects.create(
+        path=request.get_full_path()[:2000],
+        method=request.method,
+        user=request.user if request.user.is_authenticated else None,
+        status_code=response.status_code,
+        duration_ms=duration_ms,
+        file_name=file_name,
+    )
+    stale_profiles = RequestProfile.objects.order_by('-created_at', '-pk')[settings.PROFILING_MAX_PROFILES:]
+    for stale_profile in stale_profiles:
+        delete_profile(stale_profile)
+    return profile
+
+def delete_profile(profile):
+    """
+    Delete a stored profile together with its file.
+
+    Args:
+    - profile: An instance of the `RequestProfile` model.
+    """
+
+    try:
+        os.remove(profile_path(profile))
+    except FileNotFoundError:
+        pass
+    profile.delete()
@@ -0,0 +1,150 @@
+"""Per-user token bucket rate limiting with the limits of the account tier"""
+import math
+import time
+from collections import namedtuple
+from functools import wraps
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+RateLimit = namedtuple('RateLimit', ['allowed', 'limit', 'remaining', 'reset', 'retry_after', 'window'])
+
+# GCRA: the bucket is a single "theoretical arrival time", read and updated by one script call.
+# Times are integer microseconds, they stay exact in Lua numbers and in integer replies.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local emission_interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local tat = now
+local stored = redis.call('GET', KEYS[1])
+if stored then
+    tat = math.max(tonumber(stored), now)
+end
+local new_tat = tat + emission_interval * cost
+if new_tat - now > emission_interval * burst then
+    return {0, tat}
+end
+redis.call('SET', KEYS[1], string.format('%.0f', new_tat), 'PX', math.ceil((new_tat - now) / 1000))
+return {1, new_tat}
+"""
+
+def rate_limit_key(user):
+    return f'ratelimit_{user.pk}'
+
+def gcra(tat, now, emission_interval, burst, cost=1):
+    """
+    Take tokens from a bucket represented by its theoretical arrival time.
+
+    Args:
+    - tat: An integer with the theoretical arrival time of the bucket, or None for a full bucket.
+    - now: An integer with the current time in microseconds.
+    - emission_interval: An integer with the microseconds it takes to refill one token.
+    - burst: An integer with the capacity of the bucket.
+    - cost: An integer with the number of tokens taken, at most burst.
+
+    Returns:
+    - A (allowed, tat) tuple, tat is the theoretical arrival time to be stored.
+    """
+
+    tat = max(tat or now, now)
+    new_tat = tat + emission_interval * cost
+    if new_tat - now > emission_interval * burst:
+        return False, tat
+    return True, new_tat
+
+def take_token(key, now, emission_interval, burst, cost=1):
+    """
+    Take tokens from the bucket stored under a cache key.
+    With the Redis cache the bucket is checked and updated atomically in a single round trip,
+    other cache backends read and write the bucket with two calls.
+
+    Returns:
+    - A (allowed, tat) tuple with the theoretical arrival time after the check.
+    """
+
+    cache = caches[settings.RATE_LIMIT_CACHE]
+    if hasattr(cache, '_cache') and hasattr(cache._cache, 'get_client'):
+        cache_key = cache.make_key(key)
+        client = cache._cache.get_client(cache_key, write=True)
+        allowed, tat = client.register_script(GCRA_SCRIPT)(keys=[cache_key], args=[now, emission_interval, burst, cost])
+        return bool(allowed), int(tat)
+    allowed, tat = gcra(cache.get(key), now, emission_interval, burst, cost)
+    if allowed:
+        cache.set(key, tat, timeout=math.ceil((tat - now) / 1_000_000))
+    return allowed, tat
+
+def check_rate_limit(user, cost=1):
+    """
+    Check a request of a user against the rate limit of the account tier.
+
+    Args:
+    - user: An authenticated instance of the `AppUser` model.
+    - cost: An integer with the number of tokens the request takes, requests doing the work of many
+      (batches, exports) take one token per item. The cost is capped at the burst, so the largest
+      request is still allowed with a full bucket and empties it.
+
+    Returns:
+    - A RateLimit tuple, or None when rate limiting is disabled or the tier is unlimited.
+      limit and window describe the bucket, reset is the number of seconds until the bucket is full
+      again and retry_after the number of seconds until a throttled request may be repeated.
+    """
+
+    tier = getattr(user, 'tier', None)
+    if not settings.RATE_LIMIT_ENABLED or tier is None or not tier.rate_limit_per_minute:
+        return None
+    burst = max(1, tier.rate_limit_burst)
+    emission_interval = 60_000_000 // tier.rate_limit_per_minute
+    cost = min(max(1, cost), burst)
+    now = time.time_ns() // 1000
+    allowed, tat = take_token(rate_limit_key(user), now, emission_interval, burst, cost)
+    return RateLimit(
+        allowed=allowed,
+        limit=burst,
+        remaining=max(0, (now + emission_interval * burst - tat) // emission_interval),
+        reset=max(0, tat - now) / 1_000_000,
+        retry_after=0 if allowed else max(0, tat + emission_interval * (cost - burst) - now) / 1_000_000,
+        window=emission_interval * burst / 1_000_000,
+    )
+
+def rate_limit_headers(rate_limit):
+    """
+    Build the RateLimit headers of a response.
+
+    Args:
+    - rate_limit: A RateLimit tuple.
+
+    Returns:
+    - A dictionary of headers, Retry-After is included for throttled requests.
+    """
+
+    headers = {
+        'RateLimit-Limit': str(rate_limit.limit),
+        'RateLimit-Remaining': str(rate_limit.remaining),
+        'RateLimit-Reset': str(math.ceil(rate_limit.reset)),
+        'RateLimit-Policy': f'{rate_limit.limit};w={math.ceil(rate_limit.window)}',
+    }
+    if not rate_limit.allowed:
+        headers['Retry-After'] = str(math.ceil(rate_limit.retry_after))
+    return headers
+
+def rate_limited(view_func):
+    """
+    A decorator applying the rate limit of the account tier to a view of logged in users.
+    Throttled requests are answered with 429 Too Many Requests.
+
+    Args:
+        view_func: The view function to be decorated.
+
+    Returns:
+        The decorated view function.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        rate_limit = check_rate_limit(request.user)
+        request.rate_limit = rate_limit
+        if rate_limit is not None and not rate_limit.allowed:
+            return HttpResponse('Request was throttled.', status=429)
+        return view_func(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,202 @@
+"""Bulk binary renditions of the whole library of an account, rendered by a background job into the derivative store"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from django.conf import settings
+from django.http import Http404
+from django.utils import timezone
+from ..models import AppUser, BinaryRenditionBatch, ImageJob, UploadedImage
+from .custom_exceptions import ImageTooLarge
+from .derivatives import read_derivative, write_derivative
+from .jobs import extend_lease, job_handler, enqueue_job_on_commit, JOB_PRIORITY_BULK
+from .tools import create_binary_image_data, crete_expiring_link
+
+def binary_rendition_name(method):
+    return f'binary_{method}'
+
+def binary_renditions_job_key(user, method):
+    return f'binary_renditions:{user.pk}:{method}'
+
+def read_binary_rendition(instance, method):
+    """
+    Read the stored binary rendition of an image.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - method: A string representing the binarization method.
+
+    Returns:
+    - The bytes of the rendition, or None when it was not rendered yet.
+    """
+
+    return read_derivative(instance, binary_rendition_name(method))
+
+def render_binary_rendition(instance, method):
+    """
+    Render the binary rendition of an image into the derivative store.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - method: A string representing the binarization method.
+
+    Returns:
+    - True when the rendition was stored, False when the image is missing, too large or cannot be decoded.
+    """
+
+    try:
+        binary_image_data = create_binary_image_data(instance.image_url.path, method)
+    except (ImageTooLarge, Http404, OSError):
+        return False
+    write_derivative(instance, binary_rendition_name(method), binary_image_data)
+    return True
+
+def rendition_workers(workers=None):
+    """
+    Number of rendering threads of a bulk job, every thread may use TRANSFORM_MEMORY_BUDGET for decoded pixels.
+
+    Args:
+    - workers: An optional integer with the requested number of threads, defaults to the CPU count.
+
+    Returns:
+    - An integer with the requested number of threads capped so that they fit in IMAGE_WORKER_MEMORY_LIMIT.
+    """
+
+    memory_workers = max(1, settings.IMAGE_WORKER_MEMORY_LIMIT // settings.TRANSFORM_MEMORY_BUDGET)
+    return min(workers or os.cpu_count(), memory_workers)
+
+def render_binary_renditions(user, method, chunk_size=None, workers=None, progress=None, batch=None):
+    """
+    Render the binary renditions of all images of a user.
+    Images are streamed in chunks and the images of a chunk are rendered in parallel,
+    so memory use does not depend on the size of the library.
+
+    Args:
+    - user: An instance of the `AppUser` model.
+    - method: A string representing the binarization method.
+    - chunk_size: An integer representing the number of images rendered at once, defaults to BINARY_RENDITION_CHUNK_SIZE.
+    - workers: An integer representing the number of rendering threads, see rendition_workers.
+    - progress: An optional callable receiving the batch after every chunk.
+    - batch: An optional unfinished instance of the `BinaryRenditionBatch` model to continue after its last image.
+
+    Returns:
+    - The batch, a new unsaved instance of the `BinaryRenditionBatch` model when none was passed, with the counts,
+      the ids of the failed images, the duration and the number of cores the images were rendered on.
+    """
+
+    chunk_size = chunk_size or settings.BINARY_RENDITION_CHUNK_SIZE
+    workers = rendition_workers(workers)
+    batch = batch or BinaryRenditionBatch(user=user, method=method)
+    batch.cores = min(workers, os.cpu_count())
+    images = (
+        UploadedImage.objects.filter(user=user, pk__gt=batch.last_image_id)
+        .only('pk', 'image_url')
+        .order_by('pk')
+        .iterator(chunk_size=chunk_size)
+    )
+    started = time.monotonic() - batch.seconds
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            chunk = list(islice(images, chunk_size))
+            if not chunk:
+                break
+            stored = executor.map(lambda instance: render_binary_rendition(instance, method), chunk)
+            for instance, rendered in zip(chunk, stored):
+                if rendered:
+                    batch.rendered += 1
+                else:
+                    batch.failed_ids.append(instance.pk)
+            batch.processed += len(chunk)
+            batch.last_image_id = chunk[-1].pk
+            batch.seconds = time.monotonic() - started
+            if progress is not None:
+                progress(batch)
+    batch.seconds = time.monotonic() - started
+    return batch
+
+def enqueue_binary_renditions(user, method):
+    """
+    Enqueue the binary rendition job of an account once the current transaction commits,
+    an account has a single job per method.
+
+    Args:
+    - user: An instance of the `AppUser` model.
+    - method: A string representing the binarization method.
+    """
+
+    enqueue_job_on_commit(
+        'binary_renditions',
+        {'user_id': user.pk, 'method': method},
+        key=binary_renditions_job_key(user, method),
+        priority=JOB_PRIORITY_BULK,
+    )
+
+def binary_renditions_job(user, method):
+    """
+    Find the binary rendition job of an account.
+
+    Args:
+    - user: An instance of the `AppUser` model.
+    - method: A string representing the binarization method.
+
+    Returns:
+    - An instance of the `ImageJob` model, or None when no renditions were requested.
+    """
+
+    return ImageJob.objects.filter(key=binary_renditions_job_key(user, method)).first()
+
+@job_handler('binary_renditions')
+def binary_renditions_handler(user_id, method):
+    """
+    Job handler rendering the binary renditions of all images of an account and storing the outcome.
+    The batch is saved after every chunk, a job reclaimed after a crash continues after the last saved chunk.
+
+    Args:
+    - user_id: An integer representing the primary key of the `AppUser` model instance.
+    - method: A string representing the binarization method.
+    """
+
+    user = AppUser.objects.filter(pk=user_id).first()
+    if user is None:
+        return
+    batch = BinaryRenditionBatch.objects.filter(user=user, method=method, finished_at__isnull=True).first()
+    if batch is None:
+        batch, _ = BinaryRenditionBatch.objects.update_or_create(
+            user=user,
+            method=method,
+            defaults={'processed': 0, 'rendered': 0, 'failed_ids': [], 'seconds': 0, 'last_image_id': 0, 'finished_at': None},
+        )
+
+    def save_progress(batch):
+        batch.save()
+        extend_lease()
+
+    batch = render_binary_renditions(user, method, progress=save_progress, batch=batch)
+    batch.finished_at = timezone.now()
+    batch.save()
+
+def iter_binary_manifest(request, user, batch, expiration_seconds):
+    """
+    Generate the links to the binary renditions of the images of a user chunk by chunk.
+    Images uploaded after the job are linked too, the binary image view renders missing renditions on demand.
+
+    Args:
+    - request: The HTTP request object.
+    - user: An instance of the `AppUser` model.
+    - batch: An instance of the `BinaryRenditionBatch` model, its failed images are left out.
+    - expiration_seconds: An integer representing the number of seconds after which the links expire.
+
+    Yields:
+    - (pk, url) tuples of the images and their expiring links.
+    """
+
+    failed_ids = set(batch.failed_ids)
+    images = (
+        UploadedImage.objects.filter(user=user)
+        .only('pk', 'image_url')
+        .order_by('pk')
+        .iterator(chunk_size=settings.BINARY_RENDITION_CHUNK_SIZE)
+    )
+    for instance in images:
+        if instance.pk not in failed_ids:
+            yield instance.pk, crete_expiring_link(request, instance.pk, instance, expiration_seconds, batch.method)
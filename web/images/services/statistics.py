@@ -0,0 +1,330 @@
+"""Summary tables of the admin dashboard: storage totals kept by database triggers, batched cache and render counters"""
+import os
+import threading
+from datetime import timedelta
+from itertools import islice
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+from ..models import CacheStats, RenderStats, StorageUsage, UploadedImage
+from .counters import BackgroundFlusher
+from .tools import DERIVATIVE_DIRECTORIES
+
+STORAGE_USAGE_COLUMNS = ('images', 'original_bytes', 'derivatives', 'derivative_bytes')
+
+def storage_usage_trigger_sql():
+    """
+    Build the SQL installing the triggers which add the changes of the images table to the storage totals of their users,
+    run by a migration of the images app.
+
+    Returns:
+    - A string with the SQL statements.
+    """
+
+    images = UploadedImage._meta.db_table
+    usage = StorageUsage._meta.db_table
+    updates = ', '.join(f'{column} = usage.{column} + EXCLUDED.{column}' for column in STORAGE_USAGE_COLUMNS)
+    upsert = f"""
+        INSERT INTO {usage} AS usage (user_id, {', '.join(STORAGE_USAGE_COLUMNS)})
+        VALUES ({{row}}.user_id, {{sign}}1, {{sign}}{{row}}.original_bytes, {{sign}}{{row}}.derivatives,
+                {{sign}}{{row}}.derivative_bytes)
+        ON CONFLICT (user_id) DO UPDATE SET {updates};
+    """
+    return f"""
+        CREATE OR REPLACE FUNCTION {images}_storage_usage() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                {upsert.format(row='OLD', sign='-')}
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                {upsert.format(row='NEW', sign='')}
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS {images}_storage_usage_insert_delete ON {images};
+        CREATE TRIGGER {images}_storage_usage_insert_delete AFTER INSERT OR DELETE ON {images}
+            FOR EACH ROW EXECUTE FUNCTION {images}_storage_usage();
+        DROP TRIGGER IF EXISTS {images}_storage_usage_update ON {images};
+        CREATE TRIGGER {images}_storage_usage_update AFTER UPDATE ON {images}
+            FOR EACH ROW
+            WHEN ((OLD.user_id, OLD.original_bytes, OLD.derivatives, OLD.derivative_bytes)
+                IS DISTINCT FROM (NEW.user_id, NEW.original_bytes, NEW.derivatives, NEW.derivative_bytes))
+            EXECUTE FUNCTION {images}_storage_usage();
+    """
+
+def drop_storage_usage_trigger_sql():
+    """
+    Build the SQL removing the storage usage triggers and their function, the reverse of `storage_usage_trigger_sql`.
+
+    Returns:
+    - A string with the SQL statements.
+    """
+
+    images = UploadedImage._meta.db_table
+    return f"""
+        DROP TRIGGER IF EXISTS {images}_storage_usage_insert_delete ON {images};
+        DROP TRIGGER IF EXISTS {images}_storage_usage_update ON {images};
+        DROP FUNCTION IF EXISTS {images}_storage_usage();
+    """
+
+def rebuild_storage_usage():
+    """
+    Recompute the storage totals of all users from the images table, e.g. for images stored before the triggers.
+    Writes to the images table wait until the totals are rebuilt.
+
+    Returns:
+    - An integer representing the number of users with images.
+    """
+
+    images = UploadedImage._meta.db_table
+    usage = StorageUsage._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {images} IN SHARE MODE')
+        cursor.execute(f'DELETE FROM {usage}')
+        cursor.execute(f"""
+            INSERT INTO {usage} (user_id, {', '.join(STORAGE_USAGE_COLUMNS)})
+            SELECT user_id, COUNT(*), SUM(original_bytes), SUM(derivatives), SUM(derivative_bytes)
+            FROM {images} GROUP BY user_id
+        """)
+        return cursor.rowcount
+
+def measure_derivatives(pk):
+    """
+    Measure the stored derivatives of an image: its thumbnails in the derivative store and its pyramid levels.
+
+    Args:
+    - pk: An integer representing the primary key of the `UploadedImage` model instance.
+
+    Returns:
+    - A tuple of the number of derivatives and their size in bytes.
+    """
+
+    count = size = 0
+    for directory in DERIVATIVE_DIRECTORIES:
+        try:
+            entries = os.scandir(default_storage.path(f'{directory}/{pk}'))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    count += 1
+                    size += entry.stat().st_size
+    return count, size
+
+def measure_image(instance):
+    """
+    Set the size of the original and the measured derivatives of an image on the instance, saved by the caller.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    """
+
+    try:
+        instance.original_bytes = default_storage.size(instance.image_url.name)
+    except OSError:
+        instance.original_bytes = 0
+    instance.derivatives, instance.derivative_bytes = measure_derivatives(instance.pk)
+
+def refresh_derivative_usage(pks):
+    """
+    Store the measured derivatives of images with a single bulk update, the triggers carry the change over to
+    the storage totals of their users.
+
+    Args:
+    - pks: An iterable of primary keys of `UploadedImage` model instances, deleted images are skipped.
+    """
+
+    images = []
+    for pk in set(pks):
+        derivatives, derivative_bytes = measure_derivatives(pk)
+        images.append(UploadedImage(pk=pk, derivatives=derivatives, derivative_bytes=derivative_bytes))
+    if images:
+        UploadedImage.objects.bulk_update(images, ['derivatives', 'derivative_bytes'])
+
+def measure_stored_images(chunk_size=500):
+    """
+    Measure the originals and derivatives of all images, e.g. of images stored before they were measured at upload.
+    Every chunk of images is written with a single bulk update.
+
+    Args:
+    - chunk_size: An integer representing the number of images measured at once.
+
+    Returns:
+    - An integer representing the number of measured images.
+    """
+
+    images = UploadedImage.objects.only('pk', 'image_url').order_by('pk').iterator(chunk_size=chunk_size)
+    measured = 0
+    while True:
+        chunk = list(islice(images, chunk_size))
+        if not chunk:
+            return measured
+        for instance in chunk:
+            measure_image(instance)
+        UploadedImage.objects.bulk_update(chunk, ['original_bytes', 'derivatives', 'derivative_bytes'])
+        measured += len(chunk)
+
+class StatsCounter:
+    """
+    Process wide counters of derivative cache lookups and thumbnail render times.
+    Like the thumbnail request counters the counts are written every STATS_FLUSH_INTERVAL seconds
+    with a few upserts by a background thread, rendered images get their derivatives measured at the same time.
+    Recording never touches the database, so requests, pool threads and jobs only count in memory
+    and the writes are not rolled back with the transaction of a job.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache_counts = {}
+        self.renders = {}
+        self.flusher = BackgroundFlusher(self.flush, 'STATS_FLUSH_INTERVAL')
+
+    def record_cache(self, cache_name, hit):
+        with self.lock:
+            hits, misses = self.cache_counts.get(cache_name, (0, 0))
+            self.cache_counts[cache_name] = (hits + 1, misses) if hit else (hits, misses + 1)
+        self.flusher.notify()
+
+    def record_render(self, pk, duration_ms):
+        with self.lock:
+            renders, total_ms, max_ms = self.renders.get(pk, (0, 0.0, 0.0))
+            self.renders[pk] = (renders + 1, total_ms + duration_ms, max(max_ms, duration_ms))
+            full = len(self.renders) >= settings.STATS_FLUSH_MAX_KEYS
+        self.flusher.notify(flush_now=full)
+
+    def flush(self):
+        with self.lock:
+            cache_counts, self.cache_counts = self.cache_counts, {}
+            renders, self.renders = self.renders, {}
+        if cache_counts:
+            write_cache_stats(cache_counts)
+        if renders:
+            write_render_stats(renders)
+            refresh_derivative_usage(renders)
+
+stats_counter = StatsCounter()
+
+def write_cache_stats(cache_counts):
+    """
+    Add cache lookups to the counters of the current day with a single upsert.
+
+    Args:
+    - cache_counts: A dictionary mapping cache names to (hits, misses) tuples.
+    """
+
+    day = timezone.localdate()
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(cache_counts))
+    params = [value for cache_name, (hits, misses) in cache_counts.items() for value in (day, cache_name, hits, misses)]
+    table = CacheStats._meta.db_table
+    sql = f"""
+        INSERT INTO {table} (day, cache, hits, misses) VALUES {values}
+        ON CONFLICT (day, cache) DO UPDATE
+        SET hits = {table}.hits + EXCLUDED.hits, misses = {table}.misses + EXCLUDED.misses
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+def write_render_stats(renders):
+    """
+    Add render times to the stored render statistics of images with a single upsert.
+    Render times of images deleted in the meantime are dropped.
+
+    Args:
+    - renders: A dictionary mapping primary keys of images to (renders, total_ms, max_ms) tuples.
+    """
+
+    values = ', '.join(['(%s, %s, %s, %s)'] * len(renders))
+    params = [value for pk, (count, total_ms, max_ms) in renders.items() for value in (pk, count, total_ms, max_ms)]
+    table = RenderStats._meta.db_table
+    sql = f"""
+        INSERT INTO {table} (image_id, renders, total_ms, max_ms, last_rendered)
+        SELECT renders.image_id, renders.renders, renders.total_ms, renders.max_ms, %s
+        FROM (VALUES {values}) AS renders (image_id, renders, total_ms, max_ms)
+        JOIN {UploadedImage._meta.db_table} image ON image.id = renders.image_id
+        ON CONFLICT (image_id) DO UPDATE
+        SET renders = {table}.renders + EXCLUDED.renders, total_ms = {table}.total_ms + EXCLUDED.total_ms,
+            max_ms = GREATEST({table}.max_ms, EXCLUDED.max_ms), last_rendered = EXCLUDED.last_rendered
+    """
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [timezone.now(), *params])
+    except IntegrityError: # an image was deleted while its render times were written
+        pass
+
+def storage_by_tier():
+    """
+    Sum up the storage totals of the users of every tier.
+
+    Returns:
+    - A list of dictionaries with the `tier` name, the number of `users` and their storage totals.
+    """
+
+    return list(
+        StorageUsage.objects.filter(images__gt=0)
+        .values(tier=F('user__tier__name'))
+        .annotate(
+            users=Count('pk'),
+            images_count=Sum('images'),
+            original_bytes_sum=Sum('original_bytes'),
+            derivatives_count=Sum('derivatives'),
+            derivative_bytes_sum=Sum('derivative_bytes'),
+        )
+        .order_by('tier')
+    )
+
+def top_storage_users(top):
+    """
+    Find the users taking the most storage.
+
+    Args:
+    - top: An integer representing the number of users.
+
+    Returns:
+    - A queryset of the `StorageUsage` model with the users and their tiers, annotated with the `total_bytes`.
+    """
+
+    return (
+        StorageUsage.objects.select_related('user__tier')
+        .annotate(total_bytes=F('original_bytes') + F('derivative_bytes'))
+        .order_by((F('original_bytes') + F('derivative_bytes')).desc())[:top]
+    )
+
+def cache_hit_ratios(days):
+    """
+    Sum up the cache lookups of the last days.
+
+    Args:
+    - days: An integer representing the number of days including today.
+
+    Returns:
+    - A list of dictionaries with the `cache` name, its `hits`, `misses` and hit `ratio`.
+    """
+
+    since = timezone.localdate() - timedelta(days=days - 1)
+    caches = list(
+        CacheStats.objects.filter(day__gte=since)
+        .values('cache')
+        .annotate(hits_sum=Sum('hits'), misses_sum=Sum('misses'))
+        .order_by('cache')
+    )
+    for cache_stats in caches:
+        lookups = cache_stats['hits_sum'] + cache_stats['misses_sum']
+        cache_stats['ratio'] = cache_stats['hits_sum'] / lookups if lookups else None
+    return caches
+
+def slowest_renders(top):
+    """
+    Find the images with the slowest thumbnail renders.
+
+    Args:
+    - top: An integer representing the number of images.
+
+    Returns:
+    - A queryset of the `RenderStats` model with the images and their users, the slowest render first.
+    """
+
+    return RenderStats.objects.select_related('image__user').order_by('-max_ms')[:top]
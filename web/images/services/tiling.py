@@ -0,0 +1,61 @@
+"""
+Helpers for processing very large images.
+Pillow cannot decode JPEG, PNG, GIF or WebP images partially, so the decoded raster is the floor of the memory a
+transform takes: JPEG images are decoded at a reduced scale that fits the tiled threshold, other formats are decoded
+in full and bounded by the transform memory budget only. Strips keep the intermediate copies of a transform small.
+"""
+
+JPEG_SCALES = (1, 2, 4, 8)
+
+def draft_within(img, mode, max_pixels, min_scale=1):
+    """
+    Configure the decoder of a JPEG image to decode at the largest DCT scale (1, 1/2, 1/4 or 1/8)
+    that keeps the decoded image within max_pixels, or at 1/8 when none does. Other formats are left unchanged.
+
+    Args:
+        img (PIL.Image.Image): The opened, not yet loaded image.
+        mode (str): The mode to decode to, None keeps the mode of the image.
+        max_pixels (int): The largest number of pixels the decoded image should have.
+        min_scale (int): The smallest reduction, 2 decodes at half of the resolution at least.
+
+    Returns:
+        tuple: The (width, height) the image is decoded at.
+    """
+
+    for scale in (scale for scale in JPEG_SCALES if scale >= min_scale):
+        size = (-(-img.width // scale), -(-img.height // scale))
+        if size[0] * size[1] <= max_pixels:
+            break
+    img.draft(mode, size)
+    return img.size
+
+def iter_strips(img, strip_height):
+    """
+    Iterate over an image in horizontal strips.
+    The image is decoded once, each strip is a copy of at most strip_height rows, so
+    conversions of a strip take memory proportional to the strip instead of the image.
+
+    Args:
+        img (PIL.Image.Image): The image to iterate over.
+        strip_height (int): The maximal number of rows of a strip.
+
+    Yields:
+        Tuple[int, PIL.Image.Image]: The index of the first row of the strip and the strip itself.
+    """
+
+    for top in range(0, img.height, strip_height):
+        yield top, img.crop((0, top, img.width, min(top + strip_height, img.height)))
+
+def is_tiled(img, threshold):
+    """
+    Check whether an image should be processed in the bounded-memory tiled mode.
+
+    Args:
+        img (PIL.Image.Image): The opened, not yet loaded image.
+        threshold (int): The pixel count above which the tiled mode is used.
+
+    Returns:
+        bool: True if the image has more pixels than the threshold.
+    """
+
+    return img.width * img.height > threshold
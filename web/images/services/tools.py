@@ -1,16 +1,61 @@
 import os
+import base64
 import datetime
+from urllib.parse import urljoin
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.http import Http404
 from django.urls import reverse
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from io import BytesIO
 from PIL import Image
-from .validators import validate_expiration_seconds
+from .animation import animation_decoded_bytes, encode_animation, is_animated, iter_resized_frames
+from .binarization import binarize, encode_1bit_png
+from .custom_exceptions import ImageTooLarge
+from .metrics import timed, track_transform
+from .tiling import draft_within, is_tiled
+from .validators import image_save_format, validate_expiration_seconds
+
+PYRAMID_JPEG_QUALITY = 95
+PLACEHOLDER_SIZE = 20
+PLACEHOLDER_WEBP_QUALITY = 30
+# Storage directories holding the derivatives of an image in a subdirectory named after its primary key
+DERIVATIVE_DIRECTORIES = ('derivatives', 'pyramids')
+
+def estimate_decoded_bytes(img):
+    """
+    Estimate the memory taken by the decoded pixel data of an image.
+
+    Args:
+        img (PIL.Image.Image): The opened, not yet loaded image.
+
+    Returns:
+        int: The number of bytes the decoded image occupies.
+    """
+
+    band_bytes = 4 if img.mode in ('I', 'F') else 1
+    return img.width * img.height * len(img.getbands()) * band_bytes
+
+def check_memory_budget(required_bytes):
+    """
+    Ensure a transform fits within the TRANSFORM_MEMORY_BUDGET setting.
+
+    Args:
+        required_bytes (int): The memory the transform needs for pixel data.
+
+    Raises:
+        ImageTooLarge: If the transform would exceed the memory budget.
+    """
+
+    if required_bytes > settings.TRANSFORM_MEMORY_BUDGET:
+        raise ImageTooLarge('Image is too large to be processed')
 
 def create_thumbnail_data(image_path, height):
     """
     Create a thumbnail of an image with the specified height.
+    Animated images are resized frame by frame, decoding a single frame at a time.
 
     Args:
         image_path (str): The path to the image.
@@ -18,50 +63,257 @@ def create_thumbnail_data(image_path, height):
 
     Returns:
         bytes: The bytes of the thumbnail image.
+
+    Raises:
+        ImageTooLarge: If decoding the image would exceed the transform memory budget
+            or an animated image has more than MAX_ANIMATION_FRAMES frames.
     """
 
     if not os.path.exists(image_path):
         raise Http404
-    img = Image.open(image_path)
-    if img.height != height:
-        ratio = height / float(img.height)
-        size = (int(img.width * ratio), height)
-        img.thumbnail(size, Image.ANTIALIAS)
-    thumb_io = BytesIO()
-    img.save(thumb_io, img.format.upper())
-    thumb_data = thumb_io.getvalue()
-    thumb_io.close()
+    with track_transform():
+        with timed('decode'):
+            img = Image.open(image_path)
+            size = None
+            if img.height != height:
+                ratio = height / float(img.height)
+                size = (int(img.width * ratio), height)
+                img.draft(None, (size[0] * 2, size[1] * 2)) # reduced-scale decode of JPEG images
+            animated = is_animated(img)
+            if animated:
+                if img.n_frames > settings.MAX_ANIMATION_FRAMES:
+                    raise ImageTooLarge('Animation has too many frames to be processed')
+                check_memory_budget(animation_decoded_bytes(img, size or img.size))
+            else:
+                check_memory_budget(estimate_decoded_bytes(img))
+                img.load()
+        if animated:
+            with timed('resize'):
+                frames = list(iter_resized_frames(img, size or img.size))
+            with timed('encode'):
+                return encode_animation(frames, img.format, img.info.get('loop'))
+        if size is not None:
+            with timed('resize'):
+                img.thumbnail(size, Image.ANTIALIAS)
+        with timed('encode'):
+            thumb_io = BytesIO()
+            img.save(thumb_io, image_save_format(img))
+            thumb_data = thumb_io.getvalue()
+            thumb_io.close()
     return thumb_data
 
-def create_binary_image_data(image_path):
+def create_pyramid_data(image_path, min_height=None):
+    """
+    Create a halving resolution pyramid (1/2, 1/4, 1/8...) of an image.
+    Every level is reduced from the previous one, so the original is decoded only once,
+    large JPEG images are decoded directly at half of their resolution.
+    Animated images have no pyramid, their thumbnails are resized from the original frames.
+
+    Args:
+        image_path (str): The path to the image.
+        min_height (int): The smallest height a pyramid level is allowed to have.
+
+    Returns:
+        list: A list of (width, height, bytes) tuples, the largest level first.
+    """
+
+    if not os.path.exists(image_path):
+        raise Http404
+    if min_height is None:
+        min_height = settings.PYRAMID_MIN_HEIGHT
+    img = Image.open(image_path)
+    if is_animated(img):
+        return []
+    save_format = image_save_format(img)
+    original_height = img.height
+    if is_tiled(img, settings.TILED_PROCESSING_THRESHOLD):
+        # JPEG images decode straight to the largest level within the threshold, the levels above it are skipped
+        draft_within(img, None, settings.TILED_PROCESSING_THRESHOLD, min_scale=2)
+    check_memory_budget(estimate_decoded_bytes(img) * 5 // 4)
+    if img.mode not in ('L', 'LA', 'RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or 'A' in img.getbands() else 'RGB')
+    levels = []
+    if img.height < original_height:
+        levels.append((img.width, img.height, encode_pyramid_level(img, save_format)))
+    while img.height // 2 >= min_height:
+        img = img.reduce(2)
+        levels.append((img.width, img.height, encode_pyramid_level(img, save_format)))
+    return levels
+
+def encode_pyramid_level(img, save_format):
+    """
+    Encode a single pyramid level.
+
+    Args:
+        img (PIL.Image.Image): The pyramid level.
+        save_format (str): The format of the original image.
+
+    Returns:
+        bytes: The bytes of the encoded level.
+    """
+
+    level_io = BytesIO()
+    if save_format == 'JPEG':
+        img.save(level_io, save_format, quality=PYRAMID_JPEG_QUALITY)
+    else:
+        img.save(level_io, save_format)
+    level_data = level_io.getvalue()
+    level_io.close()
+    return level_data
+
+def create_pyramid(instance):
+    """
+    Generate and store the resolution pyramid of an uploaded image.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+
+    Returns:
+    - A list of dictionaries describing the stored levels, each containing the
+      `width`, `height` and storage `name` of a level, the largest level first.
+    """
+
+    delete_pyramid(instance)
+    extension = instance.image_url.name.split('.')[-1].lower()
+    pyramid_levels = []
+    for level, (width, height, data) in enumerate(create_pyramid_data(instance.image_url.path), start=1):
+        name = default_storage.save(f'pyramids/{instance.pk}/{2 ** level}.{extension}', ContentFile(data))
+        pyramid_levels.append({'width': width, 'height': height, 'name': name})
+    return pyramid_levels
+
+def delete_pyramid(instance):
+    """
+    Remove the stored pyramid levels of an uploaded image.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    """
+
+    for level in instance.pyramid_levels:
+        default_storage.delete(level['name'])
+
+def select_pyramid_source(instance, height):
+    """
+    Select the smallest stored image that is still at least as high as the requested height.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - height: An integer representing the height of the derivative to be rendered.
+
+    Returns:
+    - A string representing the path to the pyramid level, or to the original image
+      when no level is large enough.
+    """
+
+    candidates = [level for level in instance.pyramid_levels if level['height'] >= height]
+    if candidates:
+        level_path = default_storage.path(min(candidates, key=lambda level: level['height'])['name'])
+        if os.path.exists(level_path):
+            return level_path
+    return instance.image_url.path
+
+def create_placeholder_data(image_path, size=PLACEHOLDER_SIZE):
+    """
+    Create a tiny blurry placeholder of an image that clients can show before the thumbnails load.
+    JPEG images are decoded at reduced scale, so the full resolution is never held in memory.
+
+    Args:
+        image_path (str): The path to the image, preferably its smallest pyramid level.
+        size (int): The length of the longer side of the placeholder.
+
+    Returns:
+        str: A data URI of the placeholder in the WebP format.
+
+    Raises:
+        ImageTooLarge: If decoding the image would exceed the transform memory budget.
+    """
+
+    if not os.path.exists(image_path):
+        raise Http404
+    img = Image.open(image_path)
+    img.draft('RGB', (size, size))
+    check_memory_budget(estimate_decoded_bytes(img))
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or 'A' in img.getbands() else 'RGB')
+    img.thumbnail((size, size), Image.ANTIALIAS)
+    placeholder_io = BytesIO()
+    img.save(placeholder_io, 'WEBP', quality=PLACEHOLDER_WEBP_QUALITY)
+    return f'data:image/webp;base64,{base64.b64encode(placeholder_io.getvalue()).decode()}'
+
+def create_placeholder(instance):
+    """
+    Create the placeholder of an uploaded image from its smallest stored pyramid level.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+
+    Returns:
+    - A string with the data URI of the placeholder, empty when the image is too large to be decoded.
+    """
+
+    try:
+        return create_placeholder_data(select_pyramid_source(instance, PLACEHOLDER_SIZE))
+    except ImageTooLarge:
+        return ''
+
+def create_binary_image_data(image_path, method='grayscale', threshold=None):
     """
     Create a binary version of an image.
 
     Args:
         image_path (str): The path to the image.
+        method (str): 'grayscale' keeps the original format in 'L' mode, 'threshold', 'otsu'
+            and 'dither' produce a true 1-bit PNG.
+        threshold (int): The threshold used by the 'threshold' method.
 
     Returns:
         bytes: The bytes of the binary image.
+
+    Raises:
+        ImageTooLarge: If decoding the image would exceed the transform memory budget.
     """
 
     if not os.path.exists(image_path):
         raise Http404
-    img = Image.open(image_path)
-    binary_image = img.convert('L') # JPEG, PNG does not support '1' mode
-    binary_io = BytesIO()
-    binary_image.save(binary_io, img.format.upper())
-    binary_image_data = binary_io.getvalue()
-    binary_io.close()
+    with track_transform():
+        with timed('decode'):
+            img = Image.open(image_path)
+            save_format = image_save_format(img)
+            strip_height = None
+            if is_tiled(img, settings.TILED_PROCESSING_THRESHOLD):
+                # JPEG images decode straight to grayscale, downscaled to the threshold
+                draft_within(img, 'L', settings.TILED_PROCESSING_THRESHOLD)
+                strip_height = settings.TILE_STRIP_HEIGHT
+            grayscale_bytes = 0 if img.mode == 'L' else img.width * img.height
+            if method != 'grayscale' and strip_height is not None:
+                grayscale_bytes = (img.width + 7) // 8 * img.height + img.width * strip_height
+            check_memory_budget(estimate_decoded_bytes(img) + grayscale_bytes)
+            img.load()
+        if method != 'grayscale':
+            if threshold is None:
+                threshold = settings.BINARY_IMAGE_THRESHOLD
+            with timed('binarize'):
+                binary_image = binarize(img, method, threshold, strip_height)
+            with timed('encode'):
+                return encode_1bit_png(binary_image)
+        with timed('binarize'):
+            binary_image = img if img.mode == 'L' else img.convert('L') # JPEG, PNG does not support '1' mode
+        with timed('encode'):
+            binary_io = BytesIO()
+            binary_image.save(binary_io, save_format)
+            binary_image_data = binary_io.getvalue()
+            binary_io.close()
     return binary_image_data
 
-def create_thumbnail_urls(request, instance, thumbnail_sizes):
+def create_thumbnail_urls(request, instance, thumbnail_sizes, base_url=None):
     """
     Create a list of dictionaries containing URLs to image thumbnails of different sizes.
 
     Args:
-    - request: The HTTP request object.
+    - request: The HTTP request object, or None outside of a request cycle.
     - instance: An instance of the `UploadedImage` model for which the thumbnail URLs need to be created.
     - thumbnail_sizes: A list of integers representing the heights of the desired thumbnail images.
+    - base_url: A string with the scheme and host of the URLs, used when there is no request.
 
     Returns:
     - A list of dictionaries, where each dictionary contains a single key-value pair:
@@ -79,11 +331,14 @@ def create_thumbnail_urls(request, instance, thumbnail_sizes):
                 'name': os.path.basename(instance.image_url.path),
             },
         )
-        thumbnail_url = request.build_absolute_uri(thumbnail_url)
+        if request is not None:
+            thumbnail_url = request.build_absolute_uri(thumbnail_url)
+        else:
+            thumbnail_url = urljoin(base_url, thumbnail_url)
         thumbnails_urls.append({f"{size}px": thumbnail_url})
     return thumbnails_urls
 
-def crete_expiring_link(request, pk, uploaded_image, expiration_seconds):
+def crete_expiring_link(request, pk, uploaded_image, expiration_seconds, method=None):
     """
     Create a URL to an image that expires after a certain number of seconds.
 
@@ -92,6 +347,7 @@ def crete_expiring_link(request, pk, uploaded_image, expiration_seconds):
     - pk: An integer representing the primary key of the `UploadedImage` model instance.
     - uploaded_image: An instance of the `UploadedImage` model.
     - expiration_seconds: An integer representing the number of seconds after which the URL should expire.
+    - method: An optional string representing the binarization method of the linked image.
 
     Returns:
     - A string representing the URL to the binary image.
@@ -109,4 +365,23 @@ def crete_expiring_link(request, pk, uploaded_image, expiration_seconds):
             'encoded_expiration_time': encoded_expiration_time,
         },
     )
+    if method is not None:
+        binary_image_url = f'{binary_image_url}?method={method}'
     return request.build_absolute_uri(binary_image_url)
+
+def encode_multipart_part(boundary, headers, body):
+    """
+    Encode a single part of a multipart/mixed response body.
+
+    Args:
+    - boundary: A string separating the parts of the response.
+    - headers: A dictionary of the part headers, Content-Length is added to them.
+    - body: The bytes of the part.
+
+    Returns:
+    - The bytes of the part preceded by the boundary.
+    """
+
+    lines = [f'--{boundary}'] + [f'{name}: {value}' for name, value in headers.items()]
+    lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body + b'\r\n'
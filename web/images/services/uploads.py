@@ -0,0 +1,114 @@
+"""Background processing of images uploaded in the asynchronous mode"""
+import time
+from django.conf import settings
+from django.http import Http404
+from ..models import UploadedImage
+from .cleanup import delete_image_files
+from .custom_exceptions import DuplicateImage, ImageTooLarge
+from .derivatives import render_thumbnail
+from .jobs import job_handler, enqueue_job_on_commit, JOB_PRIORITY_UPLOAD
+from .normalization import normalize_original
+from .perceptual_hash import hash_image, reject_duplicate_upload
+from .statistics import measure_image
+from .tools import create_placeholder, create_pyramid, create_thumbnail_urls
+
+def enqueue_upload_processing(instance, base_url):
+    """
+    Enqueue processing of an uploaded image once the current transaction commits.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model with the processing status.
+    - base_url: A string with the scheme and host the thumbnail URLs are built with.
+    """
+
+    enqueue_job_on_commit(
+        'process_upload',
+        {'pk': instance.pk, 'base_url': base_url},
+        key=f'process_upload:{instance.pk}',
+        priority=JOB_PRIORITY_UPLOAD,
+    )
+
+def process_upload(instance, base_url):
+    """
+    Normalize an uploaded image, build its thumbnail URLs, resolution pyramid, placeholder and thumbnails and mark it ready.
+
+    Args:
+    - instance: An instance of the `UploadedImage` model.
+    - base_url: A string with the scheme and host the thumbnail URLs are built with.
+
+    Raises:
+    - DuplicateImage: If the image is rejected as a near-duplicate of another image of the user.
+    """
+
+    normalize_original(instance)
+    # the hash is computed from the smallest pyramid level instead of decoding the whole original
+    try:
+        instance.pyramid_levels = create_pyramid(instance)
+    except ImageTooLarge:
+        instance.pyramid_levels = []
+    hash_image(instance)
+    reject_duplicate_upload(instance)
+    thumbnail_sizes = instance.user.tier.thumbnail_sizes
+    instance.thumbnails_urls = create_thumbnail_urls(None, instance, thumbnail_sizes, base_url=base_url)
+    instance.placeholder = create_placeholder(instance)
+    for height in thumbnail_sizes:
+        try:
+            render_thumbnail(instance, height)
+        except ImageTooLarge:
+            pass
+    measure_image(instance)
+    instance.status = UploadedImage.READY
+    instance.processing_error = ''
+    instance.save(update_fields=[
+        'thumbnails_urls', 'pyramid_levels', 'placeholder', 'perceptual_hash', 'hash_chunks',
+        'original_bytes', 'derivatives', 'derivative_bytes', 'status', 'processing_error',
+    ])
+
+@job_handler('process_upload')
+def process_upload_job(pk, base_url):
+    """
+    Job handler processing an image uploaded in the asynchronous mode.
+    Images that cannot be decoded and rejected near-duplicates are marked failed, the files of rejected
+    near-duplicates are removed like in the synchronous mode while the row keeps the reason for the status.
+    Other errors are left to the job retries.
+
+    Args:
+    - pk: An integer representing the primary key of the `UploadedImage` model instance.
+    - base_url: A string with the scheme and host the thumbnail URLs are built with.
+    """
+
+    instance = UploadedImage.objects.select_related('user__tier').filter(pk=pk).first()
+    if instance is None or instance.status != UploadedImage.PROCESSING:
+        return
+    try:
+        process_upload(instance, base_url)
+    except DuplicateImage as err:
+        UploadedImage.objects.filter(pk=pk).update(status=UploadedImage.FAILED, processing_error=str(err), pyramid_levels=[])
+        delete_image_files(pk, instance.image_url.name, [])
+    except (OSError, Http404) as err:
+        UploadedImage.objects.filter(pk=pk).update(status=UploadedImage.FAILED, processing_error=str(err) or 'Image file not found')
+
+def wait_for_upload_status(queryset, pk, wait):
+    """
+    Read the processing status of an image, waiting up to wait seconds for the processing to finish.
+
+    Args:
+    - queryset: A queryset of the `UploadedImage` model the image is looked up in.
+    - pk: An integer representing the primary key of the image.
+    - wait: An integer representing the longest wait in seconds, 0 returns at once.
+
+    Returns:
+    - A dictionary with the id, status and processing_error of the image, or None when it does not exist.
+    """
+
+    deadline = time.monotonic() + wait
+    status_queryset = queryset.filter(pk=pk).values('id', 'status', 'processing_error')
+    upload_status = status_queryset.first()
+    while (
+        upload_status is not None
+        and upload_status['status'] == UploadedImage.PROCESSING
+        and time.monotonic() < deadline
+    ):
+        time.sleep(min(settings.UPLOAD_STATUS_POLL_INTERVAL, max(0, deadline - time.monotonic())))
+        upload_status = status_queryset.first()
+    return upload_status
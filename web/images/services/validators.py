@@ -1,13 +1,103 @@
+import warnings
 from django.core.exceptions import ValidationError
 from django.http import HttpResponseBadRequest
-from imageocean.settings import ALLOWED_IMAGE_EXTENSIONS
-from .custom_exceptions import InvalidExpirationRange, InvalidExpirationSeconds
+from PIL import Image, UnidentifiedImageError
+from imageocean.settings import (
+    ALLOWED_IMAGE_EXTENSIONS,
+    MAX_ANIMATION_FRAMES,
+    MAX_IMAGE_DIMENSION,
+    MAX_IMAGE_PIXELS,
+    THUMBNAIL_BATCH_MAX_ITEMS,
+    BULK_DELETE_MAX_ITEMS,
+    UPLOAD_STATUS_MAX_WAIT
+)
+from .animation import animation_duration, is_animated
+from .binarization import BINARIZATION_METHODS
+from .custom_exceptions import (
+    InvalidExpirationRange,
+    InvalidExpirationSeconds,
+    InvalidBinarizationMethod,
+    InvalidThumbnailBatch,
+    InvalidImageIds,
+    InvalidStatusWait
+)
 
 def validate_image(image):
     """Image validator"""
     ext = image.name.split('.')[-1]
     if not ext.lower() in ALLOWED_IMAGE_EXTENSIONS:
-        raise ValidationError(message="Invalid file extension allowed extensions are .JPG and .PNG")
+        raise ValidationError(message="Invalid file extension allowed extensions are .JPG, .PNG, .APNG, .GIF and .WEBP")
+
+def validate_image_header(image, max_pixels=None, max_frames=None, max_duration=None):
+    """
+    Validate the real format, dimensions and pixel count of an uploaded image, and the frames of an animation.
+    Only the image header is read, the pixel data is never decoded, except for the frames of an animation
+    within the frame limit when its duration is checked.
+
+    Args:
+        image (File): The uploaded image file.
+        max_pixels (int): The pixel count allowed by the account tier.
+        max_frames (int): The number of frames allowed by the account tier.
+        max_duration (int): The animation duration in seconds allowed by the account tier, 0 for no limit.
+
+    Returns:
+        Tuple[int, int]: The width and height of the image.
+
+    Raises:
+        ValidationError: If the file is not an image, its format does not match the extension
+            or it exceeds the allowed dimensions, frames or duration.
+    """
+
+    if max_pixels is None or max_pixels > MAX_IMAGE_PIXELS:
+        max_pixels = MAX_IMAGE_PIXELS
+    if max_frames is None or max_frames > MAX_ANIMATION_FRAMES:
+        max_frames = MAX_ANIMATION_FRAMES
+    image.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(image) as img:
+                image_format = img.format
+                width, height = img.size
+                frames = img.n_frames if is_animated(img) else 1
+                duration = 0
+                if 1 < frames <= max_frames and max_duration and width * height <= max_pixels:
+                    duration = animation_duration(img, max_duration * 1000)
+    except Image.DecompressionBombError:
+        raise ValidationError(message=f"Image exceeds the allowed {max_pixels} pixels")
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        raise ValidationError(message="Uploaded file is not a valid image")
+    finally:
+        image.seek(0)
+    try:
+        _, save_format = match_content_type_and_save_format(image.name.split('.')[-1].upper())
+    except ValueError:
+        save_format = None
+    if ('JPEG' if image_format == 'MPO' else image_format) != save_format:
+        raise ValidationError(message="Image content does not match the file extension")
+    if width > MAX_IMAGE_DIMENSION or height > MAX_IMAGE_DIMENSION:
+        raise ValidationError(message=f"Image dimensions exceed {MAX_IMAGE_DIMENSION} pixels")
+    if width * height > max_pixels:
+        raise ValidationError(message=f"Image exceeds the allowed {max_pixels} pixels")
+    if frames > max_frames:
+        raise ValidationError(message=f"Animation exceeds the allowed {max_frames} frames")
+    if max_duration and duration > max_duration * 1000:
+        raise ValidationError(message=f"Animation exceeds the allowed {max_duration} seconds")
+    return width, height
+
+def image_save_format(img):
+    """
+    Returns the format an opened image is saved in. Multi-picture JPEGs (MPO) of phones and cameras
+    are JPEG images with more pictures appended, their primary picture is saved as JPEG.
+
+    Args:
+        img (PIL.Image.Image): The opened image.
+
+    Returns:
+        str: The save format.
+    """
+
+    return 'JPEG' if img.format == 'MPO' else img.format.upper()
 
 def match_content_type_and_save_format(original_format):
     """
@@ -30,6 +120,15 @@ def match_content_type_and_save_format(original_format):
         case 'JPG' | 'JPEG':
             content_type = 'image/jpeg'
             save_format = 'JPEG'
+        case 'APNG':
+            content_type = 'image/apng'
+            save_format = 'PNG'
+        case 'GIF':
+            content_type = 'image/gif'
+            save_format = 'GIF'
+        case 'WEBP':
+            content_type = 'image/webp'
+            save_format = 'WEBP'
         case _:
             raise ValueError('Unsupported image format')
     return content_type, save_format
@@ -57,6 +156,81 @@ def validate_height(view_func):
         return view_func(request, pk, height, name)
     return wrapper
 
+def validate_thumbnail_batch(thumbnails, thumbnail_sizes):
+    """
+    Validate the thumbnails requested in a single batch.
+
+    Parameters:
+    - thumbnails (list): A list of {"id": int, "height": int} objects.
+    - thumbnail_sizes (list): The thumbnail heights allowed by the account tier.
+
+    Returns:
+    - list: The requested (pk, height) tuples without duplicates.
+
+    Raises:
+    - InvalidThumbnailBatch: If the batch is malformed, too large or asks for a height the tier does not allow.
+    """
+
+    if not isinstance(thumbnails, list) or not thumbnails:
+        raise InvalidThumbnailBatch('thumbnails should be a non-empty list of {"id": ..., "height": ...} objects')
+    if len(thumbnails) > THUMBNAIL_BATCH_MAX_ITEMS:
+        raise InvalidThumbnailBatch(f'At most {THUMBNAIL_BATCH_MAX_ITEMS} thumbnails can be fetched at once')
+    pairs = []
+    for thumbnail in thumbnails:
+        try:
+            pk, height = int(thumbnail['id']), int(thumbnail['height'])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidThumbnailBatch('Every thumbnail needs an integer id and height')
+        if height not in thumbnail_sizes:
+            raise InvalidThumbnailBatch(f'Your account tier does not allow You to create thumbail of height {height}')
+        pairs.append((pk, height))
+    return list(dict.fromkeys(pairs))
+
+def validate_image_ids(ids):
+    """
+    Validate the ids of images of a bulk request.
+
+    Parameters:
+    - ids (list): The ids of the images.
+
+    Returns:
+    - list: The ids as integers.
+
+    Raises:
+    - InvalidImageIds: If the ids are not a non-empty list of integers or there are too many of them.
+    """
+
+    if not isinstance(ids, list) or not ids:
+        raise InvalidImageIds('ids should be a non-empty list of image ids')
+    if len(ids) > BULK_DELETE_MAX_ITEMS:
+        raise InvalidImageIds(f'At most {BULK_DELETE_MAX_ITEMS} images can be deleted at once')
+    try:
+        return [int(pk) for pk in ids]
+    except (TypeError, ValueError):
+        raise InvalidImageIds('Every image id should be an integer')
+
+def validate_status_wait(wait):
+    """
+    Validate the number of seconds an upload status request may wait for the processing to finish.
+
+    Parameters:
+    - wait (int or str): The number of seconds.
+
+    Returns:
+    - int: The number of seconds.
+
+    Raises:
+    - InvalidStatusWait: If wait is not an integer between 0 and UPLOAD_STATUS_MAX_WAIT.
+    """
+
+    try:
+        wait = int(wait)
+    except (TypeError, ValueError):
+        raise InvalidStatusWait('wait must be an integer')
+    if wait < 0 or wait > UPLOAD_STATUS_MAX_WAIT:
+        raise InvalidStatusWait(f'wait must be between 0 and {UPLOAD_STATUS_MAX_WAIT} seconds')
+    return wait
+
 def validate_expiration_seconds(expiration_seconds):
     """
     Validate the given expiration time in seconds.
@@ -79,3 +253,21 @@ def validate_expiration_seconds(expiration_seconds):
     if expiration_seconds < 300 or expiration_seconds > 30000:
         raise InvalidExpirationRange('expiration_seconds must be between 300 and 30000 seconds')
     return expiration_seconds
+
+def validate_binarization_method(method):
+    """
+    Validate the given binarization method.
+
+    Parameters:
+    - method (str): The name of the binarization method.
+
+    Returns:
+    - str: The validated binarization method.
+
+    Raises:
+    - InvalidBinarizationMethod: If the method is not one of the supported binarization methods.
+    """
+
+    if method not in BINARIZATION_METHODS:
+        raise InvalidBinarizationMethod(f'method must be one of: {", ".join(BINARIZATION_METHODS)}')
+    return method
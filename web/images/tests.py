@@ -1,6 +1,9 @@
 import os
+import json
+import inspect
+import base64
 import datetime
-from io import BytesIO
+from io import BytesIO, StringIO
 from django.http import Http404
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.files.storage import default_storage
@@ -12,16 +15,74 @@ from rest_framework.test import APITestCase, APIClient
 from django.urls import reverse
 from PIL import Image
 import tempfile
+import shutil
+import struct
+import zlib
+import zipfile
+import time
+from unittest import mock
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.db import connection, router
+from django.test.utils import CaptureQueriesContext
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, override_settings
+from django.core.cache import cache
+from django.utils import timezone
 from .services.tools import (
     create_thumbnail_data,
     create_binary_image_data,
     create_thumbnail_urls,
-    crete_expiring_link
+    crete_expiring_link,
+    create_pyramid_data,
+    create_pyramid,
+    create_placeholder,
+    create_placeholder_data,
+    delete_pyramid,
+    select_pyramid_source,
+    DERIVATIVE_DIRECTORIES
+)
+from .services.validators import (match_content_type_and_save_format, validate_expiration_seconds, validate_image_header)
+from .services.animation import animation_duration, iter_resized_frames
+from .services.binarization import binarize, otsu_threshold
+from .services.derivatives import (
+    derivative_path,
+    evict_derivatives,
+    load_thumbnail_data,
+    read_derivative,
+    thumbnail_cache_key,
+    warm_thumbnail_cache,
+    write_derivative
+)
+from .services.popularity import AccessCounter, access_counter
+from .services.statistics import StatsCounter, measure_derivatives, rebuild_storage_usage, stats_counter
+from .services.preload import preload_app
+from .services.metrics import registry as metrics_registry
+from .services.perceptual_hash import (
+    MultiIndexHash,
+    dhash,
+    find_near_duplicates,
+    hamming_distances,
+    hash_chunks,
+    hash_image,
+    to_unsigned
+)
+from .services.normalization import normalize_image_data, normalize_original, strip_jpeg_metadata, strip_webp_metadata
+from .services.jobs import JOB_HANDLERS, claim_next_job, enqueue_job, run_next_job
+from .services.backfill import backfill_tier, get_base_url
+from .services.renditions import enqueue_binary_renditions, read_binary_rendition, render_binary_renditions, rendition_workers
+from .services.rate_limit import rate_limit_key
+from django.core.management import call_command
+from .middleware import ReplicaRoutingMiddleware
+from .routers import read_primary_key
+from .models import (
+    AppUser, UserTier, UploadedImage, ImageJob, RequestProfile, DerivativeAccess, StorageUsage, CacheStats, RenderStats,
+    BinaryRenditionBatch
 )
-from .services.validators import (match_content_type_and_save_format, validate_expiration_seconds)
-from .models import AppUser, UserTier, UploadedImage
 from .serializers import WithoutImageSerializer, WithImageSerializer
-from .services.custom_exceptions import InvalidExpirationRange, InvalidExpirationSeconds
+from .services.custom_exceptions import InvalidExpirationRange, InvalidExpirationSeconds, ImageTooLarge
 
 os.environ.setdefault("DB_NAME", "test_db_name")
 os.environ.setdefault("DB_USER", "test_db_user")
@@ -53,6 +114,8 @@ class BaseTestCase(APITestCase):
         UserTier.objects.all().delete()
         AppUser.objects.all().delete()
         default_storage.delete(self.media_file)
+        for directory in DERIVATIVE_DIRECTORIES:
+            shutil.rmtree(default_storage.path(f'{directory}/{self.image.pk}'), ignore_errors=True)
 
 class CreateThumbnailTestCase(APITestCase):
 
@@ -77,6 +140,51 @@ class CreateThumbnailTestCase(APITestCase):
         except OSError:
             pass
 
+class ImageHeaderValidatorTestCase(APITestCase):
+
+    def create_uploaded_file(self, name, image_format, size=(100, 100)):
+        file_content = BytesIO()
+        Image.new('RGB', size, color='red').save(file_content, image_format)
+        return SimpleUploadedFile(name, file_content.getvalue())
+
+    def test_positive_validate_image_header(self):
+        image = self.create_uploaded_file('test_image.jpg', 'JPEG')
+        self.assertEqual(validate_image_header(image, 10000), (100, 100))
+        self.assertEqual(image.tell(), 0)
+
+    def test_negative_validate_image_header_pixel_count(self):
+        image = self.create_uploaded_file('test_image.png', 'PNG')
+        with self.assertRaises(ValidationError):
+            validate_image_header(image, 9999)
+
+    def test_negative_validate_image_header_format_mismatch(self):
+        image = self.create_uploaded_file('test_image.jpg', 'PNG')
+        with self.assertRaises(ValidationError) as ve:
+            validate_image_header(image)
+        self.assertEqual(ve.exception.message, 'Image content does not match the file extension')
+
+    def test_negative_validate_image_header_not_an_image(self):
+        image = SimpleUploadedFile('test_image.png', b'not an image')
+        with self.assertRaises(ValidationError) as ve:
+            validate_image_header(image)
+        self.assertEqual(ve.exception.message, 'Uploaded file is not a valid image')
+
+    def test_negative_validate_image_header_decompression_bomb(self):
+        ihdr = struct.pack('>IIBBBBB', 50000, 50000, 8, 2, 0, 0, 0)
+        chunk = struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr))
+        image = SimpleUploadedFile('bomb.png', b'\x89PNG\r\n\x1a\n' + chunk)
+        with self.assertRaises(ValidationError):
+            validate_image_header(image)
+
+    @override_settings(TRANSFORM_MEMORY_BUDGET=1000)
+    def test_transform_memory_budget(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as temp_file:
+            Image.new('RGB', (100, 100), color='red').save(temp_file.name, format='JPEG')
+            with self.assertRaises(ImageTooLarge):
+                create_thumbnail_data(temp_file.name, 50)
+            with self.assertRaises(ImageTooLarge):
+                create_binary_image_data(temp_file.name)
+
 class CreateBinaryImageTestCase(APITestCase):
 
     def setUp(self):
@@ -107,6 +215,290 @@ class CreateBinaryImageTestCase(APITestCase):
         except OSError:
             pass
 
+class CreatePlaceholderTestCase(APITestCase):
+
+    def test_create_placeholder_data(self):
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, 'wide.jpg')
+            Image.new('RGB', (640, 320), color='blue').save(image_path, 'JPEG')
+            placeholder = create_placeholder_data(image_path)
+            self.assertTrue(placeholder.startswith('data:image/webp;base64,'))
+            img = Image.open(BytesIO(base64.b64decode(placeholder.split(',', 1)[1])))
+            self.assertEqual((img.format, img.size), ('WEBP', (20, 10)))
+            self.assertLess(len(placeholder), 300)
+            image_path = os.path.join(directory, 'palette.png')
+            Image.new('P', (30, 40)).save(image_path, 'PNG', transparency=0)
+            img = Image.open(BytesIO(base64.b64decode(create_placeholder_data(image_path).split(',', 1)[1])))
+            self.assertEqual((img.mode, img.size), ('RGBA', (15, 20)))
+
+    @override_settings(TRANSFORM_MEMORY_BUDGET=1000)
+    def test_create_placeholder_over_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            image_path = os.path.join(directory, 'large.png')
+            Image.new('RGB', (100, 100)).save(image_path, 'PNG')
+            with override_settings(MEDIA_ROOT=directory):
+                instance = UploadedImage(image_url='large.png', pyramid_levels=[])
+                self.assertEqual(create_placeholder(instance), '')
+
+class NormalizationTestCase(APITestCase):
+
+    def encode(self, img, save_format='JPEG', orientation=None, **params):
+        exif = Image.Exif()
+        exif[0x010F] = 'Phone'
+        if orientation is not None:
+            exif[0x0112] = orientation
+        image_io = BytesIO()
+        img.save(image_io, save_format, exif=exif.tobytes(), **params)
+        return image_io.getvalue()
+
+    def test_strip_jpeg_metadata(self):
+        data = self.encode(Image.new('RGB', (60, 40), color='red'), comment=b'holiday')
+        stripped = strip_jpeg_metadata(data)
+        self.assertLess(len(stripped), len(data))
+        img = Image.open(BytesIO(stripped))
+        self.assertEqual([name for name, _ in img.applist], ['APP0'])
+        self.assertEqual(img.tobytes(), Image.open(BytesIO(data)).tobytes())
+        with self.assertRaises(ValueError):
+            strip_jpeg_metadata(b'\x89PNG')
+
+    def test_normalize_image_data(self):
+        img = Image.new('RGB', (60, 40), color='red')
+        normalized = Image.open(BytesIO(normalize_image_data(self.encode(img, orientation=6))))
+        self.assertEqual(normalized.size, (40, 60))
+        self.assertNotIn('exif', normalized.info)
+        normalized = Image.open(BytesIO(normalize_image_data(self.encode(img, orientation=1), max_dimension=30)))
+        self.assertEqual(normalized.size, (30, 20))
+        normalized = Image.open(BytesIO(normalize_image_data(self.encode(img, 'PNG', orientation=3))))
+        self.assertEqual((normalized.format, normalized.size), ('PNG', (60, 40)))
+        self.assertNotIn('exif', normalized.info)
+        image_io = BytesIO()
+        img.save(image_io, 'JPEG')
+        self.assertIsNone(normalize_image_data(image_io.getvalue(), max_dimension=60))
+
+    def test_webp_metadata(self):
+        img = Image.effect_noise((60, 40), 64).convert('RGB')
+        for params in ({'lossless': True}, {'quality': 80}):
+            data = self.encode(img, 'WEBP', **params)
+            stripped = normalize_image_data(data)
+            self.assertEqual(stripped, strip_webp_metadata(data))
+            self.assertNotIn(b'EXIF', stripped)
+            self.assertEqual(Image.open(BytesIO(stripped)).tobytes(), Image.open(BytesIO(data)).tobytes())
+        # rotated lossless images are re-encoded losslessly
+        data = self.encode(img, 'WEBP', orientation=3, lossless=True)
+        normalized = Image.open(BytesIO(normalize_image_data(data)))
+        self.assertEqual(normalized.tobytes(), img.rotate(180).tobytes())
+
+    def test_multi_picture_jpeg(self):
+        data = self.encode(
+            Image.new('RGB', (60, 40), color='red'), 'MPO', save_all=True, append_images=[Image.new('RGB', (60, 40), color='blue')],
+        )
+        self.assertEqual(Image.open(BytesIO(data)).format, 'MPO')
+        self.assertEqual(validate_image_header(SimpleUploadedFile('phone.jpg', data), 10000), (60, 40))
+        # the metadata and the appended picture are removed without re-encoding the primary picture
+        normalized = normalize_image_data(data)
+        self.assertEqual(normalized.count(b'\xff\xd8'), 1)
+        img = Image.open(BytesIO(normalized))
+        self.assertEqual((img.format, img.size), ('JPEG', (60, 40)))
+        self.assertNotIn('exif', img.info)
+        self.assertEqual(img.tobytes(), Image.open(BytesIO(data)).tobytes())
+        img = Image.open(BytesIO(normalize_image_data(data, max_dimension=30)))
+        self.assertEqual((img.format, img.size), ('JPEG', (30, 20)))
+
+    @override_settings(TRANSFORM_MEMORY_BUDGET=1000)
+    def test_normalize_image_data_over_budget(self):
+        with self.assertRaises(ImageTooLarge):
+            normalize_image_data(self.encode(Image.new('RGB', (60, 40)), orientation=6))
+
+class AnimationTestCase(APITestCase):
+
+    def encode_animation(self, save_format, frames=6, duration=100, size=(120, 80), loop=0):
+        images = [Image.new('RGB', size, color=(40 * index, 200 - 30 * index, 90)) for index in range(frames)]
+        image_io = BytesIO()
+        options = {} if loop is None else {'loop': loop}
+        images[0].save(image_io, save_format, save_all=True, append_images=images[1:], duration=duration, **options)
+        return image_io.getvalue()
+
+    def test_create_animated_thumbnail_data(self):
+        for save_format, suffix in (('GIF', '.gif'), ('PNG', '.apng'), ('WEBP', '.webp')):
+            with tempfile.NamedTemporaryFile(suffix=suffix) as temp_file:
+                temp_file.write(self.encode_animation(save_format))
+                temp_file.flush()
+                thumbnail = Image.open(BytesIO(create_thumbnail_data(temp_file.name, 40)))
+                self.assertEqual((thumbnail.format, thumbnail.size, thumbnail.n_frames), (save_format, (60, 40), 6))
+                self.assertEqual(create_pyramid_data(temp_file.name, 10), [])
+
+    def test_animated_thumbnail_keeps_loop_count(self):
+        for loop, expected in ((None, None), (0, 0), (2, 2)):
+            with tempfile.NamedTemporaryFile(suffix='.gif') as temp_file:
+                temp_file.write(self.encode_animation('GIF', loop=loop))
+                temp_file.flush()
+                thumbnail = Image.open(BytesIO(create_thumbnail_data(temp_file.name, 40)))
+                self.assertEqual(thumbnail.info.get('loop'), expected)
+
+    def test_iter_resized_frames(self):
+        img = Image.open(BytesIO(self.encode_animation('GIF')))
+        frames = iter_resized_frames(img, (30, 20))
+        self.assertTrue(inspect.isgenerator(frames))
+        self.assertEqual([(frame.size, duration) for frame, duration in frames], [((30, 20), 100)] * 6)
+        self.assertEqual(animation_duration(img), 600)
+        self.assertEqual(animation_duration(img, max_duration=250), 300)
+
+    @override_settings(MAX_ANIMATION_FRAMES=5)
+    def test_animation_frame_limit(self):
+        with tempfile.NamedTemporaryFile(suffix='.gif') as temp_file:
+            temp_file.write(self.encode_animation('GIF'))
+            temp_file.flush()
+            with self.assertRaises(ImageTooLarge):
+                create_thumbnail_data(temp_file.name, 40)
+
+    def test_validate_animation_header(self):
+        image = SimpleUploadedFile('animation.gif', self.encode_animation('GIF'))
+        self.assertEqual(validate_image_header(image, max_frames=6, max_duration=1), (120, 80))
+        with self.assertRaises(ValidationError) as ve:
+            validate_image_header(image, max_frames=5)
+        self.assertEqual(ve.exception.message, 'Animation exceeds the allowed 5 frames')
+        image = SimpleUploadedFile('animation.webp', self.encode_animation('WEBP', duration=300))
+        with self.assertRaises(ValidationError) as ve:
+            validate_image_header(image, max_frames=6, max_duration=1)
+        self.assertEqual(ve.exception.message, 'Animation exceeds the allowed 1 seconds')
+        self.assertEqual(validate_image_header(image, max_frames=6, max_duration=0), (120, 80))
+
+    def test_normalize_animation(self):
+        data = self.encode_animation('WEBP')
+        self.assertIsNone(normalize_image_data(data, max_dimension=200))
+        normalized = Image.open(BytesIO(normalize_image_data(data, max_dimension=60)))
+        self.assertEqual((normalized.format, normalized.size, normalized.n_frames), ('WEBP', (60, 40), 6))
+
+    def test_animated_upload(self):
+        tier = UserTier.objects.create(name='Basic', thumbnail_sizes=[40], max_animation_frames=10)
+        user = AppUser.objects.create(username='testuser', password='testpass', tier=tier)
+        self.client.force_login(user)
+        media_file = SimpleUploadedFile('animation.gif', self.encode_animation('GIF'))
+        response = self.client.post(reverse('images:list_create_image'), {'image_url': media_file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        uploaded_image = UploadedImage.objects.get(pk=response.data['id'])
+        self.assertEqual(uploaded_image.pyramid_levels, [])
+        self.assertTrue(uploaded_image.placeholder.startswith('data:image/webp;base64,'))
+        url = reverse('images:thumbnail_view', kwargs={'pk': uploaded_image.pk, 'height': 40, 'name': 'animation.gif'})
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'image/gif')
+        self.assertEqual(Image.open(BytesIO(response.content)).n_frames, 6)
+        tier.max_animation_frames = 5
+        tier.save()
+        media_file = SimpleUploadedFile('animation.gif', self.encode_animation('GIF'))
+        response = self.client.post(reverse('images:list_create_image'), {'image_url': media_file}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        shutil.rmtree(os.path.dirname(derivative_path(uploaded_image, 'thumbnail_40')), ignore_errors=True)
+        uploaded_image.delete()
+
+class CreatePyramidTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        large_image = Image.new('RGB', (800, 600), color='blue')
+        file_content = BytesIO()
+        large_image.save(file_content, 'JPEG')
+        file_content.seek(0)
+        self.large_media_file = default_storage.save(
+            'test_images/large_' + self.file_name,
+            SimpleUploadedFile(name='large_' + self.file_name, content=file_content.read())
+        )
+        self.large_image = UploadedImage.objects.create(user=self.user, image_url=self.large_media_file)
+
+    def test_positive_create_pyramid_data(self):
+        levels = create_pyramid_data(self.large_image.image_url.path, 64)
+        self.assertEqual([(width, height) for width, height, _ in levels], [(400, 300), (200, 150), (100, 75)])
+        self.assertEqual(Image.open(BytesIO(levels[-1][2])).format, 'JPEG')
+
+    @override_settings(TILED_PROCESSING_THRESHOLD=50_000)
+    def test_tiled_create_pyramid_data(self):
+        levels = create_pyramid_data(self.large_image.image_url.path, 64)
+        self.assertEqual([(width, height) for width, height, _ in levels], [(200, 150), (100, 75)])
+
+    def test_create_pyramid_data_keeps_alpha(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'gray_alpha.png')
+            Image.new('LA', (256, 256), (128, 60)).save(path)
+            levels = create_pyramid_data(path, 64)
+            level = Image.open(BytesIO(levels[0][2]))
+            self.assertEqual((level.mode, level.getpixel((0, 0))[1]), ('LA', 60))
+
+    def test_create_pyramid_data_with_nonexistent_file(self):
+        with self.assertRaises(Http404):
+            create_pyramid_data('nonexistent.jpg')
+
+    def test_select_pyramid_source(self):
+        self.large_image.pyramid_levels = create_pyramid(self.large_image)
+        self.assertEqual(len(self.large_image.pyramid_levels), 3)
+        source = select_pyramid_source(self.large_image, 140)
+        self.assertEqual(Image.open(source).height, 150)
+        source = select_pyramid_source(self.large_image, 500)
+        self.assertEqual(source, self.large_image.image_url.path)
+        thumb_image = Image.open(BytesIO(create_thumbnail_data(select_pyramid_source(self.large_image, 100), 100)))
+        self.assertEqual(thumb_image.height, 100)
+
+    def tearDown(self):
+        delete_pyramid(self.large_image)
+        default_storage.delete(self.large_media_file)
+        super().tearDown()
+
+class BinarizationTestCase(APITestCase):
+
+    def setUp(self):
+        self.image = Image.new('L', (64, 32), color=40)
+        self.image.paste(200, (32, 0, 64, 32))
+        self.temp_file = tempfile.NamedTemporaryFile(suffix='.png', delete=False)
+        self.image.save(self.temp_file.name, format='PNG')
+
+    def test_otsu_threshold(self):
+        threshold = otsu_threshold(self.image.histogram())
+        self.assertTrue(40 < threshold <= 200)
+
+    def test_positive_binarize(self):
+        for method in ('threshold', 'otsu', 'dither'):
+            binary_image = binarize(self.image, method)
+            self.assertEqual(binary_image.mode, '1')
+            self.assertEqual(binary_image.size, self.image.size)
+        binary_image = binarize(self.image, 'otsu')
+        self.assertEqual(binary_image.getpixel((0, 0)), 0)
+        self.assertEqual(binary_image.getpixel((63, 31)), 255)
+
+    def test_positive_create_1bit_binary_image_data(self):
+        binary_image_data = create_binary_image_data(self.temp_file.name, 'otsu')
+        binary_image = Image.open(BytesIO(binary_image_data))
+        self.assertEqual(binary_image.format, 'PNG')
+        self.assertEqual(binary_image.mode, '1')
+
+    def test_binarize_in_strips(self):
+        gradient = Image.linear_gradient('L').resize((61, 45))
+        for method in ('threshold', 'otsu', 'dither'):
+            whole_image = binarize(gradient, method)
+            strip_image = binarize(gradient, method, strip_height=7)
+            self.assertEqual(whole_image.tobytes(), strip_image.tobytes())
+
+    @override_settings(TILED_PROCESSING_THRESHOLD=600, TILE_STRIP_HEIGHT=5)
+    def test_tiled_create_binary_image_data(self):
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as temp_file:
+            Image.new('RGB', (64, 32), color='red').save(temp_file.name, format='JPEG')
+            binary_image = Image.open(BytesIO(create_binary_image_data(temp_file.name, 'otsu')))
+            self.assertEqual((binary_image.mode, binary_image.size), ('1', (32, 16)))
+            binary_image = Image.open(BytesIO(create_binary_image_data(temp_file.name)))
+            self.assertEqual((binary_image.format, binary_image.mode, binary_image.size), ('JPEG', 'L', (32, 16)))
+        with tempfile.NamedTemporaryFile(suffix='.png') as temp_file:
+            Image.new('RGB', (64, 32), color='red').save(temp_file.name, format='PNG')
+            binary_image = Image.open(BytesIO(create_binary_image_data(temp_file.name, 'otsu')))
+            self.assertEqual((binary_image.mode, binary_image.size), ('1', (64, 32)))
+
+    def test_unsupported_binarization_method(self):
+        with self.assertRaises(ValueError):
+            binarize(self.image, 'unknown')
+
+    def tearDown(self):
+        try:
+            os.unlink(self.temp_file.name)
+        except OSError:
+            pass
+
 class CreateThumbnailUrlsTestCase(BaseTestCase):
 
     def test_positive_create_thumbnail_urls(self):
@@ -215,6 +607,584 @@ class ThumbnailViewTestCase(BaseTestCase):
             target_status_code=200
         )
 
+class BatchThumbnailsAPIViewTestCase(BaseTestCase):
+
+    def parse_parts(self, response):
+        boundary = response['Content-Type'].split('boundary=')[1]
+        body = b''.join(response.streaming_content)
+        self.assertTrue(body.endswith(f'--{boundary}--\r\n'.encode()))
+        parts = []
+        for raw_part in body.split(f'--{boundary}'.encode())[1:-1]:
+            raw_headers, content = raw_part.strip(b'\r\n').split(b'\r\n\r\n', 1)
+            headers = dict(line.split(': ', 1) for line in raw_headers.decode().split('\r\n'))
+            self.assertEqual(int(headers['Content-Length']), len(content))
+            parts.append((headers, content))
+        return parts
+
+    def test_positive_batch_thumbnails(self):
+        self.client.force_login(self.user)
+        url = reverse('images:batch_thumbnails')
+        thumbnails = [
+            {'id': self.image.pk, 'height': 50},
+            {'id': self.image.pk, 'height': 100},
+            {'id': self.image.pk + 1000, 'height': 50},
+        ]
+        response = self.client.post(url, {'thumbnails': thumbnails}, format='json')
+        self.assertEqual(response.status_code, 200)
+        parts = self.parse_parts(response)
+        self.assertEqual(len(parts), 3)
+        statuses = {(int(headers['X-Image-Id']), int(headers['X-Thumbnail-Height'])): headers['X-Status'] for headers, _ in parts}
+        self.assertEqual(statuses[(self.image.pk + 1000, 50)], '404')
+        thumbnails_data = {int(headers['X-Thumbnail-Height']): content for headers, content in parts if headers['X-Status'] == '200'}
+        self.assertEqual(Image.open(BytesIO(thumbnails_data[50])).height, 50)
+        self.assertEqual(load_thumbnail_data(self.image, 100), thumbnails_data[100])
+
+    def test_negative_batch_thumbnails_height_based_on_account_tier(self):
+        self.client.force_login(self.user)
+        url = reverse('images:batch_thumbnails')
+        response = self.client.post(url, {'thumbnails': [{'id': self.image.pk, 'height': 400}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_no_auth_batch_thumbnails(self):
+        url = reverse('images:batch_thumbnails')
+        response = self.client.post(url, {'thumbnails': [{'id': self.image.pk, 'height': 50}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+@override_settings(ACCESS_SAMPLE_RATE=1.0, ACCESS_FLUSH_INTERVAL=3600)
+class PopularityTestCase(BaseTestCase):
+
+    def test_access_counter(self):
+        counter = AccessCounter()
+        counter.record(self.image.pk, 50)
+        counter.record(self.image.pk, 50)
+        counter.record(self.image.pk + 1000, 50)
+        self.assertFalse(DerivativeAccess.objects.exists())
+        counter.flush()
+        self.assertEqual(list(DerivativeAccess.objects.values_list('image_id', 'height', 'hits')), [(self.image.pk, 50, 2)])
+        with override_settings(ACCESS_SAMPLE_RATE=0.25), mock.patch('images.services.popularity.random.random', return_value=0.1):
+            counter.record(self.image.pk, 50)
+        counter.flush()
+        self.assertEqual(DerivativeAccess.objects.get().hits, 6)
+
+    @override_settings(ACCESS_FLUSH_INTERVAL=0.01)
+    def test_access_counter_flushes_without_traffic(self):
+        counter = AccessCounter()
+        with mock.patch('images.services.popularity.write_access_counts') as write_access_counts:
+            counter.record(self.image.pk, 50)
+            for _ in range(100):
+                if write_access_counts.called:
+                    break
+                time.sleep(0.01)
+        write_access_counts.assert_called_once_with({(self.image.pk, 50): 1})
+        self.assertEqual(counter.counts, {})
+
+    def test_thumbnail_view_counts_requests(self):
+        self.client.force_login(self.user)
+        url = reverse('images:thumbnail_view', kwargs={'pk': self.image.pk, 'height': 50, 'name': os.path.basename(self.image.image_url.path)})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertFalse(DerivativeAccess.objects.exists())
+        access_counter.flush()
+        self.assertEqual(DerivativeAccess.objects.get(image=self.image, height=50).hits, 1)
+
+    def test_warm_cache_command(self):
+        DerivativeAccess.objects.create(image=self.image, height=50, hits=10)
+        DerivativeAccess.objects.create(image=self.image, height=400, hits=20)
+        cache.delete(thumbnail_cache_key(self.image.pk, 50))
+        out = StringIO()
+        call_command('warm_cache', '--top', '5', stdout=out)
+        self.assertIn('1 thumbnails loaded, 0 already cached, 0 failed', out.getvalue())
+        self.assertEqual(Image.open(BytesIO(cache.get(thumbnail_cache_key(self.image.pk, 50)))).height, 50)
+        self.assertIsNone(cache.get(thumbnail_cache_key(self.image.pk, 400)))
+        out = StringIO()
+        call_command('warm_cache', '--top', '5', stdout=out)
+        self.assertIn('0 thumbnails loaded, 1 already cached', out.getvalue())
+
+    def test_warm_cache_closes_connections_of_pool_threads(self):
+        DerivativeAccess.objects.create(image=self.image, height=50, hits=10)
+        cache.delete(thumbnail_cache_key(self.image.pk, 50))
+        with mock.patch('images.services.derivatives.connection') as pool_connection:
+            self.assertEqual(warm_thumbnail_cache(5), (0, 1, 0))
+        pool_connection.close.assert_called_once_with()
+
+    def test_evict_derivatives(self):
+        DerivativeAccess.objects.create(image=self.image, height=100, hits=5)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for height in (50, 100, 200):
+                write_derivative(self.image, f'thumbnail_{height}', b'x' * 100)
+            self.assertEqual(evict_derivatives(300), (0, 0, 300))
+            self.assertEqual(evict_derivatives(150, dry_run=True), (2, 200, 100))
+            self.assertEqual(len(os.listdir(os.path.dirname(derivative_path(self.image, 'thumbnail_50')))), 3)
+            self.assertEqual(evict_derivatives(150), (2, 200, 100))
+            self.assertEqual(read_derivative(self.image, 'thumbnail_100'), b'x' * 100)
+            self.assertIsNone(read_derivative(self.image, 'thumbnail_50'))
+
+class DashboardTestCase(BaseTestCase):
+
+    def usage(self):
+        return StorageUsage.objects.values_list('images', 'original_bytes', 'derivatives', 'derivative_bytes').get(user=self.user)
+
+    def test_triggers_maintain_storage_usage(self):
+        self.assertEqual(self.usage(), (1, 0, 0, 0))
+        UploadedImage.objects.filter(pk=self.image.pk).update(original_bytes=1000, derivatives=2, derivative_bytes=300)
+        second = UploadedImage.objects.create(user=self.user, image_url=self.media_file, original_bytes=500)
+        self.assertEqual(self.usage(), (2, 1500, 2, 300))
+        other = AppUser.objects.create(username='otheruser', password='testpass', tier=self.user.tier)
+        UploadedImage.objects.filter(pk=second.pk).update(user=other)
+        self.assertEqual(self.usage(), (1, 1000, 2, 300))
+        second.delete()
+        self.assertEqual(StorageUsage.objects.get(user=other).images, 0)
+        StorageUsage.objects.all().delete()
+        self.assertEqual(rebuild_storage_usage(), 1)
+        self.assertEqual(self.usage(), (1, 1000, 2, 300))
+
+    def test_storage_usage_triggers_migration_is_reversible(self):
+        def trigger_count():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM pg_trigger WHERE tgname LIKE '%%_storage_usage_%%'")
+                return cursor.fetchone()[0]
+
+        self.assertEqual(trigger_count(), 2)
+        executor = MigrationExecutor(connection)
+        executor.migrate([('images', '0001_initial')])
+        self.assertEqual(trigger_count(), 0)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes('images'))
+        self.assertEqual(trigger_count(), 2)
+
+    def test_stats_counter(self):
+        counter = StatsCounter()
+        counter.record_cache('memory', True)
+        counter.record_cache('memory', False)
+        counter.record_cache('memory', True)
+        counter.record_render(self.image.pk, 20.0)
+        counter.record_render(self.image.pk, 40.0)
+        counter.record_render(self.image.pk + 1000, 10.0)
+        self.assertFalse(CacheStats.objects.exists())
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            write_derivative(self.image, 'thumbnail_50', b'x' * 100)
+            counter.flush()
+            self.assertEqual(measure_derivatives(self.image.pk), (1, 100))
+        self.assertEqual(list(CacheStats.objects.values_list('cache', 'hits', 'misses')), [('memory', 2, 1)])
+        render_stats = RenderStats.objects.get()
+        self.assertEqual((render_stats.image_id, render_stats.renders, render_stats.max_ms), (self.image.pk, 2, 40.0))
+        self.assertEqual(render_stats.average_ms, 30.0)
+        self.assertEqual(self.usage(), (1, 0, 1, 100))
+        counter.record_cache('memory', False)
+        counter.flush()
+        self.assertEqual(CacheStats.objects.values_list('hits', 'misses').get(), (2, 2))
+
+    @override_settings(STATS_FLUSH_MAX_KEYS=1)
+    def test_stats_counter_does_not_write_while_recording(self):
+        counter = StatsCounter()
+        with mock.patch('images.services.statistics.write_render_stats') as write_render_stats, \
+                mock.patch('images.services.statistics.refresh_derivative_usage'):
+            with CaptureQueriesContext(connection) as queries:
+                counter.record_render(self.image.pk, 20.0)
+            self.assertEqual(len(queries), 0)
+            for _ in range(100):
+                if write_render_stats.called:
+                    break
+                time.sleep(0.01)
+        write_render_stats.assert_called_once_with({self.image.pk: (1, 20.0, 20.0)})
+
+    def test_dashboard_admin_view(self):
+        superuser = AppUser.objects.create_superuser(username='admin', password='adminpass')
+        UploadedImage.objects.filter(pk=self.image.pk).update(original_bytes=2048)
+        RenderStats.objects.create(image=self.image, renders=1, total_ms=12.5, max_ms=12.5)
+        self.client.force_login(superuser)
+        response = self.client.get(reverse('admin:images_storageusage_changelist'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Storage by tier')
+        self.assertContains(response, '2.0\xa0KB')
+        self.assertContains(response, '12.5 ms')
+        self.assertEqual(self.client.get(reverse('admin:images_uploadedimage_changelist')).status_code, 200)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('admin:images_storageusage_changelist')).status_code, 302)
+
+class NearDuplicateTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.gradient = Image.linear_gradient('L').resize((120, 90)).convert('RGB')
+        self.gradient.paste((250, 30, 30), (20, 20, 60, 50))
+        self.images = [
+            self.save_image('original.jpg', self.gradient),
+            self.save_image('resized.jpg', self.gradient.resize((60, 45)), quality=60),
+            self.save_image('flipped.jpg', self.gradient.transpose(Image.FLIP_TOP_BOTTOM)),
+        ]
+
+    def save_image(self, name, img, **params):
+        image_io = BytesIO()
+        img.save(image_io, 'JPEG', **params)
+        media_file = default_storage.save('test_images/' + name, SimpleUploadedFile(name, image_io.getvalue()))
+        instance = UploadedImage(user=self.user, image_url=media_file)
+        hash_image(instance)
+        instance.save()
+        return instance
+
+    def test_dhash(self):
+        original, resized, flipped = (to_unsigned(instance.perceptual_hash) for instance in self.images)
+        self.assertLessEqual(hamming_distances(dhash(self.gradient), [original])[0], settings.DUPLICATE_HASH_DISTANCE)
+        self.assertLessEqual(hamming_distances(original, [resized])[0], settings.DUPLICATE_HASH_DISTANCE)
+        self.assertGreater(hamming_distances(original, [flipped])[0], settings.DUPLICATE_HASH_DISTANCE)
+        self.assertEqual(hash_chunks(original)[1] >> 16, 1)
+
+    def test_multi_index_hash(self):
+        index = MultiIndexHash(6)
+        index.add(1, 0)
+        index.add(2, 0b111111)
+        index.add(3, 0b1111111)
+        index.add(4, 1 << 63 | 1 << 47 | 1 << 31 | 1 << 15 | 1)
+        self.assertEqual(index.search(0), [(1, 0), (4, 5), (2, 6)])
+
+    def test_find_near_duplicates(self):
+        original, resized, flipped = self.images
+        self.assertEqual([pk for pk, _ in find_near_duplicates(original)], [resized.pk])
+        self.assertEqual(find_near_duplicates(flipped), [])
+        self.assertEqual(find_near_duplicates(original, max_distance=0), [])
+
+    def test_duplicates_api_view(self):
+        original, resized, _ = self.images
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('images:duplicates'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [{'ids': [original.pk, resized.pk], 'reclaimable_bytes': resized.image_url.size}])
+
+    @override_settings(REJECT_DUPLICATE_UPLOADS=True)
+    def test_reject_duplicate_upload(self):
+        self.client.force_login(self.user)
+        image_io = BytesIO()
+        self.gradient.save(image_io, 'PNG')
+        url = reverse('images:list_create_image')
+        response = self.client.post(url, {'image_url': SimpleUploadedFile('copy.png', image_io.getvalue())}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn(response.data['error'], [f'Image is a near-duplicate of image {image.pk}' for image in self.images[:2]])
+        self.assertEqual(UploadedImage.objects.filter(user=self.user).count(), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url + '?async=true', {'image_url': SimpleUploadedFile('copy.png', image_io.getvalue())}, format='multipart')
+        rejected_path = UploadedImage.objects.get(pk=response.data['id']).image_url.path
+        run_next_job()
+        self.assertFalse(os.path.exists(rejected_path))
+        self.assertFalse(os.path.exists(default_storage.path(f"pyramids/{response.data['id']}")))
+        response = self.client.get(response.data['status_url'])
+        self.assertEqual(response.data['status'], UploadedImage.FAILED)
+        self.assertIn(response.data['error'], [f'Image is a near-duplicate of image {image.pk}' for image in self.images[:2]])
+
+    def tearDown(self):
+        for instance in UploadedImage.objects.exclude(pk=self.image.pk):
+            default_storage.delete(instance.image_url.name)
+        super().tearDown()
+
+class ExportImagesAPIViewTestCase(BaseTestCase):
+
+    def test_positive_export(self):
+        self.user.tier.original_image = True
+        self.user.tier.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('images:export'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertIsNone(archive.testzip())
+            name = os.path.basename(self.image.image_url.path)
+            self.assertEqual(
+                sorted(archive.namelist()),
+                sorted([f'{self.image.pk}/{name}'] + [f'{self.image.pk}/thumbnails/{height}px_{name}' for height in [50, 100, 200]])
+            )
+            self.assertTrue(all(entry.compress_type == zipfile.ZIP_STORED for entry in archive.infolist()))
+            with open(self.image.image_url.path, 'rb') as original_file:
+                self.assertEqual(archive.read(f'{self.image.pk}/{name}'), original_file.read())
+            self.assertEqual(Image.open(BytesIO(archive.read(f'{self.image.pk}/thumbnails/50px_{name}'))).height, 50)
+
+    def test_export_without_original_image(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('images:export'))
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archive:
+            self.assertEqual(len(archive.namelist()), 3)
+            self.assertTrue(all('/thumbnails/' in name for name in archive.namelist()))
+
+    def test_no_auth_export(self):
+        response = self.client.get(reverse('images:export'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class ImageDeletionTestCase(BaseTestCase):
+
+    def test_delete_image_api_view(self):
+        self.client.force_login(self.user)
+        self.image.thumbnails_urls = create_thumbnail_urls(None, self.image, [50], base_url='http://testserver')
+        self.image.save()
+        load_thumbnail_data(self.image, 50)
+        derivatives_directory = os.path.dirname(derivative_path(self.image, 'thumbnail_50'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(reverse('images:image_details', args=[self.image.pk]))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(UploadedImage.objects.filter(pk=self.image.pk).exists())
+        self.assertIsNone(cache.get(thumbnail_cache_key(self.image.pk, 50)))
+        self.assertTrue(os.path.exists(default_storage.path(self.media_file)))
+        self.assertEqual(run_next_job().status, ImageJob.DONE)
+        self.assertFalse(os.path.exists(default_storage.path(self.media_file)))
+        self.assertFalse(os.path.exists(derivatives_directory))
+
+    def test_bulk_delete_api_view(self):
+        other_user = AppUser.objects.create(username='otheruser', password='testpass')
+        other_image = UploadedImage.objects.create(user=other_user, image_url=self.media_file)
+        second_image = UploadedImage.objects.create(user=self.user, image_url=self.media_file)
+        self.client.force_login(self.user)
+        url = reverse('images:bulk_delete')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'ids': [self.image.pk, second_image.pk, other_image.pk]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual(list(UploadedImage.objects.values_list('pk', flat=True)), [other_image.pk])
+        self.assertEqual(ImageJob.objects.filter(kind='delete_image_files').count(), 2)
+        run_next_job()
+        run_next_job()
+        self.assertTrue(os.path.exists(default_storage.path(self.media_file)))
+
+    def test_negative_bulk_delete_api_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('images:bulk_delete'), {'ids': ['first']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_gc_media_command(self):
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                for name in ['images/kept.jpg', 'images/orphan.jpg', 'images/recent.jpg', f'derivatives/{self.image.pk}/thumbnail_50.jpg', 'derivatives/999999/thumbnail_50.jpg']:
+                    default_storage.save(name, SimpleUploadedFile(name=name, content=b'data'))
+                for path in ['images/kept.jpg', 'images/orphan.jpg', f'derivatives/{self.image.pk}', 'derivatives/999999']:
+                    os.utime(default_storage.path(path), (0, 0))
+                UploadedImage.objects.filter(pk=self.image.pk).update(image_url='images/kept.jpg')
+                out = StringIO()
+                call_command('gc_media', stdout=out)
+                self.assertIn('2 orphans removed', out.getvalue())
+                self.assertEqual(sorted(os.listdir(default_storage.path('images'))), ['kept.jpg', 'recent.jpg'])
+                self.assertEqual(os.listdir(default_storage.path('derivatives')), [str(self.image.pk)])
+        finally:
+            shutil.rmtree(media_root)
+
+class RateLimitTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.tier.rate_limit_per_minute = 60
+        self.user.tier.rate_limit_burst = 2
+        self.user.tier.save()
+        cache.delete(rate_limit_key(self.user))
+
+    def test_rate_limited_thumbnail_view(self):
+        self.client.force_login(self.user)
+        url = reverse('images:thumbnail_view', kwargs={'pk': self.image.pk, 'height': 50, 'name': os.path.basename(self.image.image_url.path)})
+        responses = [self.client.get(url) for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        self.assertEqual([response['RateLimit-Remaining'] for response in responses], ['1', '0', '0'])
+        self.assertEqual(responses[0]['RateLimit-Limit'], '2')
+        self.assertEqual(responses[0]['RateLimit-Policy'], '2;w=2')
+        self.assertNotIn('Retry-After', responses[1])
+        self.assertEqual(responses[2]['Retry-After'], '1')
+
+    def test_rate_limited_api_view(self):
+        token = Token.objects.create(user=self.user)
+        url = reverse('images:list_create_image')
+        responses = [self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {token.key}') for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [200, 200, 429])
+        self.assertEqual(responses[1]['RateLimit-Remaining'], '0')
+        self.assertEqual(responses[2]['Retry-After'], '1')
+
+    def test_batch_costs_one_token_per_thumbnail(self):
+        self.user.tier.rate_limit_burst = 5
+        self.user.tier.save()
+        self.client.force_login(self.user)
+        url = reverse('images:batch_thumbnails')
+        thumbnails = [{'id': self.image.pk, 'height': 50}] * 3
+        response = self.client.post(url, {'thumbnails': thumbnails}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['RateLimit-Remaining'], '2')
+        response = self.client.post(url, {'thumbnails': thumbnails}, format='json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_export_cost_is_capped_at_burst(self):
+        # one original and two thumbnails cost 3 tokens, more than the burst of 2
+        self.user.tier.original_image = True
+        self.user.tier.save()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('images:export'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['RateLimit-Remaining'], '0')
+
+    def test_unlimited_tier(self):
+        self.user.tier.rate_limit_per_minute = 0
+        self.user.tier.save()
+        self.client.force_login(self.user)
+        responses = [self.client.get(reverse('images:list_create_image')) for _ in range(3)]
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200])
+        self.assertNotIn('RateLimit-Limit', responses[0])
+
+    def tearDown(self):
+        cache.delete(rate_limit_key(self.user))
+        super().tearDown()
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTestCase(APITestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.routed = []
+        tier = UserTier.objects.create(name='Basic', thumbnail_sizes=[200])
+        self.user = AppUser.objects.create(username='testuser', password='testpass', tier=tier)
+        self.token = Token.objects.create(user=self.user)
+
+    def request(self, method, path, **extra):
+        request = getattr(self.factory, method)(path, **extra)
+        request.user = AnonymousUser()
+        return request
+
+    def get_response(self, request):
+        self.routed.append(router.db_for_read(UploadedImage))
+        if request.method == 'POST':
+            router.db_for_write(UploadedImage)
+            self.routed.append(router.db_for_read(UploadedImage))
+            if request.META.get('HTTP_AUTHORIZATION'):
+                request.user = self.user
+        return HttpResponse(status=400 if request.GET.get('fail') else 200)
+
+    def test_safe_requests_read_from_replica(self):
+        ReplicaRoutingMiddleware(self.get_response)(self.request('get', '/api/images/'))
+        self.assertEqual(self.routed, ['replica_0'])
+        self.assertEqual(router.db_for_read(UploadedImage), 'default')
+
+    def test_reads_after_write_stay_on_primary(self):
+        middleware = ReplicaRoutingMiddleware(self.get_response)
+        response = middleware(self.request('post', '/api/images/'))
+        self.assertEqual(self.routed, ['default', 'default'])
+        self.assertEqual(response.cookies[settings.REPLICA_STICKY_COOKIE]['max-age'], settings.REPLICA_STICKY_SECONDS)
+        request = self.request('get', '/api/images/')
+        request.COOKIES[settings.REPLICA_STICKY_COOKIE] = '1'
+        middleware(request)
+        self.assertEqual(self.routed[-1], 'default')
+
+    def test_reads_after_write_of_user_stay_on_primary(self):
+        middleware = ReplicaRoutingMiddleware(self.get_response)
+        auth_header = f'Bearer {self.token.key}'
+        middleware(self.request('post', '/api/images/', HTTP_AUTHORIZATION=auth_header))
+        middleware(self.request('get', '/api/images/', HTTP_AUTHORIZATION=auth_header))
+        self.assertEqual(self.routed[-1], 'default')
+        request = self.request('get', '/api/images/')
+        request.user = self.user
+        middleware(request)
+        self.assertEqual(self.routed[-1], 'default')
+        middleware(self.request('get', '/api/images/'))
+        self.assertEqual(self.routed[-1], 'replica_0')
+        cache.delete(read_primary_key(self.user.pk))
+        middleware(self.request('get', '/api/images/', HTTP_AUTHORIZATION=auth_header))
+        self.assertEqual(self.routed[-1], 'replica_0')
+
+    def test_failed_write_does_not_pin_client(self):
+        auth_header = f'Bearer {self.token.key}'
+        response = ReplicaRoutingMiddleware(self.get_response)(
+            self.request('post', '/api/images/?fail=1', HTTP_AUTHORIZATION=auth_header)
+        )
+        self.assertNotIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+        self.assertIsNone(cache.get(read_primary_key(self.user.pk)))
+
+    def tearDown(self):
+        cache.delete(read_primary_key(self.user.pk))
+
+class InstrumentationTestCase(BaseTestCase):
+
+    def test_server_timing_header(self):
+        self.client.force_login(self.user)
+        url = reverse('images:thumbnail_view', kwargs={'pk': self.image.pk, 'height': 50, 'name': os.path.basename(self.image.image_url.path)},)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        stages = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        for stage in ('db', 'stat', 'cache', 'total'):
+            self.assertIn(stage, stages)
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_metrics_view(self):
+        self.client.force_login(self.user)
+        url = reverse('images:thumbnail_view', kwargs={'pk': self.image.pk, 'height': 50, 'name': os.path.basename(self.image.image_url.path)},)
+        self.client.get(url)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode('utf-8')
+        self.assertIn('imageocean_stage_duration_seconds_bucket{stage="db",le="+Inf"}', content)
+        self.assertIn('imageocean_cache_requests_total{cache="memory",result="miss"}', content)
+        self.assertIn('imageocean_bytes_served_total{view="thumbnail_view"}', content)
+        self.assertIn('imageocean_transforms_in_flight 0', content)
+
+    def test_metrics_view_forbidden(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['127.0.0.1']):
+            response = self.client.get(reverse('metrics'), HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(response.status_code, 403)
+
+class ProfilingMiddlewareTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.profiles_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(PROFILES_ROOT=self.profiles_root, PROFILING_MAX_PROFILES=2)
+        self.settings_override.enable()
+        self.url = reverse('images:image_details', args=[self.image.pk])
+
+    def test_staff_profile_header(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.path, self.url)
+        self.assertTrue(os.path.exists(os.path.join(self.profiles_root, profile.file_name)))
+        self.user.is_superuser = True
+        self.user.save()
+        response = self.client.get(reverse('admin:images_requestprofile_download', args=[profile.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_staff_profile_header_with_token(self):
+        self.user.is_staff = True
+        self.user.save()
+        token = Token.objects.create(user=self.user)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1', HTTP_AUTHORIZATION=f'Bearer {token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RequestProfile.objects.get(pk=response['X-Profile-Id']).user, self.user)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1', HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_profile_header_ignored_for_non_staff(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(RequestProfile.objects.count(), 0)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0, PROFILING_MIN_DURATION_MS=0)
+    def test_profiles_ring_is_bounded(self):
+        self.client.force_login(self.user)
+        for _ in range(4):
+            self.client.get(self.url)
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(len(os.listdir(self.profiles_root)), 2)
+
+    def test_failed_profile_save_keeps_response(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        with mock.patch('images.middleware.save_profile', side_effect=OSError('disk full')), \
+                self.assertLogs('images.middleware', 'ERROR'):
+            response = self.client.get(self.url, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.profiles_root, ignore_errors=True)
+        super().tearDown()
+
 class BinaryImageViewTestCase(BaseTestCase):
 
     def test_positive_binary_image_view(self):
@@ -233,6 +1203,23 @@ class BinaryImageViewTestCase(BaseTestCase):
         self.assertEqual(response['Content-Type'], 'image/jpeg')
         self.assertIsNotNone(response.content)
 
+    def test_1bit_binary_image_view(self):
+        self.client.force_login(self.user)
+        expiration_time = datetime.datetime.now() + datetime.timedelta(hours=24)
+        encoded_expiration_time = urlsafe_base64_encode(force_bytes(expiration_time.strftime('%Y-%m-%dT%H:%M:%S')))
+        kwargs = {
+            'pk': self.image.pk,
+            'encoded_expiration_time': encoded_expiration_time,
+            'name': os.path.basename(self.image.image_url.path)
+        }
+        url = reverse('images:binary_image_view', kwargs=kwargs)
+        response = self.client.get(url, {'method': 'dither'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(Image.open(BytesIO(response.content)).mode, '1')
+        response = self.client.get(url, {'method': 'unknown'})
+        self.assertEqual(response.status_code, 400)
+
     def test_no_auth_binary_image_view(self):
         self.user.tier.expiring_links = True
         expiration_time = datetime.datetime.now() + datetime.timedelta(hours=24)
@@ -251,6 +1238,258 @@ class BinaryImageViewTestCase(BaseTestCase):
             target_status_code=200
         )
 
+class BinaryRenditionsTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user.tier.expiring_links = True
+        self.user.tier.save()
+        self.missing_image = UploadedImage.objects.create(user=self.user, image_url='test_images/missing.jpg')
+
+    def test_render_binary_renditions(self):
+        progress = []
+        batch = render_binary_renditions(
+            self.user, 'otsu', chunk_size=1, workers=2, progress=lambda batch: progress.append((batch.processed, batch.rendered)),
+        )
+        self.assertEqual((batch.processed, batch.rendered, batch.failed_ids), (2, 1, [self.missing_image.pk]))
+        self.assertEqual(progress, [(1, 1), (2, 1)])
+        self.assertEqual(batch.last_image_id, self.missing_image.pk)
+        self.assertGreater(batch.images_per_second_per_core, 0)
+        self.assertEqual(Image.open(BytesIO(read_binary_rendition(self.image, 'otsu'))).mode, '1')
+        self.assertIsNone(read_binary_rendition(self.image, 'dither'))
+
+    @override_settings(IMAGE_WORKER_MEMORY_LIMIT=1024 * 1024 * 1024, TRANSFORM_MEMORY_BUDGET=512 * 1024 * 1024)
+    def test_rendition_workers_fit_in_worker_memory(self):
+        self.assertEqual(rendition_workers(8), 2)
+        self.assertEqual(rendition_workers(1), 1)
+        with override_settings(IMAGE_WORKER_MEMORY_LIMIT=0):
+            self.assertEqual(rendition_workers(8), 1)
+
+    def test_binary_renditions_job_continues_after_saved_chunk(self):
+        # a worker crashed after saving the chunk with the first image
+        BinaryRenditionBatch.objects.create(
+            user=self.user, method='otsu', processed=1, rendered=1, seconds=1.0, last_image_id=self.image.pk, finished_at=None,
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_binary_renditions(self.user, 'otsu')
+        with mock.patch('images.services.renditions.render_binary_rendition', return_value=False) as render:
+            self.assertEqual(run_next_job().status, ImageJob.DONE)
+        render.assert_called_once_with(self.missing_image, 'otsu')
+        batch = BinaryRenditionBatch.objects.get()
+        self.assertEqual((batch.processed, batch.rendered, batch.failed_ids), (2, 1, [self.missing_image.pk]))
+        self.assertIsNotNone(batch.finished_at)
+        self.assertGreater(batch.seconds, 1.0)
+
+    def test_binary_renditions_api_view(self):
+        self.client.force_login(self.user)
+        url = reverse('images:binary_renditions')
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'method': 'dither'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(self.client.get(url, {'method': 'dither'}).data['status'], ImageJob.PENDING)
+        self.assertEqual(run_next_job().status, ImageJob.DONE)
+        response = self.client.get(url, {'method': 'dither', 'expiration_seconds': 600})
+        manifest = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((manifest['processed'], manifest['rendered']), (2, 1))
+        self.assertEqual(manifest['failed_ids'], [self.missing_image.pk])
+        self.assertEqual([image['id'] for image in manifest['images']], [self.image.pk])
+        self.assertEqual(BinaryRenditionBatch.objects.get().method, 'dither')
+        with mock.patch('images.views.create_binary_image_data') as create_binary_image_data:
+            response = self.client.get(manifest['images'][0]['url'])
+        create_binary_image_data.assert_not_called()
+        self.assertEqual(Image.open(BytesIO(response.content)).mode, '1')
+        self.assertEqual(self.client.post(url, {'method': 'unknown'}, format='json').status_code, 400)
+        self.user.tier.expiring_links = False
+        self.user.tier.save()
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+class ImageJobQueueTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        JOB_HANDLERS['test_job'] = lambda value: self.calls.append(value)
+        JOB_HANDLERS['failing_job'] = lambda: 1 / 0
+
+    def test_enqueue_job_is_idempotent(self):
+        first_job = enqueue_job('test_job', {'value': 1}, key='test:1')
+        second_job = enqueue_job('test_job', {'value': 1}, key='test:1')
+        self.assertEqual(first_job.pk, second_job.pk)
+        self.assertEqual(ImageJob.objects.count(), 1)
+
+    def test_run_next_job_by_priority(self):
+        enqueue_job('test_job', {'value': 'low'}, priority=0)
+        enqueue_job('test_job', {'value': 'high'}, priority=10)
+        self.assertEqual(run_next_job().status, ImageJob.DONE)
+        self.assertEqual(run_next_job().status, ImageJob.DONE)
+        self.assertIsNone(run_next_job())
+        self.assertEqual(self.calls, ['high', 'low'])
+
+    @override_settings(IMAGE_JOB_RETRY_DELAY=0)
+    def test_run_next_job_retries(self):
+        enqueue_job('failing_job', {})
+        for _ in range(3):
+            job = run_next_job()
+        self.assertEqual(job.status, ImageJob.FAILED)
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('ZeroDivisionError', job.last_error)
+        self.assertIsNone(run_next_job())
+        enqueue_job('failing_job', {})
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.PENDING)
+
+    def test_job_of_crashed_worker_is_claimed_again(self):
+        job = enqueue_job('test_job', {'value': 1})
+        self.assertEqual(claim_next_job().pk, job.pk) # the worker dies while the job runs
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (ImageJob.RUNNING, 1))
+        self.assertIsNone(run_next_job())
+        ImageJob.objects.filter(pk=job.pk).update(leased_until=timezone.now() - datetime.timedelta(seconds=1))
+        job = run_next_job()
+        self.assertEqual((job.status, job.attempts), (ImageJob.DONE, 2))
+        self.assertEqual(self.calls, [1])
+        ImageJob.objects.filter(pk=job.pk).update(
+            status=ImageJob.RUNNING, attempts=3, leased_until=timezone.now() - datetime.timedelta(seconds=1)
+        )
+        self.assertEqual(run_next_job().status, ImageJob.FAILED)
+        self.assertEqual(self.calls, [1])
+        self.assertIsNone(ImageJob.objects.get().leased_until)
+
+    def test_render_thumbnail_job(self):
+        enqueue_job('render_thumbnail', {'pk': self.image.pk, 'height': 50})
+        self.assertEqual(run_next_job().status, ImageJob.DONE)
+        thumbnail_data = read_derivative(self.image, 'thumbnail_50')
+        self.assertEqual(Image.open(BytesIO(thumbnail_data)).height, 50)
+        self.assertEqual(load_thumbnail_data(self.image, 50), thumbnail_data)
+
+    def test_warm_up_api_view(self):
+        self.client.force_login(self.user)
+        url = reverse('images:warm_up', args=[self.image.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(ImageJob.objects.filter(kind='render_thumbnail').count(), 3)
+
+    def tearDown(self):
+        del JOB_HANDLERS['test_job']
+        del JOB_HANDLERS['failing_job']
+        super().tearDown()
+
+class TierBackfillTestCase(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.image.thumbnails_urls = [str({'50px': f'https://images.example.com/api/images/{self.image.pk}/thumbnail_view/50/test_image.jpg'})]
+        self.image.save()
+
+    def test_get_base_url(self):
+        self.assertEqual(get_base_url(self.image), 'https://images.example.com')
+
+    def test_thumbnail_sizes_change_enqueues_backfill(self):
+        tier = UserTier.objects.get(pk=self.user.tier.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            tier.expiring_links = True
+            tier.save()
+        self.assertFalse(ImageJob.objects.filter(kind='backfill_tier').exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            tier.thumbnail_sizes = [50, 300]
+            tier.save()
+        job = ImageJob.objects.get(kind='backfill_tier')
+        self.assertEqual(job.payload, {'tier_id': tier.pk, 'removed_sizes': [100, 200]})
+
+    def test_saving_deferred_tier_does_not_enqueue_backfill(self):
+        tier = UserTier.objects.only('name').get(pk=self.user.tier.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            tier.name = 'Renamed'
+            tier.save()
+        self.assertFalse(ImageJob.objects.filter(kind='backfill_tier').exists())
+
+    def test_backfill_tier(self):
+        tier = self.user.tier
+        tier.thumbnail_sizes = [50, 80]
+        processed, rendered = backfill_tier(tier, removed_sizes=[100, 200], chunk_size=1, workers=2)
+        self.assertEqual((processed, rendered), (1, 2))
+        self.image.refresh_from_db()
+        self.assertEqual(len(self.image.thumbnails_urls), 2)
+        self.assertIn('https://images.example.com/api/images/', self.image.thumbnails_urls[1])
+        self.assertEqual(Image.open(BytesIO(read_derivative(self.image, 'thumbnail_80'))).height, 80)
+        self.assertTrue(self.image.placeholder.startswith('data:image/webp;base64,'))
+        self.assertEqual(backfill_tier(tier), (1, 0))
+
+    def test_regenerate_derivatives_command(self):
+        out = StringIO()
+        call_command('regenerate_derivatives', '--tier', 'Basic', stdout=out)
+        self.assertIn('1/1 images, 3 thumbnails rendered', out.getvalue())
+        self.assertIsNotNone(read_derivative(self.image, 'thumbnail_200'))
+
+class StartupTestCase(BaseTestCase):
+
+    def test_startup_command(self):
+        out = StringIO()
+        call_command('startup', stdout=out)
+        self.assertIn('No migrations to apply', out.getvalue())
+        self.assertEqual(set(UserTier.objects.values_list('name', flat=True)), {'Basic', 'Premium', 'Enterprice'})
+        UserTier.objects.filter(name='Basic').update(thumbnail_sizes=[75])
+        call_command('startup', stdout=StringIO())
+        self.assertEqual(UserTier.objects.get(name='Basic').thumbnail_sizes, [75])
+
+    def test_no_missing_migrations(self):
+        call_command('makemigrations', '--check', '--dry-run', stdout=StringIO())
+
+    def test_preload_app_survives_failed_warm_up(self):
+        with mock.patch('images.services.preload.warm_thumbnail_cache', side_effect=ConnectionError('cache is down')), \
+                mock.patch('images.services.preload.connections.close_all') as close_all, \
+                mock.patch('images.services.preload.gc.freeze') as freeze, \
+                self.assertLogs('images.services.preload', 'ERROR') as logs:
+            self.assertEqual(preload_app(), (0, 0, 0))
+        close_all.assert_called_once()
+        freeze.assert_called_once()
+        self.assertIn('Thumbnail cache warm-up failed', logs.output[0])
+
+    def test_preload_app(self):
+        DerivativeAccess.objects.create(image=self.image, height=50, hits=10)
+        cache.delete(thumbnail_cache_key(self.image.pk, 50))
+        with mock.patch('images.services.preload.connections.close_all') as close_all, \
+                mock.patch('images.services.preload.gc.freeze') as freeze:
+            self.assertEqual(preload_app(), (0, 1, 0))
+        close_all.assert_called_once()
+        freeze.assert_called_once()
+        self.assertIsNotNone(cache.get(thumbnail_cache_key(self.image.pk, 50)))
+        self.assertNotIn('imageocean_stage_duration_seconds_count', metrics_registry.render())
+        self.assertEqual((stats_counter.cache_counts, stats_counter.renders), ({}, {}))
+        self.assertEqual(RenderStats.objects.get().image_id, self.image.pk)
+
+class BenchImagesCommandTestCase(APITestCase):
+
+    def test_bench_images_command(self):
+        UserTier.objects.create(name='Basic', thumbnail_sizes=[200])
+        with tempfile.NamedTemporaryFile(suffix='.json') as report_file:
+            call_command(
+                'bench_images', '--sizes', '320x240', '--formats', 'jpeg', '--heights', '100',
+                '--iterations', '2', '--output', report_file.name, stderr=StringIO(),
+            )
+            report = json.load(report_file)
+            # 4 images with 24 thumbnail view requests each, more than a rate limit burst
+            out = StringIO()
+            call_command(
+                'bench_images', '--sizes', '160x120,120x90', '--formats', 'jpeg,png', '--heights', '40,60',
+                '--iterations', '5', stdout=out, stderr=StringIO(),
+            )
+            self.assertEqual(len({result['size'] for result in json.loads(out.getvalue())['results']}), 2)
+            call_command(
+                'bench_images', '--sizes', '320x240', '--formats', 'jpeg', '--heights', '100',
+                '--iterations', '2', '--baseline', report_file.name, '--tolerance', '100',
+                stdout=StringIO(), stderr=StringIO(),
+            )
+        names = {result['name'] for result in report['results']}
+        self.assertEqual(names, {
+            'create_thumbnail_data', 'thumbnail_cache_miss', 'thumbnail_cache_hit',
+            'thumbnail_view_cold', 'thumbnail_view_warm', 'create_binary_image_data',
+        })
+        for result in report['results']:
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(UploadedImage.objects.count(), 0)
+
 class ImageListCreteAPIViewTestCase(APITestCase):
 
     def setUp(self):
@@ -287,6 +1526,8 @@ class ImageListCreteAPIViewTestCase(APITestCase):
         uploaded_image = UploadedImage.objects.get(user=self.user)
         self.assertEqual(response.data['id'], uploaded_image.id)
         self.assertEqual(len(response.data['thumbnails_urls']), 3)
+        self.assertTrue(response.data['placeholder'].startswith('data:image/webp;base64,'))
+        self.assertEqual(response.data['placeholder'], uploaded_image.placeholder)
         self.assertEqual(
             response.renderer_context['view'].get_serializer_class().__name__,
             without_image_serializer.__class__.__name__
@@ -310,6 +1551,101 @@ class ImageListCreteAPIViewTestCase(APITestCase):
             response.renderer_context['view'].get_serializer_class().__name__,
             with_image_serializer.__class__.__name__
         )
+        # the original is served by the view checking the owner and the tier, not from the media directory
+        original_url = response.data['image_url']
+        self.assertIn(f'/api/images/{uploaded_image.pk}/original/', original_url)
+        self.client.force_login(self.user)
+        response = self.client.get(original_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), uploaded_image.image_url.read())
+        self.user.tier.original_image = False
+        self.user.tier.save()
+        self.assertEqual(self.client.get(original_url).status_code, status.HTTP_403_FORBIDDEN)
+        other = AppUser.objects.create(username='otheruser', password='testpass', tier=self.user.tier)
+        other.tier.original_image = True
+        other.tier.save()
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(original_url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tier_pixel_limit_list_create_api_view(self):
+        self.user.tier.max_image_pixels = 5000
+        self.user.tier.save()
+        url = reverse('images:list_create_image')
+        response = self.client.post(url, {'image_url': self.media_file}, HTTP_AUTHORIZATION=self.auth_header['Authorization'], format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image_url', response.data)
+        self.assertEqual(UploadedImage.objects.filter(user=self.user).count(), 0)
+
+    def test_truncated_image_list_create_api_view(self):
+        image_io = BytesIO()
+        Image.effect_noise((200, 200), 64).convert('RGB').save(image_io, 'JPEG')
+        media_file = SimpleUploadedFile('truncated.jpg', image_io.getvalue()[:len(image_io.getvalue()) // 2])
+        url = reverse('images:list_create_image')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'image_url': media_file}, HTTP_AUTHORIZATION=self.auth_header['Authorization'], format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'Uploaded file is not a valid image'})
+        self.assertEqual(UploadedImage.objects.filter(user=self.user).count(), 0)
+        self.assertEqual(ImageJob.objects.get().kind, 'delete_image_files')
+        self.assertEqual(run_next_job().status, ImageJob.DONE)
+
+    def test_normalized_list_create_api_view(self):
+        self.user.tier.max_original_dimension = 50
+        self.user.tier.save()
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        image_io = BytesIO()
+        Image.new('RGB', (100, 80), color='red').save(image_io, 'JPEG', exif=exif.tobytes())
+        media_file = SimpleUploadedFile('phone.jpg', image_io.getvalue())
+        url = reverse('images:list_create_image')
+        response = self.client.post(url, {'image_url': media_file}, HTTP_AUTHORIZATION=self.auth_header['Authorization'], format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        uploaded_image = UploadedImage.objects.get(user=self.user)
+        with Image.open(uploaded_image.image_url.path) as img:
+            self.assertEqual(img.size, (40, 50))
+            self.assertNotIn('exif', img.info)
+        with open(uploaded_image.image_url.path, 'wb') as original_file:
+            original_file.write(image_io.getvalue())
+        with override_settings(NORMALIZE_ORIGINALS=False):
+            self.assertIsNone(normalize_original(uploaded_image))
+        self.assertEqual(normalize_original(uploaded_image)[0], len(image_io.getvalue()))
+
+    def test_async_list_create_api_view(self):
+        url = reverse('images:list_create_image') + '?async=true'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {'image_url': self.media_file}, HTTP_AUTHORIZATION=self.auth_header['Authorization'], format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], UploadedImage.PROCESSING)
+        self.assertEqual(response['Location'], response.data['status_url'])
+        uploaded_image = UploadedImage.objects.get(user=self.user)
+        self.assertEqual(uploaded_image.thumbnails_urls, [])
+        status_url = reverse('images:upload_status', args=[uploaded_image.pk])
+        response = self.client.get(status_url, HTTP_AUTHORIZATION=self.auth_header['Authorization'])
+        self.assertEqual(response.data['status'], UploadedImage.PROCESSING)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(run_next_job().status, ImageJob.DONE)
+        response = self.client.get(status_url, {'wait': 5}, HTTP_AUTHORIZATION=self.auth_header['Authorization'])
+        self.assertEqual(response.data['status'], UploadedImage.READY)
+        uploaded_image.refresh_from_db()
+        self.assertEqual(len(uploaded_image.thumbnails_urls), 3)
+        self.assertEqual(read_derivative(uploaded_image, 'thumbnail_50'), load_thumbnail_data(uploaded_image, 50))
+        shutil.rmtree(os.path.dirname(derivative_path(uploaded_image, 'thumbnail_50')), ignore_errors=True)
+
+    @override_settings(UPLOAD_STATUS_POLL_INTERVAL=0.05)
+    def test_async_upload_status_failed(self):
+        url = reverse('images:list_create_image') + '?async=true'
+        response = self.client.post(url, {'image_url': self.media_file}, HTTP_AUTHORIZATION=self.auth_header['Authorization'], format='multipart')
+        uploaded_image = UploadedImage.objects.get(pk=response.data['id'])
+        status_url = reverse('images:upload_status', args=[uploaded_image.pk])
+        response = self.client.get(status_url, {'wait': 1}, HTTP_AUTHORIZATION=self.auth_header['Authorization'])
+        self.assertEqual(response.data['status'], UploadedImage.PROCESSING)
+        os.remove(uploaded_image.image_url.path)
+        JOB_HANDLERS['process_upload'](pk=uploaded_image.pk, base_url='http://testserver/')
+        response = self.client.get(status_url, HTTP_AUTHORIZATION=self.auth_header['Authorization'])
+        self.assertEqual(response.data['status'], UploadedImage.FAILED)
+        self.assertNotEqual(response.data['error'], '')
+        response = self.client.get(status_url, {'wait': settings.UPLOAD_STATUS_MAX_WAIT + 1}, HTTP_AUTHORIZATION=self.auth_header['Authorization'])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_no_auth_list_create_api_view(self):
         url = reverse('images:list_create_image')
@@ -5,10 +5,18 @@ app_name = 'images'
 
 urlpatterns = [
     path('', views.ImageListCreteAPIView.as_view(), name='list_create_image'),
+    path('thumbnails/', views.BatchThumbnailsAPIView.as_view(), name='batch_thumbnails'),
+    path('export/', views.ExportImagesAPIView.as_view(), name='export'),
+    path('bulk_delete/', views.BulkDeleteImagesAPIView.as_view(), name='bulk_delete'),
+    path('duplicates/', views.DuplicateImagesAPIView.as_view(), name='duplicates'),
+    path('binary_renditions/', views.BinaryRenditionsAPIView.as_view(), name='binary_renditions'),
     path('<int:pk>/', views.ImageDetailAPIView.as_view(), name='image_details'),
     path('<int:pk>/binary/', views.FetchLinkToBinaryImageAPIView.as_view(), name='binary_link'),
+    path('<int:pk>/warm_up/', views.WarmUpThumbnailsAPIView.as_view(), name='warm_up'),
+    path('<int:pk>/status/', views.UploadStatusAPIView.as_view(), name='upload_status'),
     path('<int:pk>/thumbnail_view/<int:height>/<str:name>', views.thumbnail_view,\
         name='thumbnail_view'),
+    path('<int:pk>/original/<str:name>', views.original_image_view, name='original_image_view'),
     path('<int:pk>/binary_image_view/<str:name>/<str:encoded_expiration_time>', \
         views.binary_image_view, name='binary_image_view')
 ]
\ No newline at end of file
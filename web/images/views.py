@@ -1,32 +1,93 @@
 import os
-from io import BytesIO
+import json
+import uuid
 import datetime
 
-from PIL import Image
-from django.core.cache import cache
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
+from django.db import transaction
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from django.views.decorators.cache import cache_control
 from rest_framework import generics, permissions, authentication, status
 from rest_framework.response import Response
 
-from .models import UploadedImage
+from .models import UploadedImage, ImageJob, BinaryRenditionBatch
 from .serializers import WithImageSerializer, WithoutImageSerializer
 from .services.tools import (
-    create_thumbnail_data,
     create_binary_image_data,
     create_thumbnail_urls,
-    crete_expiring_link
+    crete_expiring_link,
+    create_pyramid,
+    create_placeholder,
+    encode_multipart_part
+)
+from .services.derivatives import load_thumbnail_data, iter_thumbnails_data, enqueue_thumbnails
+from .services.export import iter_export_zip
+from .services.uploads import enqueue_upload_processing, wait_for_upload_status
+from .services.normalization import normalize_original
+from .services.perceptual_hash import group_near_duplicates, hash_image, reject_duplicate_upload
+from .services.popularity import access_counter
+from .services.statistics import measure_image
+from .services.renditions import (
+    binary_renditions_job,
+    enqueue_binary_renditions,
+    iter_binary_manifest,
+    read_binary_rendition
+)
+from .services.rate_limit import rate_limited
+from .services.jobs import JOB_PRIORITY_UPLOAD, JOB_PRIORITY_WARM_UP
+from .services.metrics import registry, timed
+from .services.validators import (
+    match_content_type_and_save_format,
+    validate_height,
+    validate_expiration_seconds,
+    validate_binarization_method,
+    validate_thumbnail_batch,
+    validate_image_ids,
+    validate_status_wait
+)
+from .services.custom_exceptions import (
+    InvalidExpirationRange,
+    InvalidExpirationSeconds,
+    InvalidBinarizationMethod,
+    InvalidThumbnailBatch,
+    InvalidImageIds,
+    InvalidStatusWait,
+    ImageTooLarge,
+    DuplicateImage,
+    UndecodableImage
 )
-from .services.validators import match_content_type_and_save_format, validate_height, validate_expiration_seconds
-from .services.custom_exceptions import InvalidExpirationRange, InvalidExpirationSeconds
 from api.authentication import TokenAuthentication
 from api.permissions import CanAccessBinaryImage
 
+def metrics_view(request):
+    """
+    A view that returns the image pipeline metrics of this process in the Prometheus text format.
+    Access is limited to staff users and to direct requests from the addresses listed in METRICS_ALLOWED_IPS,
+    requests forwarded by a reverse proxy carry the address of the proxy and are not matched.
+
+    Args:
+        request (HttpRequest): The request object.
+
+    Returns:
+        HttpResponse: The response containing the metrics.
+    """
+
+    allowed_address = (
+        request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+        and 'HTTP_X_FORWARDED_FOR' not in request.META
+        and 'HTTP_X_REAL_IP' not in request.META
+    )
+    if not request.user.is_staff and not allowed_address:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4')
+
 @login_required
+@rate_limited
 @validate_height
 def thumbnail_view(request, pk, height, name):
     """
@@ -42,24 +103,58 @@ def thumbnail_view(request, pk, height, name):
         HttpResponse: The response containing the thumbnail image.
     """
 
-    image = get_object_or_404(UploadedImage, pk=pk, user=request.user)
-    if not os.path.exists(image.image_url.path):
+    with timed('db'):
+        image = get_object_or_404(UploadedImage, pk=pk, user=request.user)
+    with timed('stat'):
+        if not os.path.exists(image.image_url.path):
+            raise Http404
+    try:
+        content_type, _ = match_content_type_and_save_format(image.image_url.name.split('.')[-1].upper())
+    except ValueError as err:
+        return HttpResponse(err, status=400)
+    try:
+        thumbnail_data = load_thumbnail_data(image, height)
+    except ImageTooLarge as err:
+        return HttpResponse(err, status=413)
+    access_counter.record(image.pk, height)
+    registry.count_bytes_served('thumbnail_view', len(thumbnail_data))
+    return HttpResponse(thumbnail_data, content_type=content_type)
+
+@login_required
+@rate_limited
+def original_image_view(request, pk, name):
+    """
+    A view that returns the original of an image, for account tiers allowing originals.
+    The media directory is not served by the app server, originals are only reachable through this view.
+    The file is sent with the file wrapper of the app server, uWSGI sends it by an offload thread.
+
+    Args:
+        request (HttpRequest): The request object.
+        pk (int): The primary key of the UploadedImage instance.
+        name (str): The name of the original image file.
+
+    Returns:
+        FileResponse: The response streaming the original image.
+    """
+
+    if request.user.tier is None or not request.user.tier.original_image:
+        return HttpResponseForbidden('Your account tier does not allow original images.')
+    with timed('db'):
+        image = get_object_or_404(UploadedImage, pk=pk, user=request.user)
+    try:
+        original_file = open(image.image_url.path, 'rb')
+    except FileNotFoundError:
         raise Http404
-    cache_key = f"thumbnail_{pk}_{height}"
-    thumbnail_data = cache.get(cache_key)
-    if thumbnail_data is None:
-        thumbnail_data = create_thumbnail_data(image.image_url.path, height)
-        cache.set(cache_key, thumbnail_data)
-    thumbnail = Image.open(BytesIO(thumbnail_data))
     try:
-        content_type, save_format = match_content_type_and_save_format(image.image_url.name.split('.')[-1].upper())
+        content_type, _ = match_content_type_and_save_format(image.image_url.name.split('.')[-1].upper())
     except ValueError as err:
+        original_file.close()
         return HttpResponse(err, status=400)
-    response = HttpResponse(content_type=content_type)
-    thumbnail.save(response, save_format)
-    return response
+    registry.count_bytes_served('original_image_view', os.fstat(original_file.fileno()).st_size)
+    return FileResponse(original_file, content_type=content_type)
 
 @login_required
+@rate_limited
 @cache_control(max_age=30000)
 def binary_image_view(request, pk, encoded_expiration_time, name):
     """
@@ -70,6 +165,7 @@ def binary_image_view(request, pk, encoded_expiration_time, name):
         pk (int): The primary key of the UploadedImage instance.
         expiration_time_str (str): The expiration time of the signed URL in string format.
         name (str): The name of the original image file.
+        method (str, query parameter): The binarization method, defaults to BINARY_IMAGE_METHOD.
 
     Returns:
         HttpResponse: The response containing the binary image.
@@ -82,20 +178,34 @@ def binary_image_view(request, pk, encoded_expiration_time, name):
         return HttpResponse(f'Invalid date!', status=400)
     if datetime.datetime.now() > expiration_time:
         return HttpResponseForbidden("The signed URL has expired.")
-    image = get_object_or_404(UploadedImage, pk=pk, user=request.user)
-    if not os.path.exists(image.image_url.path):
-        raise Http404
-    binary_image_data = create_binary_image_data(image.image_url.path)
-    binary_image = Image.open(BytesIO(binary_image_data))
-    content_type, save_format = match_content_type_and_save_format(image.image_url.name.split('.')[-1].upper())
-    response = HttpResponse(content_type=content_type)
-    binary_image.save(response, save_format)
-    return response
+    try:
+        method = validate_binarization_method(request.GET.get('method', settings.BINARY_IMAGE_METHOD))
+    except InvalidBinarizationMethod as err:
+        return HttpResponse(err, status=400)
+    with timed('db'):
+        image = get_object_or_404(UploadedImage, pk=pk, user=request.user)
+    with timed('stat'):
+        if not os.path.exists(image.image_url.path):
+            raise Http404
+    with timed('store'):
+        binary_image_data = read_binary_rendition(image, method)
+    if binary_image_data is None:
+        try:
+            binary_image_data = create_binary_image_data(image.image_url.path, method)
+        except ImageTooLarge as err:
+            return HttpResponse(err, status=413)
+    if method == 'grayscale':
+        content_type, _ = match_content_type_and_save_format(image.image_url.name.split('.')[-1].upper())
+    else:
+        content_type = 'image/png'
+    registry.count_bytes_served('binary_image_view', len(binary_image_data))
+    return HttpResponse(binary_image_data, content_type=content_type)
 
 class ImageListCreteAPIView(generics.ListCreateAPIView):
     """
     API View that allows authenticated users to upload images and list
-    images uploaded before
+    images uploaded before, uploads sent with the async=true parameter
+    are processed in the background
     """
 
     authentication_classes = [
@@ -114,17 +224,85 @@ class ImageListCreteAPIView(generics.ListCreateAPIView):
             return WithoutImageSerializer
         return WithImageSerializer
 
+    def create(self, request, *args, **kwargs):
+        if request.query_params.get('async') not in ('1', 'true'):
+            try:
+                return super().create(request, *args, **kwargs)
+            except DuplicateImage as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+            except UndecodableImage as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        instance = serializer.save(user=request.user, status=UploadedImage.PROCESSING)
+        enqueue_upload_processing(instance, request.build_absolute_uri('/'))
+        status_url = request.build_absolute_uri(reverse('images:upload_status', args=[instance.pk]))
+        return Response(
+            {'id': instance.pk, 'status': instance.status, 'status_url': status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url},
+        )
+
     def perform_create(self, serializer):
         instance = serializer.save(user=self.request.user)
+        # the header was validated, a truncated or corrupt image only fails once it is decoded here:
+        # rejected uploads are deleted with their files
+        try:
+            normalize_original(instance)
+            # the hash is computed from the smallest pyramid level instead of decoding the whole original
+            try:
+                instance.pyramid_levels = create_pyramid(instance)
+            except ImageTooLarge:
+                instance.pyramid_levels = []
+            hash_image(instance)
+            reject_duplicate_upload(instance)
+            instance.placeholder = create_placeholder(instance)
+        except DuplicateImage:
+            instance.delete()
+            raise
+        except OSError as err:
+            instance.delete()
+            raise UndecodableImage('Uploaded file is not a valid image') from err
         thumbnail_sizes = self.request.user.tier.thumbnail_sizes
         thumbnails_urls = create_thumbnail_urls(self.request, instance, thumbnail_sizes)
         instance.thumbnails_urls = thumbnails_urls
+        measure_image(instance)
         instance.save()
+        enqueue_thumbnails(instance, thumbnail_sizes, JOB_PRIORITY_UPLOAD)
+
+class DuplicateImagesAPIView(generics.GenericAPIView):
+    """
+    API View that allows authenticated users to list groups of
+    their images that are near-duplicates of each other
+    """
+
+    authentication_classes = [
+        authentication.SessionAuthentication,
+        TokenAuthentication
+    ]
+    permission_classes = [
+        permissions.IsAuthenticated
+    ]
+
+    def get(self, request, *args, **kwargs):
+        """
+        List the near-duplicate groups of the images of the user.
+
+        Parameters:
+            request (HttpRequest): The request object.
+
+        Returns:
+            Response: A list of groups with the ids of their images, the largest file first, and the
+            bytes deleting all but the first image of a group would free.
+        """
 
-class ImageDetailAPIView(generics.RetrieveAPIView):
+        return Response(group_near_duplicates(request.user))
+
+class ImageDetailAPIView(generics.RetrieveDestroyAPIView):
     """
     API View that allows authenticated users to access details
-    of a single uploaded image
+    of a single uploaded image and to delete it, its files are
+    removed in the background
     """
 
     authentication_classes = [
@@ -143,6 +321,87 @@ class ImageDetailAPIView(generics.RetrieveAPIView):
             return WithoutImageSerializer
         return WithImageSerializer
 
+class UploadStatusAPIView(generics.GenericAPIView):
+    """
+    API View that allows authenticated users to poll the processing
+    status of an image uploaded in the asynchronous mode
+    """
+
+    authentication_classes = [
+        authentication.SessionAuthentication,
+        TokenAuthentication
+    ]
+    permission_classes = [
+        permissions.IsAuthenticated
+    ]
+
+    def get_queryset(self):
+        return UploadedImage.objects.filter(user=self.request.user)
+
+    def get(self, request, pk, *args, **kwargs):
+        """
+        Retrieve the processing status of an image.
+
+        Parameters:
+            request (HttpRequest): The request object.
+            pk (int): The primary key of the uploaded image.
+            wait (int): Optional number of seconds to wait for the processing to finish, up to UPLOAD_STATUS_MAX_WAIT.
+
+        Returns:
+            HttpResponse: The status of the image, "processing", "ready" or "failed" with the error.
+        """
+
+        try:
+            wait = validate_status_wait(request.GET.get('wait', 0))
+        except InvalidStatusWait as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        upload_status = wait_for_upload_status(self.get_queryset(), pk, wait)
+        if upload_status is None:
+            raise Http404
+        headers = {'Retry-After': '1'} if upload_status['status'] == UploadedImage.PROCESSING else {}
+        return Response(
+            {'id': upload_status['id'], 'status': upload_status['status'], 'error': upload_status['processing_error']},
+            status=status.HTTP_200_OK,
+            headers=headers,
+        )
+
+class BulkDeleteImagesAPIView(generics.GenericAPIView):
+    """
+    API View that allows authenticated users to delete many of their
+    images at once, their files are removed in the background
+    """
+
+    authentication_classes = [
+        authentication.SessionAuthentication,
+        TokenAuthentication
+    ]
+    permission_classes = [
+        permissions.IsAuthenticated
+    ]
+
+    def get_queryset(self):
+        return UploadedImage.objects.filter(user=self.request.user)
+
+    def post(self, request, *args, **kwargs):
+        """
+        Delete the images with the given ids, ids of images that do not exist or belong to other users are ignored.
+
+        Parameters:
+            request (HttpRequest): The request object.
+            ids (list): The ids of the images.
+
+        Returns:
+            HttpResponse: The number of deleted images.
+        """
+
+        try:
+            ids = validate_image_ids(request.data.get('ids') if hasattr(request.data, 'get') else None)
+        except InvalidImageIds as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            _, deleted = self.get_queryset().filter(pk__in=ids).delete()
+        return Response({'deleted': deleted.get(UploadedImage._meta.label, 0)}, status=status.HTTP_200_OK)
+
 class FetchLinkToBinaryImageAPIView(generics.RetrieveAPIView):
     """
     API View that allows users with CanAccessBinaryImage permission
@@ -170,6 +429,7 @@ class FetchLinkToBinaryImageAPIView(generics.RetrieveAPIView):
             request (HttpRequest): The request object.
             pk (int): The primary key of the uploaded image.
             expiration_seconds (int): The number of seconds until the signed URL expires.
+            method (str): Optional binarization method of the linked image.
 
         Returns:
             HttpResponse: The signed URL to access the binary image.
@@ -180,9 +440,263 @@ class FetchLinkToBinaryImageAPIView(generics.RetrieveAPIView):
             raise Http404
         try:
             expiration_seconds = validate_expiration_seconds(request.GET.get('expiration_seconds', 3600))
-            binary_image_url = crete_expiring_link(self.request, pk, uploaded_image, expiration_seconds)
+            method = request.GET.get('method')
+            if method is not None:
+                method = validate_binarization_method(method)
+            binary_image_url = crete_expiring_link(self.request, pk, uploaded_image, expiration_seconds, method)
         except InvalidExpirationSeconds as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except InvalidExpirationRange as e:
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except InvalidBinarizationMethod as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'url': binary_image_url, 'expiration_seconds': expiration_seconds}, status=status.HTTP_200_OK)
+
+class BinaryRenditionsAPIView(generics.GenericAPIView):
+    """
+    API View that allows users with CanAccessBinaryImage permission
+    to render binary versions of all their images in a background job
+    and fetch a manifest of expiring links to them
+    """
+
+    authentication_classes = [
+        authentication.SessionAuthentication,
+        TokenAuthentication
+    ]
+    permission_classes = [
+        permissions.IsAuthenticated,
+        CanAccessBinaryImage
+    ]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Enqueue rendering of the binary versions of all images of the user, a single job per method runs at a time.
+
+        Parameters:
+            request (HttpRequest): The request object.
+            method (str): Optional binarization method, defaults to BINARY_IMAGE_METHOD.
+
+        Returns:
+            HttpResponse: The job status and the URL to poll for the manifest.
+        """
+
+        try:
+            method = validate_binarization_method(
+                request.data.get('method', settings.BINARY_IMAGE_METHOD) if hasattr(request.data, 'get')
+                else settings.BINARY_IMAGE_METHOD
+            )
+        except InvalidBinarizationMethod as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        enqueue_binary_renditions(request.user, method)
+        status_url = request.build_absolute_uri(f"{reverse('images:binary_renditions')}?method={method}")
+        return Response(
+            {'status': ImageJob.PENDING, 'method': method, 'status_url': status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={'Location': status_url},
+        )
+
+    def get(self, request, *args, **kwargs):
+        """
+        Retrieve the status of the binary rendition job and, once it is done, the manifest of links.
+
+        Parameters:
+            request (HttpRequest): The request object.
+            method (str): Optional binarization method, defaults to BINARY_IMAGE_METHOD.
+            expiration_seconds (int): The number of seconds until the links of the manifest expire.
+
+        Returns:
+            HttpResponse: The job status, once it is done a streamed manifest with the counts, the ids of
+            the images that could not be rendered, the throughput and an {"id": ..., "url": ...} object per image.
+        """
+
+        try:
+            method = validate_binarization_method(request.GET.get('method', settings.BINARY_IMAGE_METHOD))
+            expiration_seconds = validate_expiration_seconds(request.GET.get('expiration_seconds', 3600))
+        except (InvalidBinarizationMethod, InvalidExpirationSeconds, InvalidExpirationRange) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        job = binary_renditions_job(request.user, method)
+        batch = BinaryRenditionBatch.objects.filter(user=request.user, method=method).first()
+        if job is None:
+            raise Http404
+        if job.status != ImageJob.DONE or batch is None or batch.finished_at is None:
+            return Response(
+                {'status': job.status, 'method': method, 'attempts': job.attempts, 'processed': batch.processed if batch else 0},
+                status=status.HTTP_200_OK,
+                headers={'Retry-After': '5'} if job.status in (ImageJob.PENDING, ImageJob.RUNNING) else {},
+            )
+        return StreamingHttpResponse(
+            self.stream_manifest(batch, expiration_seconds),
+            content_type='application/json',
+        )
+
+    def stream_manifest(self, batch, expiration_seconds):
+        summary = json.dumps({
+            'status': ImageJob.DONE,
+            'method': batch.method,
+            'finished_at': batch.finished_at.isoformat(),
+            'processed': batch.processed,
+            'rendered': batch.rendered,
+            'failed_ids': batch.failed_ids,
+            'seconds': round(batch.seconds, 3),
+            'cores': batch.cores,
+            'images_per_second_per_core': round(batch.images_per_second_per_core, 2),
+            'expiration_seconds': expiration_seconds,
+        })
+        yield f'{summary[:-1]}, "images": ['
+        separator = ''
+        for pk, url in iter_binary_manifest(self.request, self.request.user, batch, expiration_seconds):
+            yield f'{separator}{json.dumps({"id": pk, "url": url})}'
+            separator = ', '
+        yield ']}'
+
+class WarmUpThumbnailsAPIView(generics.GenericAPIView):
+    """
+    API View that allows authenticated users to request pre-rendering
+    of all thumbnails their account tier allows for an image
+    """
+
+    authentication_classes = [
+        authentication.SessionAuthentication,
+        TokenAuthentication
+    ]
+    permission_classes = [
+        permissions.IsAuthenticated
+    ]
+
+    def get_queryset(self):
+        return UploadedImage.objects.filter(user=self.request.user)
+
+    def post(self, request, pk, *args, **kwargs):
+        """
+        Enqueue rendering of the thumbnails of an image.
+
+        Parameters:
+            request (HttpRequest): The request object.
+            pk (int): The primary key of the uploaded image.
+
+        Returns:
+            HttpResponse: The thumbnail sizes that were enqueued.
+        """
+
+        uploaded_image = get_object_or_404(UploadedImage, pk=pk, user=request.user)
+        thumbnail_sizes = request.user.tier.thumbnail_sizes
+        enqueue_thumbnails(uploaded_image, thumbnail_sizes, JOB_PRIORITY_WARM_UP)
+        return Response({'thumbnail_sizes': thumbnail_sizes}, status=status.HTTP_202_ACCEPTED)
+
+class BatchThumbnailsAPIView(generics.GenericAPIView):
+    """
+    API View that allows authenticated users to fetch thumbnails
+    of many images in a single multipart response
+    """
+
+    authentication_classes = [
+        authentication.SessionAuthentication,
+        TokenAuthentication
+    ]
+    permission_classes = [
+        permissions.IsAuthenticated
+    ]
+
+    def get_queryset(self):
+        return UploadedImage.objects.filter(user=self.request.user)
+
+    def throttle_cost(self, request):
+        # one token per requested thumbnail, invalid batches are rejected after the throttle
+        thumbnails = request.data.get('thumbnails') if hasattr(request.data, 'get') else None
+        return min(len(thumbnails), settings.THUMBNAIL_BATCH_MAX_ITEMS) if isinstance(thumbnails, list) else 1
+
+    def post(self, request, *args, **kwargs):
+        """
+        Stream the requested thumbnails, cached thumbnails are sent first and the rest as they are rendered.
+
+        Parameters:
+            request (HttpRequest): The request object.
+            thumbnails (list): {"id": ..., "height": ...} objects of the requested thumbnails.
+
+        Returns:
+            StreamingHttpResponse: A multipart/mixed response with one part per thumbnail. Every part carries
+            X-Image-Id, X-Thumbnail-Height and X-Status headers, failed parts contain the error message.
+        """
+
+        thumbnails = request.data.get('thumbnails') if hasattr(request.data, 'get') else None
+        try:
+            thumbnails = validate_thumbnail_batch(thumbnails, request.user.tier.thumbnail_sizes)
+        except InvalidThumbnailBatch as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        with timed('db'):
+            images = self.get_queryset().in_bulk({pk for pk, _ in thumbnails})
+        boundary = uuid.uuid4().hex
+        return StreamingHttpResponse(
+            self.stream_parts(thumbnails, images, boundary),
+            content_type=f'multipart/mixed; boundary={boundary}',
+        )
+
+    def stream_parts(self, thumbnails, images, boundary):
+        found = []
+        for pk, height in thumbnails:
+            if pk in images:
+                found.append((images[pk], height))
+            else:
+                yield self.error_part(boundary, pk, height, status.HTTP_404_NOT_FOUND, 'Not found.')
+        for image, height, thumbnail_data in iter_thumbnails_data(found):
+            if isinstance(thumbnail_data, ImageTooLarge):
+                yield self.error_part(boundary, image.pk, height, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, thumbnail_data)
+                continue
+            if isinstance(thumbnail_data, Http404):
+                yield self.error_part(boundary, image.pk, height, status.HTTP_404_NOT_FOUND, 'Not found.')
+                continue
+            content_type, _ = match_content_type_and_save_format(image.image_url.name.split('.')[-1].upper())
+            access_counter.record(image.pk, height)
+            registry.count_bytes_served('batch_thumbnails_view', len(thumbnail_data))
+            yield encode_multipart_part(
+                boundary,
+                {'Content-Type': content_type, 'X-Image-Id': image.pk, 'X-Thumbnail-Height': height, 'X-Status': status.HTTP_200_OK},
+                thumbnail_data,
+            )
+        yield f'--{boundary}--\r\n'.encode()
+
+    def error_part(self, boundary, pk, height, status_code, message):
+        return encode_multipart_part(
+            boundary,
+            {'Content-Type': 'text/plain', 'X-Image-Id': pk, 'X-Thumbnail-Height': height, 'X-Status': status_code},
+            str(message).encode(),
+        )
+
+class ExportImagesAPIView(generics.GenericAPIView):
+    """
+    API View that allows authenticated users to download all
+    their images with thumbnails as a single ZIP archive
+    """
+
+    authentication_classes = [
+        authentication.SessionAuthentication,
+        TokenAuthentication
+    ]
+    permission_classes = [
+        permissions.IsAuthenticated
+    ]
+
+    def throttle_cost(self, request):
+        # one token per file in the archive: the original and every thumbnail of an image
+        tier = request.user.tier
+        files_per_image = len(tier.thumbnail_sizes) + (1 if tier.original_image else 0)
+        return UploadedImage.objects.filter(user=request.user).count() * files_per_image
+
+    def get(self, request, *args, **kwargs):
+        """
+        Stream a ZIP archive of the images of the user, built while it is sent.
+
+        Parameters:
+            request (HttpRequest): The request object.
+
+        Returns:
+            StreamingHttpResponse: The ZIP archive with the originals, when the account tier allows them,
+            and the thumbnails of the tier sizes.
+        """
+
+        response = StreamingHttpResponse(
+            (chunk for chunk in iter_export_zip(request.user) if chunk),
+            content_type='application/zip',
+        )
+        response['Content-Disposition'] = f'attachment; filename="imageocean_{request.user.username}.zip"'
+        return response